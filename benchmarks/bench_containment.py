@@ -0,0 +1,95 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+#
+# Checks ContainmentIndex against a search of every record in every other
+# one, on random sets (some of them holding only records too short to be
+# checked) and on the records of the given FASTA files, and reports the
+# speed of both:
+#   python benchmarks/bench_containment.py [file.fasta ...]
+import sys
+import time
+import random
+sys.path.append('./libraries')
+from fasta_reader import read_fasta_raw
+from containment import ContainmentIndex, MIN_LENGTH
+
+# records of a file checked against the plain search
+PLAIN_CHECK_RECORDS = 3000
+
+###################### REFERENCE ##############################
+# (removed_id, kept_id, offset) as ContainmentIndex.contained finds them
+def plain_contained(ids, sequences):
+    pairs = []
+    for query_id, query in zip(ids, sequences):
+        if len(query) < MIN_LENGTH:
+            continue
+        best = None
+        for other_id, other in zip(ids, sequences):
+            if other_id == query_id or (len(other), -other_id) <= (len(query), -query_id):
+                continue
+            offset = other.find(query)
+            if offset >= 0 and (best is None or (-len(other), other_id) < (-best[1], best[0])):
+                best = (other_id, len(other), offset)
+        if best is not None:
+            pairs.append((query_id, best[0], best[2]))
+    return sorted(pairs)
+
+def index_contained(ids, sequences):
+    index = ContainmentIndex()
+    index.add(ids, sequences)
+    by_id = dict(zip(ids, sequences))
+    return index.contained(by_id.__getitem__)
+
+###################### CHECKS ##############################
+def random_set(rng):
+    alphabet = rng.choice([b"ACGT", b"ACDEFGHIKLMNPQRSTVWY"])
+    longest = rng.choice([MIN_LENGTH - 1, 60, 300])
+    sequences = []
+    for _ in range(rng.randint(0, 30)):
+        if sequences and rng.random() < 0.5:
+            source = rng.choice(sequences)
+            start = rng.randint(0, len(source))
+            sequences.append(source[start:start + rng.randint(0, longest)])
+        else:
+            sequences.append(bytes(rng.choice(alphabet) for _ in range(rng.randint(1, longest))))
+    return sequences
+
+def check_random(count=200, seed=1):
+    rng = random.Random(seed)
+    failures = 0
+    for _ in range(count):
+        sequences = random_set(rng)
+        ids = list(range(1, len(sequences) + 1))
+        if index_contained(ids, sequences) != plain_contained(ids, sequences):
+            failures += 1
+    print(f"random    {count} sets, {failures} failures")
+    return failures
+
+def bench(path):
+    print(path)
+    sequences = [sequence.upper() for _, sequence in read_fasta_raw(path)]
+    ids = list(range(1, len(sequences) + 1))
+
+    start = time.perf_counter()
+    found = index_contained(ids, sequences)
+    index_time = max(time.perf_counter() - start, 1e-9)
+
+    checked = ids[:PLAIN_CHECK_RECORDS]
+    start = time.perf_counter()
+    expected = plain_contained(checked, sequences[:PLAIN_CHECK_RECORDS])
+    plain_time = max(time.perf_counter() - start, 1e-9)
+    differences = int(index_contained(checked, sequences[:PLAIN_CHECK_RECORDS]) != expected)
+
+    print(f"  records   {len(sequences)}")
+    print(f"  index     {index_time:8.3f} s  {len(found)} contained")
+    print(f"  plain     {plain_time:8.3f} s  first {len(checked)} records, {len(expected)} contained")
+    if differences:
+        print(f"  WARNING: the first {len(checked)} records differ from the plain search")
+    return differences
+
+if __name__ == "__main__":
+    failures = check_random()
+    for path in sys.argv[1:]:
+        failures += bench(path)
+    sys.exit(1 if failures else 0)
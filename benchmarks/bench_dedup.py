@@ -0,0 +1,80 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+#
+# Removes duplicates from the given FASTA files with every engine of
+# DeleteDuplicatesWorker on growing subsets of the records, checks that
+# cleaned.db and duplicates.db come out the same as with the Python engine
+# and reports the times:
+#   python benchmarks/bench_dedup.py [--packed] file.fasta [file2.fasta ...]
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import time
+sys.path.append('./libraries')
+from ingest_cache import load_fasta_files_cached
+from thread_utils import DeleteDuplicatesWorker
+from seq_store import RECORD_COLUMNS
+
+SUBSET_SIZES = [1000, 5000, 20000, 100000, 500000]
+# (check_name, check_sequence)
+KEY_MODES = [(False, True), (True, True), (True, False)]
+ENGINES = ["python", "sql", "parallel", "spill"]
+# memory_mb of the spill engine, small enough to split even 1000 records
+# into several buckets
+SPILL_MEMORY_MB = 0.01
+
+###################### BENCHMARK ##############################
+def contents(path, query):
+    with sqlite3.connect(path) as conn:
+        return conn.execute(query).fetchall()
+
+def remove_duplicates(engine, check_name, check_sequence):
+    options = {"memory_mb": SPILL_MEMORY_MB} if engine == "spill" else {}
+    worker = DeleteDuplicatesWorker(check_name, check_sequence, engine=engine, **options)
+    result = []
+    worker.finished.connect(lambda _, total, kept: result.append((total, kept)))
+    start = time.perf_counter()
+    worker.run()
+    elapsed = time.perf_counter() - start
+    return (elapsed, result[0], contents("cleaned.db", f"SELECT id, {RECORD_COLUMNS} FROM sequences ORDER BY id"),
+            contents("duplicates.db", "SELECT removed_id, kept_id, reason FROM duplicates ORDER BY removed_id"))
+
+def bench(paths, packed):
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    try:
+        load_fasta_files_cached(paths, db_path="all.db", packed=packed)
+        with sqlite3.connect("all.db") as conn:
+            total = conn.execute("SELECT COUNT(*) FROM sequences").fetchone()[0]
+
+        for size in [s for s in SUBSET_SIZES if s < total] + [total]:
+            shutil.copy("all.db", "sequences.db")
+            with sqlite3.connect("sequences.db") as conn:
+                conn.execute("DELETE FROM sequences WHERE id > ?", (size,))
+
+            for check_name, check_sequence in KEY_MODES:
+                results = {engine: remove_duplicates(engine, check_name, check_sequence) for engine in ENGINES}
+                python_time, python_counts = results["python"][:2]
+                line = f"  {size:>8} records  names={check_name:d} sequences={check_sequence:d}  kept {python_counts[1]:>8}"
+                for engine, (elapsed, *result) in results.items():
+                    line += f"  {engine} {elapsed:6.2f} s"
+                    if engine != "python":
+                        line += f" ({python_time / max(elapsed, 1e-9):.1f}x)"
+                    if tuple(result) != results["python"][1:]:
+                        line += " WARNING: results differ"
+                print(line)
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    packed = "--packed" in args
+    paths = [os.path.abspath(a) for a in args if a != "--packed"]
+    if not paths:
+        print("usage: python benchmarks/bench_dedup.py [--packed] file.fasta [...]")
+        sys.exit(1)
+    bench(paths, packed)
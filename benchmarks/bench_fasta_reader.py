@@ -0,0 +1,77 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+#
+# Compares the memory-mapped reader with the readers it replaced (best of
+# three runs per reader):
+#   python benchmarks/bench_fasta_reader.py file.fasta [file2.fasta ...]
+import sys
+import time
+sys.path.append('./libraries')
+from fasta_reader import read_fasta
+
+###################### OLD READERS ##############################
+def iter_fasta_records(f):
+    current_header = None
+    current_sequence = []
+
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith(">"):
+            if current_header is not None and current_sequence:
+                yield current_header, ''.join(current_sequence)
+            current_header = line[1:]
+            current_sequence = []
+        else:
+            current_sequence.append(line)
+
+    if current_header is not None and current_sequence:
+        yield current_header, ''.join(current_sequence)
+
+def read_lines(path):
+    with open(path, "r") as f:
+        yield from iter_fasta_records(f)
+
+def read_split(path):
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().split(">")
+    for entry in content:
+        if not entry.strip():
+            continue
+        lines = entry.strip().split("\n")
+        yield lines[0], "".join(lines[1:]).strip()
+
+READERS = [
+    ("line by line (save_fasta_to_db)", read_lines),
+    ("read().split('>') (save_sequences_from_blast)", read_split),
+    ("memory-mapped (fasta_reader)", read_fasta),
+]
+
+###################### BENCHMARK ##############################
+def bench(path, repeat=3):
+    print(path)
+    reference = None
+    for name, reader in READERS:
+        elapsed = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            count = 0
+            residues = 0
+            for header, sequence in reader(path):
+                count += 1
+                residues += len(sequence)
+            elapsed = min(elapsed, time.perf_counter() - start)
+        print(f"  {name:48s} {elapsed:8.3f} s  {count / elapsed:12.0f} records/s  ({count} records, {residues} residues)")
+        if reference is None:
+            reference = (count, residues)
+        elif reference != (count, residues):
+            print("    WARNING: result differs from the line by line reader")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python benchmarks/bench_fasta_reader.py file.fasta [...]")
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        bench(path)
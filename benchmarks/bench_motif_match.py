@@ -0,0 +1,108 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+#
+# Checks motif_match against the sliding window it replaced (mismatches)
+# and against the edit distance matrix (indels), on random sequences and on
+# the records of the given FASTA files, and reports the speed of both:
+#   python benchmarks/bench_motif_match.py [file.fasta term threshold [...]]
+import sys
+import time
+import random
+sys.path.append('./libraries')
+from fasta_reader import read_fasta_raw
+from motif_match import MotifMatcher, HAMMING, EDIT, max_errors
+
+# records of a file checked against the edit distance matrix
+EDIT_CHECK_RECORDS = 2000
+
+###################### REFERENCES ##############################
+# the window loop the filters used before
+def window_match(sequence, term, similarity_threshold):
+    if len(sequence) < len(term):
+        return False
+    max_mismatches = max_errors(len(term), similarity_threshold)
+    for i in range(len(sequence) - len(term) + 1):
+        window = sequence[i:i + len(term)]
+        mismatches = sum(1 for a, b in zip(term, window) if a != b)
+        if mismatches <= max_mismatches:
+            return True
+    return False
+
+# last row of the edit distance matrix, the term may start anywhere
+def edit_match(sequence, term, similarity_threshold):
+    errors = max_errors(len(term), similarity_threshold)
+    row = list(range(len(term) + 1))
+    if row[-1] <= errors:
+        return True
+    for char in sequence:
+        previous, row = row, [0]
+        for i, t in enumerate(term, 1):
+            row.append(min(previous[i] + 1, row[i - 1] + 1, previous[i - 1] + (t != char)))
+        if row[-1] <= errors:
+            return True
+    return False
+
+###################### CHECKS ##############################
+def check_random(count=20000, seed=1):
+    rng = random.Random(seed)
+    failures = 0
+    for _ in range(count):
+        alphabet = rng.choice(["acgt", "acdefghiklmnpqrstvwy"])
+        sequence = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 80)))
+        start = rng.randint(0, max(len(sequence) - 1, 0))
+        term = sequence[start:start + rng.randint(1, 20)] or "a"
+        # a few substitutions and a deletion
+        term = "".join(c if rng.random() > 0.15 else rng.choice(alphabet) for c in term)
+        if len(term) > 2 and rng.random() < 0.3:
+            cut = rng.randrange(len(term))
+            term = term[:cut] + term[cut + 1:]
+        threshold = rng.choice([0, 50, 70, 75, 80, 90, 100])
+        if MotifMatcher(term, threshold, HAMMING).matches(sequence) != window_match(sequence, term, threshold):
+            failures += 1
+        if MotifMatcher(term, threshold, EDIT).matches(sequence) != edit_match(sequence, term, threshold):
+            failures += 1
+    print(f"random    {count} cases, {failures} failures")
+    return failures
+
+def bench(path, term, similarity_threshold):
+    print(f"{path}  {term}  {similarity_threshold}%")
+    sequences = [sequence.decode("ascii", "replace").lower() for _, sequence in read_fasta_raw(path)]
+    term = term.lower()
+
+    start = time.perf_counter()
+    expected = [window_match(sequence, term, similarity_threshold) for sequence in sequences]
+    window_time = max(time.perf_counter() - start, 1e-9)
+
+    matcher = MotifMatcher(term, similarity_threshold, HAMMING)
+    start = time.perf_counter()
+    found = [matcher.matches(sequence) for sequence in sequences]
+    hamming_time = max(time.perf_counter() - start, 1e-9)
+
+    matcher = MotifMatcher(term, similarity_threshold, EDIT)
+    start = time.perf_counter()
+    found_edit = [matcher.matches(sequence) for sequence in sequences]
+    edit_time = max(time.perf_counter() - start, 1e-9)
+
+    differences = sum(1 for a, b in zip(expected, found) if a != b)
+    edit_differences = sum(1 for sequence, match in zip(sequences[:EDIT_CHECK_RECORDS], found_edit)
+                           if match != edit_match(sequence, term, similarity_threshold))
+
+    print(f"  records   {len(sequences)}")
+    print(f"  window    {window_time:8.3f} s  {sum(expected)} matches")
+    print(f"  hamming   {hamming_time:8.3f} s  {sum(found)} matches  ({window_time / hamming_time:.1f}x)")
+    print(f"  edit      {edit_time:8.3f} s  {sum(found_edit)} matches")
+    if differences:
+        print(f"  WARNING: {differences} records differ from the window search")
+    if edit_differences:
+        print(f"  WARNING: {edit_differences} of the first {EDIT_CHECK_RECORDS} records differ from the edit distance")
+    return differences + edit_differences
+
+if __name__ == "__main__":
+    if len(sys.argv) % 3 != 1:
+        print("usage: python benchmarks/bench_motif_match.py [file.fasta term threshold [...]]")
+        sys.exit(1)
+    failures = check_random()
+    for i in range(1, len(sys.argv), 3):
+        failures += bench(sys.argv[i], sys.argv[i + 1], int(sys.argv[i + 2]))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,144 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+#
+# Cleans random sets (and the given FASTA files) with the header and motif
+# indexes, runs name, motif and length filters so their results are cached,
+# restores duplicate groups and checks that the same filters, and narrower
+# ones, now find the restored records: every result must equal a plain
+# search of cleaned.db. Reports how long restoring took:
+#   python benchmarks/bench_restore.py [file.fasta ...]
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+sys.path.append('./libraries')
+from ingest_cache import load_fasta_files_cached
+from thread_utils import DeleteDuplicatesWorker
+from filter_thread import FilterPoolWorker
+from duplicate_groups import connect_duplicates, group_member_ids, restore_records
+from seq_store import SequenceStore, SEQUENCE_COLUMNS
+
+WORDS = ["alpha", "beta", "gamma", "delta"]
+# duplicate groups restored at once
+RESTORED_GROUPS = 5
+
+###################### REFERENCE ##############################
+# ids of cleaned.db passing filter, read record by record
+def plain_filter(filter_args):
+    names = [term.lower() for term in filter_args.get("name_terms", [""])[0].split(",")]
+    motif = filter_args.get("seq_terms", [""])[0].lower()
+    low, high = filter_args.get("min_len", 0), filter_args.get("max_len", float("inf"))
+    ids = []
+    with sqlite3.connect("cleaned.db") as conn:
+        store = SequenceStore(conn)
+        for record_id, header, *location in conn.execute(f"SELECT id, header, {SEQUENCE_COLUMNS} FROM sequences ORDER BY id"):
+            sequence = store.sequence(*location)
+            if (all(name.strip() in header.lower() for name in names) and motif in sequence.lower()
+                    and low <= len(sequence) <= high):
+                ids.append(record_id)
+        store.close()
+    return ids
+
+def cached_filter(filter_args):
+    worker = FilterPoolWorker(filter_args, workers=1)
+    results = []
+    worker.finished.connect(results.extend)
+    worker.run()
+    return [row[-1] for row in results]
+
+###################### CHECKS ##############################
+def clean():
+    worker = DeleteDuplicatesWorker(False, True, motif_index=True)
+    worker.run()
+
+# (name, motif, length, narrower) filters; the motif is long enough for the
+# motif index to be used
+def filter_cases(rng, sequences):
+    name = rng.choice(WORDS)
+    motif = rng.choice([sequence for sequence in sequences if len(sequence) >= 10])
+    start = rng.randint(0, len(motif) - 10)
+    lengths = sorted(len(sequence) for sequence in sequences)
+    low, high = lengths[len(lengths) // 4], lengths[3 * len(lengths) // 4]
+    return [
+        {"name_terms": [name]},
+        {"seq_terms": [motif[start:start + 10]], "similarity_threshold": 100},
+        {"check_length": True, "min_len": low, "max_len": high},
+        {"name_terms": [f"{name}, 1"], "check_length": True, "min_len": low, "max_len": high},
+    ]
+
+# restores up to groups duplicate groups, returns (restored ids, seconds)
+def restore_groups(rng, groups):
+    conn = connect_duplicates()
+    kept_ids = [row[0] for row in conn.execute("SELECT DISTINCT kept_id FROM duplicates")]
+    removed_ids = group_member_ids(conn, rng.sample(kept_ids, min(groups, len(kept_ids))))
+    conn.close()
+    start = time.perf_counter()
+    restore_records(removed_ids)
+    return removed_ids, time.perf_counter() - start
+
+# filters before and after restoring; returns (failures, restored, seconds)
+def check_restore(rng, cases, groups):
+    failures = 0
+    for filter_args in cases:
+        failures += cached_filter(filter_args) != plain_filter(filter_args)
+    restored, elapsed = restore_groups(rng, groups)
+    for filter_args in cases:
+        expected = plain_filter(filter_args)
+        failures += cached_filter(filter_args) != expected
+    with sqlite3.connect("cleaned.db") as conn:
+        kept = {row[0] for row in conn.execute("SELECT id FROM sequences")}
+    failures += not set(restored) <= kept
+    return failures, len(restored), elapsed
+
+def random_fasta(rng, path):
+    sequences = []
+    with open(path, "w") as f:
+        for i in range(rng.randint(20, 200)):
+            if sequences and rng.random() < 0.4:
+                sequence = rng.choice(sequences)
+            else:
+                sequence = "".join(rng.choice("ACGT") for _ in range(rng.randint(10, 120)))
+            sequences.append(sequence)
+            f.write(f">r{i} {rng.choice(WORDS)}\n{sequence}\n")
+    return sequences
+
+def check_random(count=20, seed=1):
+    rng = random.Random(seed)
+    failures = 0
+    for _ in range(count):
+        sequences = random_fasta(rng, "random.fasta")
+        load_fasta_files_cached(["random.fasta"], workers=1)
+        clean()
+        failures += check_restore(rng, filter_cases(rng, sequences), RESTORED_GROUPS)[0]
+    print(f"random    {count} sets, {failures} failures")
+    return failures
+
+def bench(path):
+    print(path)
+    load_fasta_files_cached([path])
+    clean()
+    with sqlite3.connect("sequences.db") as conn:
+        sample = [row[0] for row in conn.execute("SELECT sequence FROM sequences WHERE sequence IS NOT NULL LIMIT 1000")]
+    rng = random.Random(1)
+    failures, restored, elapsed = check_restore(rng, filter_cases(rng, sample), RESTORED_GROUPS * 20)
+    print(f"  restore   {elapsed:8.3f} s  {restored} records")
+    if failures:
+        print(f"  WARNING: {failures} filters differ from the plain search")
+    return failures
+
+if __name__ == "__main__":
+    paths = [os.path.abspath(path) for path in sys.argv[1:]]
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    try:
+        failures = check_random()
+        for path in paths:
+            failures += bench(path)
+    finally:
+        os.chdir("/")
+        shutil.rmtree(workdir)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,48 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+#
+# Packs every record of the given FASTA files with seq_codec, checks that it
+# decodes back unchanged and reports the size and speed against plain text:
+#   python benchmarks/bench_seq_codec.py file.fasta [file2.fasta ...]
+import sys
+import time
+sys.path.append('./libraries')
+from fasta_reader import read_fasta_raw
+from seq_codec import encode_sequence, decode_sequence_bytes, KIND_RAW, KIND_NUCLEOTIDE, KIND_PROTEIN
+
+KIND_NAMES = {KIND_RAW: "raw", KIND_NUCLEOTIDE: "nucleotide", KIND_PROTEIN: "protein"}
+
+###################### BENCHMARK ##############################
+def bench(path):
+    print(path)
+    sequences = [sequence for _, sequence in read_fasta_raw(path)]
+
+    start = time.perf_counter()
+    packed = [encode_sequence(sequence) for sequence in sequences]
+    encode_time = max(time.perf_counter() - start, 1e-9)
+
+    start = time.perf_counter()
+    decoded = [decode_sequence_bytes(blob) for blob in packed]
+    decode_time = max(time.perf_counter() - start, 1e-9)
+
+    mismatches = sum(1 for a, b in zip(sequences, decoded) if a != b)
+    kinds = {}
+    for blob in packed:
+        kinds[KIND_NAMES[blob[0]]] = kinds.get(KIND_NAMES[blob[0]], 0) + 1
+    text_size = sum(len(sequence) for sequence in sequences)
+    packed_size = sum(len(blob) for blob in packed)
+
+    print(f"  records   {len(sequences)}  ({', '.join(f'{n} {name}' for name, n in sorted(kinds.items()))})")
+    print(f"  size      {text_size} -> {packed_size} bytes  ({packed_size / max(text_size, 1):.1%})")
+    print(f"  encode    {encode_time:8.3f} s  {text_size / encode_time / 1e6:8.1f} MB/s")
+    print(f"  decode    {decode_time:8.3f} s  {text_size / decode_time / 1e6:8.1f} MB/s")
+    if mismatches:
+        print(f"  WARNING: {mismatches} records did not decode to their original sequence")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python benchmarks/bench_seq_codec.py file.fasta [...]")
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        bench(path)
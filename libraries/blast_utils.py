@@ -3,6 +3,7 @@
 # Licensed under the GPL v3.0 License
 
 from blast_parser import parse_blast_output
+from fasta_reader import read_fasta, merge_fasta_files, FASTA_FILE_FILTER
 import subprocess
 from PyQt6.QtWidgets import QFileDialog, QMessageBox
 
@@ -33,7 +34,7 @@ def choose_database(widget, label_to_update):
         widget,
         "Choose FASTA Files",
         "",
-        "FASTA Files (*.fasta *.fa *.txt);;All Files (*)"
+        FASTA_FILE_FILTER
     )
 
     if not file_paths:
@@ -50,13 +51,7 @@ def choose_database(widget, label_to_update):
     merged_path = "merged_database.fasta"
 
     try:
-        with open(merged_path, "w", encoding="utf-8") as outfile:
-            for path in file_paths:
-                with open(path, "r", encoding="utf-8") as infile:
-                    content = infile.read()
-                    if not content.endswith("\n"):
-                        content += "\n"
-                    outfile.write(content)
+        merge_fasta_files(file_paths, merged_path, threads=os.cpu_count() or 1)
     except Exception as e:
         progress.close()
         QMessageBox.critical(widget, "Error", f"Failed to merge FASTA files: {e}")
@@ -100,7 +95,7 @@ def choose_database_n(widget, label_to_update):
         widget,
         "Choose FASTA Files",
         "",
-        "FASTA Files (*.fasta *.fa *.txt);;All Files (*)"
+        FASTA_FILE_FILTER
     )
 
     if not file_paths:
@@ -117,13 +112,7 @@ def choose_database_n(widget, label_to_update):
     merged_path = "merged_database.fasta"
 
     try:
-        with open(merged_path, "w", encoding="utf-8") as outfile:
-            for path in file_paths:
-                with open(path, "r", encoding="utf-8") as infile:
-                    content = infile.read()
-                    if not content.endswith("\n"):
-                        content += "\n"
-                    outfile.write(content)
+        merge_fasta_files(file_paths, merged_path, threads=os.cpu_count() or 1)
     except Exception as e:
         progress.close()
         QMessageBox.critical(widget, "Error", f"Failed to merge FASTA files: {e}")
@@ -563,19 +552,6 @@ def save_sequences_from_blast(widget):
         from PyQt6.QtWidgets import QFileDialog, QMessageBox
 
         
-        seq_dict = {}
-        with open("merged_database.fasta", "r", encoding="utf-8") as f:
-            content = f.read().split(">")
-            for entry in content:
-                if not entry.strip():
-                    continue
-                lines = entry.strip().split("\n")
-                header = lines[0]
-                sequence = "".join(lines[1:])
-                seq_id = header.split()[0].strip() 
-                seq_dict[seq_id] = sequence.strip()
-
- 
         selected_entries = []  
         with open("blast_out.txt", "r", encoding="utf-8") as f:
             for line in f:
@@ -584,6 +560,14 @@ def save_sequences_from_blast(widget):
                 identifier = line.split()[0].strip()
                 selected_entries.append((identifier, line.strip()))
 
+        # keep only the sequences of BLAST hits instead of the whole database
+        wanted_ids = {seq_id for seq_id, _ in selected_entries}
+        seq_dict = {}
+        for header, sequence in read_fasta("merged_database.fasta"):
+            fields = header.split()
+            if fields and fields[0] in wanted_ids:
+                seq_dict[fields[0]] = sequence
+
 
         output_path, _ = QFileDialog.getSaveFileName(widget, "Save FASTA File", "", "FASTA Files (*.fasta *.fa);;All Files (*)")
         if not output_path:
@@ -0,0 +1,132 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from near_duplicates import kmer_hashes
+
+# Records that are exact substrings of longer ones are found with a seeded
+# k-mer index. Every record is reduced to its minimizers: the smallest k-mer
+# hash of every window of WINDOW consecutive k-mers. A record contained in
+# another shares all its windows with it, so each of its minimizers is also
+# a minimizer of the container at the same offset. The rarest minimizer of
+# a record is its seed; only records holding that seed are compared, by
+# reading both sequences. Records shorter than MIN_LENGTH have no complete
+# window and are never checked
+KMER = 12
+WINDOW = 16
+MIN_LENGTH = KMER + WINDOW - 1
+# letters of short records hashed together
+BATCH_LETTERS = 1 << 20
+NO_HASH = np.iinfo(np.uint32).max
+
+###################### MINIMIZERS ##############################
+# (record, position, hash) of the minimizers of every window that lies
+# inside one of sequences; record is the index into sequences
+def minimizers(sequences):
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(sequence) for sequence in sequences])
+    joined = b"".join(sequences)
+    if len(joined) < MIN_LENGTH:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint32)
+
+    hashes = (kmer_hashes(joined, KMER) >> np.uint64(32)).astype(np.uint32)
+    # k-mers running from one sequence into the next
+    record = np.searchsorted(offsets, np.arange(len(hashes)), side="right") - 1
+    valid = np.arange(len(hashes)) + KMER <= offsets[record + 1]
+    hashes[~valid] = NO_HASH
+
+    invalid_before = np.concatenate(([0], np.cumsum(~valid)))
+    window_inside = invalid_before[WINDOW:] == invalid_before[:-WINDOW]
+    starts = np.flatnonzero(window_inside)
+    positions = np.unique(starts + sliding_window_view(hashes, WINDOW)[starts].argmin(axis=1))
+    record = record[positions]
+    return record, positions - offsets[record], hashes[positions]
+
+###################### CONTAINMENT ##############################
+class ContainmentIndex:
+    def __init__(self):
+        self.records = []
+        self.positions = []
+        self.hashes = []
+        self.ids = []
+        self.lengths = []
+
+    def add(self, ids, sequences):
+        batch = []
+        batch_records = []
+        letters = 0
+        for record_id, sequence in zip(ids, sequences):
+            batch_records.append(len(self.ids))
+            batch.append(sequence)
+            self.ids.append(record_id)
+            self.lengths.append(len(sequence))
+            letters += len(sequence)
+            if letters >= BATCH_LETTERS:
+                self.add_batch(batch_records, batch)
+                batch, batch_records, letters = [], [], 0
+        if batch:
+            self.add_batch(batch_records, batch)
+
+    def add_batch(self, batch_records, batch):
+        record, position, hashes = minimizers(batch)
+        self.records.append(np.asarray(batch_records, dtype=np.int64)[record])
+        self.positions.append(position)
+        self.hashes.append(hashes)
+
+    # (removed_id, kept_id, offset) for every record contained in a longer
+    # one, or in an identical record with a smaller id. The container is
+    # the longest record holding it (smallest id on ties), which is never
+    # itself contained. fetch(id) returns the sequence of a record
+    def contained(self, fetch, progress=None):
+        if not self.hashes:
+            return []
+        records = np.concatenate(self.records)
+        positions = np.concatenate(self.positions)
+        hashes = np.concatenate(self.hashes)
+        # every record shorter than MIN_LENGTH
+        if not len(hashes):
+            return []
+        ids = np.asarray(self.ids, dtype=np.int64)
+        lengths = np.asarray(self.lengths, dtype=np.int64)
+
+        order = np.argsort(hashes, kind="stable")
+        records, positions, hashes = records[order], positions[order], hashes[order]
+        group_starts = np.flatnonzero(np.concatenate(([True], hashes[1:] != hashes[:-1])))
+        group_sizes = np.diff(np.append(group_starts, len(hashes)))
+        group = np.repeat(np.arange(len(group_starts)), group_sizes)
+        counts = group_sizes[group]
+
+        # the rarest minimizer of every record, seeds found only in the
+        # record itself cannot be part of a longer one
+        by_record = np.lexsort((counts, records))
+        first = np.concatenate(([True], records[by_record][1:] != records[by_record][:-1]))
+        seeds = by_record[first]
+        seeds = seeds[counts[seeds] > 1]
+
+        pairs = []
+        for done, seed in enumerate(seeds.tolist()):
+            if progress and done % 1000 == 0:
+                progress(done / len(seeds))
+            query = records[seed]
+            start = group_starts[group[seed]]
+            members = np.arange(start, start + group_sizes[group[seed]])
+            others = records[members]
+            offsets = positions[members] - positions[seed]
+            fits = ((others != query) & (offsets >= 0) & (offsets + lengths[query] <= lengths[others])
+                    & ((lengths[others] > lengths[query]) | (ids[others] < ids[query])))
+            if not fits.any():
+                continue
+
+            others, offsets = others[fits], offsets[fits]
+            sequence = None
+            for i in np.lexsort((offsets, ids[others], -lengths[others])).tolist():
+                if sequence is None:
+                    sequence = fetch(int(ids[query]))
+                container = fetch(int(ids[others[i]]))
+                if container[offsets[i]:offsets[i] + len(sequence)] == sequence:
+                    pairs.append((int(ids[query]), int(ids[others[i]]), int(offsets[i])))
+                    break
+        pairs.sort()
+        return pairs
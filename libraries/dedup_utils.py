@@ -0,0 +1,442 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+import hashlib
+import math
+import os
+import sqlite3
+import numpy as np
+from seq_store import SequenceStore, SEQUENCE_COLUMNS, RECORD_COLUMNS, copy_sources, has_table
+from motif_index import drop_motif_index
+from ingest_cache import session_files, CACHE_VERSION
+
+# Duplicates are found by 128-bit blake2b digests of the compared fields, so
+# the memory of a cleaning run depends on the number of records and not on
+# their length. A collision between two different records is about as likely
+# as 2^-128 per pair; verify=True checks every hit against the stored record.
+# Every engine reports a duplicate with the id of the first record of its
+# key, which is the one kept
+KEY_SIZE = 16
+# the reason column of the duplicates table (see duplicate_groups)
+EXACT = "exact"
+CONTAINED = "contained"
+NEAR = "near"
+# rows of the duplicates table and of the key index written at once
+DUPLICATES_BUFFER_SIZE = 1000
+
+###################### KEYS ##############################
+def clean_header(header, check_name):
+    if check_name and "[Length" in header:
+        return header.split("[Length")[0].strip()
+    return header
+
+# exact bytes behind a digest; only names, only sequences or both
+def key_material(header, sequence, check_name, check_sequence):
+    if isinstance(sequence, str):
+        sequence = sequence.encode("utf-8")
+    if check_name and not check_sequence:
+        return header.encode("utf-8")
+    if check_sequence and not check_name:
+        return sequence
+    # headers never contain a NUL byte, so the split point is unambiguous
+    return header.encode("utf-8") + b"\0" + sequence
+
+def key_digest(material):
+    return hashlib.blake2b(material, digest_size=KEY_SIZE).digest()
+
+# key_material of a stored record (header and SEQUENCE_COLUMNS); sequences
+# kept on disk are only read when they are compared
+def record_material(store, header, location, check_name, check_sequence):
+    sequence = store.key(*location) if check_sequence or not check_name else None
+    return key_material(clean_header(header, check_name), sequence, check_name, check_sequence)
+
+def material_fetcher(conn, store, check_name, check_sequence):
+    def fetch_material(record_id):
+        row = conn.execute(f"SELECT header, {SEQUENCE_COLUMNS} FROM sequences WHERE id = ?",
+                           (record_id,)).fetchone()
+        return record_material(store, row[0], row[1:], check_name, check_sequence)
+    return fetch_material
+
+# the exact duplicates removed_ids[i] of kept_ids[i]
+def add_exact_duplicates(c, removed_ids, kept_ids, schema="dup"):
+    c.executemany(f"INSERT INTO {schema}.duplicates (removed_id, kept_id, reason) VALUES (?, ?, '{EXACT}')",
+                  zip(removed_ids, kept_ids))
+
+###################### SEEN KEYS ##############################
+# Seen records: every digest remembers the id of its first record. With
+# verification a hit reads that record back through fetch_material(id) and
+# compares it, and the rare records whose digest collided are kept in full
+# in collided
+class SeenKeys:
+    def __init__(self, verify=False, fetch_material=None):
+        self.verify = verify
+        self.fetch_material = fetch_material
+        self.digests = {}
+        self.collided = {}
+        self.collisions = 0
+
+    # None when the record was not seen before (and is now), otherwise the
+    # id of the first record with the same key
+    def add(self, material, record_id):
+        digest = key_digest(material)
+        first_id = self.digests.setdefault(digest, record_id)
+        if first_id == record_id or not self.verify:
+            return None if first_id == record_id else first_id
+
+        if self.fetch_material(first_id) == material:
+            return first_id
+        if material in self.collided:
+            return self.collided[material]
+        self.collided[material] = record_id
+        self.collisions += 1
+        return None
+
+    def __len__(self):
+        return len(self.digests) + len(self.collided)
+
+###################### SQL KEYS ##############################
+# clean_header as an SQL expression. str.strip also drops the rarer unicode
+# spaces, which do not come before "[Length" in BLAST headers
+CLEAN_HEADER_SQL = ("CASE WHEN instr(header, '[Length') > 0 "
+                    "THEN trim(substr(header, 1, instr(header, '[Length') - 1), ' ' || char(9, 10, 11, 12, 13)) "
+                    "ELSE header END")
+
+# the compared fields of key_material as columns of the sequences table;
+# stored sequences are compared as they are, like SequenceStore.key
+def sql_key_columns(check_name, check_sequence):
+    if check_name and not check_sequence:
+        return [CLEAN_HEADER_SQL]
+    if check_sequence and not check_name:
+        return ["sequence"]
+    if check_name:
+        return [CLEAN_HEADER_SQL, "sequence"]
+    return ["header", "sequence"]
+
+# sequences kept in their FASTA files (sequence IS NULL) can only be compared
+# in Python. All rows of one load share a storage mode
+def sql_keys_possible(conn, check_name, check_sequence):
+    if "sequence" not in sql_key_columns(check_name, check_sequence):
+        return True
+    row = conn.execute("SELECT sequence IS NULL FROM sequences LIMIT 1").fetchone()
+    return row is None or not row[0]
+
+# Average sequence length above which the UNIQUE index of the SQL engine
+# gets slower than hashing: index entries longer than about a thousand bytes
+# spill into overflow pages (4 KiB pages)
+SQL_MAX_AVERAGE_LENGTH = 1000
+
+def sql_keys_short(conn, check_name, check_sequence):
+    if "sequence" not in sql_key_columns(check_name, check_sequence):
+        return True
+    average = conn.execute("SELECT AVG(seq_length) FROM sequences").fetchone()[0]
+    return average is None or average <= SQL_MAX_AVERAGE_LENGTH
+
+###################### SPILLING ##############################
+# Out-of-core duplicate search: the digest and id of every record are
+# appended to one of several bucket files chosen by the digest, then every
+# bucket is sorted on its own. Records with the same key always land in the
+# same bucket, so the first record of every digest is the same one SeenKeys
+# keeps
+SPILL_DTYPE = np.dtype([("hi", "<u8"), ("lo", "<u8"), ("id", "<i8")])
+# memory of one key while its bucket is sorted, and in SeenKeys
+SPILL_BYTES_PER_KEY = 64
+SEEN_BYTES_PER_KEY = 140
+SPILL_BUFFER_SIZE = 64 * 1024
+MAX_BUCKETS = 512
+
+def seen_keys_fit(records, memory_mb):
+    return records * SEEN_BYTES_PER_KEY <= memory_mb * 1024 * 1024
+
+def bucket_count(records, memory_mb):
+    buckets = math.ceil(records * SPILL_BYTES_PER_KEY / (memory_mb * 1024 * 1024))
+    return min(MAX_BUCKETS, max(1, buckets))
+
+class KeySpill:
+    def __init__(self, directory, buckets):
+        self.paths = [os.path.join(directory, f"bucket_{i}.bin") for i in range(buckets)]
+        self.files = [open(path, "wb") for path in self.paths]
+        self.buffers = [bytearray() for _ in self.paths]
+
+    def add(self, digest, record_id):
+        bucket = int.from_bytes(digest[:8], "little") % len(self.buffers)
+        buffer = self.buffers[bucket]
+        buffer += digest
+        buffer += record_id.to_bytes(8, "little", signed=True)
+        if len(buffer) >= SPILL_BUFFER_SIZE:
+            self.files[bucket].write(buffer)
+            buffer.clear()
+
+    def close(self):
+        for f, buffer in zip(self.files, self.buffers):
+            f.write(buffer)
+            f.close()
+        self.buffers = []
+
+    # Yields (duplicate ids, kept ids) of one bucket after the other; the
+    # digest collisions found when fetch_material is given add up in
+    # collisions. keys(entries) is handed the entries of every bucket
+    def duplicates(self, fetch_material=None, progress=None, keys=None):
+        self.collisions = 0
+        for i, path in enumerate(self.paths):
+            entries = np.fromfile(path, dtype=SPILL_DTYPE)
+            os.remove(path)
+            if keys:
+                keys(entries)
+            duplicate_ids, kept_ids, collisions = find_duplicate_entries(entries, fetch_material)
+            self.collisions += collisions
+            yield duplicate_ids, kept_ids
+            if progress:
+                progress((i + 1) / len(self.paths))
+
+# Ids of the entries (SPILL_DTYPE) whose digest was seen at a smaller id,
+# with the id of that first entry. With fetch_material every digest shared
+# by several records is checked the way SeenKeys(verify=True) does; returns
+# (ids, kept ids, collisions)
+def find_duplicate_entries(entries, fetch_material=None):
+    order = np.lexsort((entries["id"], entries["lo"], entries["hi"]))
+    entries = entries[order]
+    repeated = np.zeros(len(entries), dtype=bool)
+    repeated[1:] = (entries["hi"][1:] == entries["hi"][:-1]) & (entries["lo"][1:] == entries["lo"][:-1])
+    if fetch_material is None:
+        first = np.maximum.accumulate(np.where(repeated, 0, np.arange(len(entries))))
+        return entries["id"][repeated], entries["id"][first[repeated]], 0
+
+    # groups of one digest, visited in id order
+    duplicate_ids = []
+    kept_ids = []
+    collisions = 0
+    starts = np.flatnonzero(~repeated)
+    ends = np.append(starts[1:], len(entries))
+    multiple = ends - starts > 1
+    for start, end in zip(starts[multiple].tolist(), ends[multiple].tolist()):
+        firsts = {}
+        for record_id in entries["id"][start:end].tolist():
+            material = fetch_material(record_id)
+            if material in firsts:
+                duplicate_ids.append(record_id)
+                kept_ids.append(firsts[material])
+            else:
+                firsts[material] = record_id
+        collisions += len(firsts) - 1
+    return np.array(duplicate_ids, dtype=np.int64), np.array(kept_ids, dtype=np.int64), collisions
+
+###################### PARALLEL ##############################
+# Process pool tasks of the parallel engine. Records are hashed in id
+# ranges and their entries sorted into partitions by digest; every partition
+# is then searched for duplicates on its own and its duplicates come back
+def partition_of(entries, partitions):
+    return entries["hi"] % np.uint64(partitions)
+
+def hash_id_range(db_path, first_id, last_id, check_name, check_sequence, partitions):
+    conn = sqlite3.connect(db_path)
+    store = SequenceStore(conn)
+    try:
+        rows = conn.execute(f"SELECT id, header, {SEQUENCE_COLUMNS} FROM sequences WHERE id BETWEEN ? AND ? ORDER BY id",
+                            (first_id, last_id))
+        data = bytearray()
+        for record_id, header, *location in rows:
+            data += key_digest(record_material(store, header, location, check_name, check_sequence))
+            data += record_id.to_bytes(8, "little", signed=True)
+    finally:
+        store.close()
+        conn.close()
+    entries = np.frombuffer(bytes(data), dtype=SPILL_DTYPE)
+    partition = partition_of(entries, partitions)
+    return [entries[partition == i].tobytes() for i in range(partitions)]
+
+# (duplicate ids, kept ids, collisions, keys), the ids as int64 bytes, keys
+# the first_entries of the partition as bytes when asked for
+def duplicates_of_partition(parts, db_path, check_name, check_sequence, verify, keys=False):
+    entries = np.frombuffer(b"".join(parts), dtype=SPILL_DTYPE)
+    if not verify:
+        duplicate_ids, kept_ids, collisions = find_duplicate_entries(entries)
+    else:
+        conn = sqlite3.connect(db_path)
+        store = SequenceStore(conn)
+        try:
+            duplicate_ids, kept_ids, collisions = find_duplicate_entries(
+                entries, material_fetcher(conn, store, check_name, check_sequence))
+        finally:
+            store.close()
+            conn.close()
+    return duplicate_ids.tobytes(), kept_ids.tobytes(), collisions, first_entries(entries).tobytes() if keys else b""
+
+###################### KEY INDEX ##############################
+# Digest -> id of the first record of every key, kept in duplicates.db next
+# to the session it was built for. Files appended to that session are then
+# only looked up in the index instead of cleaning everything again. version
+# is the ingest cache version, the layout of the records in cleaned.db.
+# The digests come from the engine that hashed the records while cleaning;
+# a state without dedup_keys (SQL engine) gets them on its first append
+KEY_INDEX_COLUMNS = "check_name, check_sequence, verify, last_id, version"
+
+def create_key_index(c, schema="main"):
+    c.execute(f"DROP TABLE IF EXISTS {schema}.dedup_keys")
+    c.execute(f"CREATE TABLE {schema}.dedup_keys (digest BLOB PRIMARY KEY, id INTEGER) WITHOUT ROWID")
+
+def create_key_state(c):
+    c.execute("DROP TABLE IF EXISTS dedup_state")
+    c.execute(f"CREATE TABLE dedup_state ({KEY_INDEX_COLUMNS})")
+    c.execute("DROP TABLE IF EXISTS dedup_session")
+    c.execute("CREATE TABLE dedup_session (position INTEGER PRIMARY KEY, file_id INTEGER, hash TEXT, indexed INTEGER, packed INTEGER)")
+
+# after cleaned.db changed in another way than by an append, the next
+# cleaning starts over
+def drop_key_index(c, schema="main"):
+    for table in ("dedup_keys", "dedup_state", "dedup_session"):
+        c.execute(f"DROP TABLE IF EXISTS {schema}.{table}")
+
+# the entry with the smallest id of every digest of SPILL_DTYPE entries, in
+# digest order
+def first_entries(entries):
+    entries = entries[np.lexsort((entries["id"], entries["lo"], entries["hi"]))]
+    first = np.ones(len(entries), dtype=bool)
+    first[1:] = (entries["hi"][1:] != entries["hi"][:-1]) | (entries["lo"][1:] != entries["lo"][:-1])
+    return entries[first]
+
+# rows of dedup_keys for SPILL_DTYPE entries
+def key_index_rows(entries):
+    data = first_entries(entries).tobytes()
+    size = SPILL_DTYPE.itemsize
+    return ((data[i:i + KEY_SIZE], int.from_bytes(data[i + KEY_SIZE:i + size], "little", signed=True))
+            for i in range(0, len(data), size))
+
+def save_key_state(c, check_name, check_sequence, verify, last_id, version, session, schema="main"):
+    c.execute(f"DELETE FROM {schema}.dedup_state")
+    c.execute(f"INSERT INTO {schema}.dedup_state ({KEY_INDEX_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+              (int(check_name), int(check_sequence), int(verify), last_id, version))
+    c.execute(f"DELETE FROM {schema}.dedup_session")
+    c.executemany(f"INSERT INTO {schema}.dedup_session (position, file_id, hash, indexed, packed) VALUES (?, ?, ?, ?, ?)",
+                  [(position, *row) for position, row in enumerate(session)])
+
+# (check_name, check_sequence, verify, last_id, version) and the session
+# files of the key index, None without one
+def load_key_state(conn, schema="main"):
+    if not conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'dedup_state'").fetchone():
+        return None
+    try:
+        state = conn.execute(f"SELECT {KEY_INDEX_COLUMNS} FROM {schema}.dedup_state").fetchone()
+    except sqlite3.OperationalError:
+        # written before a column was added
+        return None
+    if state is None:
+        return None
+    session = conn.execute(f"SELECT file_id, hash, indexed, packed FROM {schema}.dedup_session ORDER BY position").fetchall()
+    return state, session
+
+# first id of every digest of SPILL_DTYPE entries into the key index
+def add_key_rows(c, entries, schema="dup"):
+    c.executemany(f"INSERT INTO {schema}.dedup_keys (digest, id) VALUES (?, ?)", key_index_rows(entries))
+
+# State of the key index, saved in dup_path after a full cleaning of the
+# session of conn (sequences.db). The hashing engines wrote its digests
+# while cleaning, after the SQL engine they are computed by the first
+# append. Loads outside the ingest cache have no session to compare the
+# next one with, and digests shared by different records cannot be indexed
+def save_key_index(conn, check_name, check_sequence, verify, collisions, dup_path="duplicates.db"):
+    session = session_files(conn)
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM sequences").fetchone()[0]
+    dup_conn = sqlite3.connect(dup_path)
+    try:
+        dup_c = dup_conn.cursor()
+        if session is None or collisions:
+            if collisions:
+                print("Key digest collisions in the cleaned records, no key index saved")
+            drop_key_index(dup_c)
+        else:
+            create_key_state(dup_c)
+            save_key_state(dup_c, check_name, check_sequence, verify, last_id, CACHE_VERSION, session)
+        dup_conn.commit()
+    finally:
+        dup_conn.close()
+
+# Digests of the records in cleaned.db for a key state saved without them.
+# False when verification is on and two records share a digest
+def build_key_index(clean_conn, store, check_name, check_sequence, verify):
+    clean_c = clean_conn.cursor()
+    create_key_index(clean_c, "dup")
+    rows = clean_conn.execute(f"SELECT id, header, {SEQUENCE_COLUMNS} FROM main.sequences ORDER BY id")
+    while True:
+        batch = [(key_digest(record_material(store, header, location, check_name, check_sequence)), record_id)
+                 for record_id, header, *location in rows.fetchmany(DUPLICATES_BUFFER_SIZE)]
+        if not batch:
+            return True
+        changes = clean_conn.total_changes
+        clean_c.executemany("INSERT OR IGNORE INTO dup.dedup_keys (digest, id) VALUES (?, ?)", batch)
+        if verify and clean_conn.total_changes - changes < len(batch):
+            print("Key digest collisions in the cleaned records, cleaning the whole session")
+            return False
+
+###################### APPENDING ##############################
+# Merges the records of conn (sequences.db) appended since the key index
+# was saved into clean_conn (cleaned.db with sequences.db attached as src
+# and duplicates.db as dup): each one is looked up in the index, new keys
+# are added to it and the kept records copied. status(text) and
+# progress(fraction) report how far it got. Returns the records in
+# cleaned.db, or None when the session changed in another way or the index
+# was saved with other settings, and everything has to be cleaned again
+def append_records(conn, clean_conn, check_name, check_sequence, verify, status=None, progress=None):
+    session = session_files(conn)
+    saved = load_key_state(clean_conn, "dup")
+    if session is None or saved is None:
+        return None
+    (saved_name, saved_sequence, saved_verify, last_id, version), saved_session = saved
+    if ((bool(saved_name), bool(saved_sequence), bool(saved_verify), version)
+            != (bool(check_name), bool(check_sequence), bool(verify), CACHE_VERSION)
+            or [tuple(row) for row in session[:len(saved_session)]] != saved_session):
+        return None
+
+    clean_c = clean_conn.cursor()
+    store = SequenceStore(conn)
+    try:
+        if not has_table(clean_conn, "dedup_keys", "dup"):
+            if status:
+                status("Indexing cleaned keys...")
+            if not build_key_index(clean_conn, store, check_name, check_sequence, verify):
+                clean_conn.rollback()
+                return None
+
+        new = conn.execute("SELECT COUNT(*) FROM sequences WHERE id > ?", (last_id,)).fetchone()[0]
+        if status:
+            status(f"Checking {new} new sequences...")
+        fetch_material = material_fetcher(conn, store, check_name, check_sequence)
+        removed_ids, kept_ids = [], []
+        rows = conn.execute(f"SELECT id, header, {SEQUENCE_COLUMNS} FROM sequences WHERE id > ? ORDER BY id", (last_id,))
+        for i, (record_id, header, *location) in enumerate(rows):
+            material = record_material(store, header, location, check_name, check_sequence)
+            digest = key_digest(material)
+            row = clean_c.execute("SELECT id FROM dup.dedup_keys WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                clean_c.execute("INSERT INTO dup.dedup_keys (digest, id) VALUES (?, ?)", (digest, record_id))
+            elif verify and fetch_material(row[0]) != material:
+                print("Key digest collision, cleaning the whole session")
+                clean_conn.rollback()
+                return None
+            else:
+                removed_ids.append(record_id)
+                kept_ids.append(row[0])
+            if progress and i % max(1, new // 100) == 0:
+                progress((i + 1) / new * 0.8)
+
+        if status:
+            status("Writing cleaned records...")
+        add_exact_duplicates(clean_c, removed_ids, kept_ids)
+        clean_c.execute(f"""
+            INSERT INTO main.sequences (id, {RECORD_COLUMNS})
+            SELECT id, {RECORD_COLUMNS} FROM src.sequences
+            WHERE id > ? AND id NOT IN (SELECT removed_id FROM dup.duplicates WHERE removed_id > ?) ORDER BY id
+        """, (last_id, last_id))
+        copy_sources(conn, clean_c)
+        if new:
+            drop_motif_index(clean_c)
+        last_id = conn.execute("SELECT COALESCE(MAX(id), ?) FROM sequences", (last_id,)).fetchone()[0]
+        save_key_state(clean_c, check_name, check_sequence, verify, last_id, CACHE_VERSION, session, schema="dup")
+        clean_conn.commit()
+        if progress:
+            progress(1.0)
+        kept = clean_c.execute("SELECT COUNT(*) FROM main.sequences").fetchone()[0]
+    finally:
+        store.close()
+    print(f"Merged {new} new records, {len(removed_ids)} of them duplicates")
+    return kept
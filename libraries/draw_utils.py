@@ -48,18 +48,7 @@ def draw_length_histogram(chart_widget, lengths, bin_count=5):
         parent.length_bar_patches = list(bar_container.patches)
 
 ###################### SCORE HISTOGRAM ##############################
-def draw_bitscore_histogram(chart_widget, headers):
-    import re
-
-    scores = []
-    for header in headers:
-        match = re.search(r"Score: ([\d\.]+)", header)
-        if match:
-            try:
-                scores.append(float(match.group(1)))
-            except ValueError:
-                pass
-
+def draw_bitscore_histogram(chart_widget, scores):
     if not scores or len(scores) < 2:
         chart_widget.figure.clear()
         ax = chart_widget.figure.add_subplot(111)
@@ -111,18 +100,7 @@ def draw_bitscore_histogram(chart_widget, headers):
     chart_widget.canvas.draw()
     
 ###################### EVALUE HISTOGRAM ##############################   
-def draw_evalue_histogram(chart_widget, headers):
-    import re
-
-    evalues = []
-    for header in headers:
-        match = re.search(r"E-Value: ([\d\.]+)", header)
-        if match:
-            try:
-                evalues.append(float(match.group(1)))
-            except ValueError:
-                pass
-
+def draw_evalue_histogram(chart_widget, evalues):
     if not evalues or len(evalues) < 2:
         chart_widget.figure.clear()
         ax = chart_widget.figure.add_subplot(111)
@@ -133,11 +111,12 @@ def draw_evalue_histogram(chart_widget, headers):
         chart_widget.canvas.draw()
         return
         
+    # E-values are mostly far below 1, so the bins are not rounded to integers
     min_score = min(evalues)
     max_score = max(evalues)
     bin_count = 5
-    bin_size = max(1, round((max_score - min_score) / bin_count))
-    bins = list(range(int(min_score), int(max_score) + bin_size, bin_size))
+    bin_size = (max_score - min_score) / bin_count or 1
+    bins = [min_score + i * bin_size for i in range(bin_count)] + [max(max_score, min_score + bin_size)]
     counts = [0] * (len(bins) - 1)
 
     for evalue in evalues:
@@ -151,7 +130,7 @@ def draw_evalue_histogram(chart_widget, headers):
 
     chart_widget.figure.clear()
     ax = chart_widget.figure.add_subplot(111)
-    labels = [f"{round(bins[i])}-{round(bins[i+1]-1)}" for i in range(len(bins) - 1)]
+    labels = [f"{bins[i]:.2g}-{bins[i+1]:.2g}" for i in range(len(bins) - 1)]
     bars = ax.bar(labels, counts)
     ax.set_ylim(0, max(counts) * 1.15)
     for bar, count in zip(bars, counts):
@@ -227,18 +206,7 @@ def draw_alength_histogram(chart_widget, lengths, bin_count=5):
         
         
 ###################### IDENTITY HISTOGRAM ##############################        
-def draw_identities_histogram(chart_widget, headers):
-    import re
-
-    scores = []
-    for header in headers:
-        match = re.search(r"Identities: ([\d\.]+)", header)
-        if match:
-            try:
-                scores.append(float(match.group(1)))
-            except ValueError:
-                pass
-
+def draw_identities_histogram(chart_widget, scores):
     if not scores or len(scores) < 2:
         chart_widget.figure.clear()
         ax = chart_widget.figure.add_subplot(111)
@@ -291,18 +259,7 @@ def draw_identities_histogram(chart_widget, headers):
     
     
 ###################### SIMILARITY HISTOGRAM ##############################
-def draw_positives_histogram(chart_widget, headers):
-    import re
-
-    scores = []
-    for header in headers:
-        match = re.search(r"Positives: ([\d\.]+)", header)
-        if match:
-            try:
-                scores.append(float(match.group(1)))
-            except ValueError:
-                pass
-
+def draw_positives_histogram(chart_widget, scores):
     if not scores or len(scores) < 2:
         chart_widget.figure.clear()
         ax = chart_widget.figure.add_subplot(111)
@@ -0,0 +1,109 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+import sqlite3
+from seq_store import RECORD_COLUMNS
+from motif_index import drop_motif_index
+from dedup_utils import drop_key_index
+
+# Every record removed by the Cleaner is one row of the duplicates table of
+# duplicates.db: the record it was matched against (kept_id) and why. Both
+# ids are ids of sequences.db, which cleaned.db keeps for its records, so
+# removed records are never copied and a group is put back by its ids.
+# similarity is set for near duplicates, offset (where the record starts in
+# the kept one) for records contained in a longer one. The reasons are
+# EXACT, CONTAINED and NEAR of dedup_utils
+
+# groups or records read at once by the GUI
+PAGE_SIZE = 200
+
+###################### TABLE ##############################
+def create_duplicates_table(c, drop=False, table="duplicates"):
+    if drop:
+        c.execute(f"DROP TABLE IF EXISTS {table}")
+    c.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            removed_id INTEGER PRIMARY KEY,
+            kept_id INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            similarity REAL,
+            offset INTEGER
+        )
+    """)
+    # groups are read in kept_id order, the index also holds removed_id
+    c.execute(f"CREATE INDEX IF NOT EXISTS {table}_kept ON {table} (kept_id)")
+
+###################### PAGING ##############################
+# duplicates.db with sequences.db attached as src, where the headers are
+def connect_duplicates(db_path="sequences.db", dup_path="duplicates.db"):
+    conn = sqlite3.connect(dup_path)
+    conn.execute("ATTACH DATABASE ? AS src", (db_path,))
+    return conn
+
+# (groups, removed records)
+def duplicate_counts(conn):
+    return conn.execute("SELECT COUNT(DISTINCT kept_id), COUNT(*) FROM duplicates").fetchone()
+
+# (kept_id, header, seq_length, copies) of up to limit groups after kept_id
+# after; the GROUP BY walks the kept_id index and stops at the limit
+def duplicate_groups(conn, after=0, limit=PAGE_SIZE):
+    return conn.execute("""
+        SELECT g.kept_id, s.header, s.seq_length, g.copies FROM (
+            SELECT kept_id, COUNT(*) AS copies FROM duplicates
+            WHERE kept_id > ? GROUP BY kept_id ORDER BY kept_id LIMIT ?
+        ) g
+        LEFT JOIN src.sequences s ON s.id = g.kept_id
+        ORDER BY g.kept_id
+    """, (after, limit)).fetchall()
+
+REMOVED_QUERY = """
+    SELECT d.removed_id, s.header, s.seq_length, d.reason, d.similarity, d.offset, k.header
+    FROM duplicates d
+    LEFT JOIN src.sequences s ON s.id = d.removed_id
+    LEFT JOIN src.sequences k ON k.id = d.kept_id
+"""
+
+# (removed_id, header, seq_length, reason, similarity, offset, kept_header)
+# of up to limit removed records after id after
+def removed_records(conn, after=0, limit=PAGE_SIZE):
+    return conn.execute(REMOVED_QUERY + " WHERE d.removed_id > ? ORDER BY d.removed_id LIMIT ?",
+                        (after, limit)).fetchall()
+
+# the rows of removed_records removed for kept_id
+def group_members(conn, kept_id):
+    return conn.execute(REMOVED_QUERY + " WHERE d.kept_id = ? ORDER BY d.removed_id", (kept_id,)).fetchall()
+
+def group_member_ids(conn, kept_ids):
+    ids = []
+    for kept_id in kept_ids:
+        ids.extend(row[0] for row in conn.execute("SELECT removed_id FROM duplicates WHERE kept_id = ?", (kept_id,)))
+    return ids
+
+###################### RESTORING ##############################
+# Puts removed records back into cleaned.db under their own ids and drops
+# their rows from the duplicates table, in one transaction. The key index no
+# longer describes cleaned.db, so the next cleaning starts over. Returns
+# how many records were restored
+def restore_records(removed_ids, db_path="sequences.db", clean_path="cleaned.db", dup_path="duplicates.db"):
+    conn = sqlite3.connect(clean_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS src", (db_path,))
+        conn.execute("ATTACH DATABASE ? AS dup", (dup_path,))
+        c = conn.cursor()
+        c.execute("CREATE TEMP TABLE restore_ids (id INTEGER PRIMARY KEY)")
+        c.executemany("INSERT OR IGNORE INTO restore_ids (id) VALUES (?)", ((i,) for i in removed_ids))
+        c.execute(f"""
+            INSERT INTO main.sequences (id, {RECORD_COLUMNS})
+            SELECT id, {RECORD_COLUMNS} FROM src.sequences
+            WHERE id IN (SELECT removed_id FROM dup.duplicates WHERE removed_id IN (SELECT id FROM restore_ids))
+            ORDER BY id
+        """)
+        restored = c.rowcount
+        c.execute("DELETE FROM dup.duplicates WHERE removed_id IN (SELECT id FROM restore_ids)")
+        drop_motif_index(c)
+        drop_key_index(c, "dup")
+        conn.commit()
+    finally:
+        conn.close()
+    return restored
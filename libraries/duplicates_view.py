@@ -0,0 +1,144 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTreeWidget, QTreeWidgetItem,
+                             QAbstractItemView)
+from PyQt6.QtCore import Qt
+from duplicate_groups import (connect_duplicates, duplicate_counts, duplicate_groups, removed_records, group_members,
+                              group_member_ids, restore_records, PAGE_SIZE)
+from dedup_utils import EXACT, CONTAINED
+
+# item data: ("group", kept_id) or ("record", removed_id)
+ITEM_ROLE = Qt.ItemDataRole.UserRole
+
+def removed_text(header, seq_length, reason, similarity, offset, kept_header):
+    if reason == EXACT:
+        return f"{header} [{seq_length}] = {kept_header}"
+    if reason == CONTAINED:
+        return f"{header} [{seq_length}] ⊂ {kept_header} @{offset}"
+    return f"{header} [{seq_length}] ~ {kept_header} ({similarity:.2f})"
+
+# Removed records of the last cleaning, read PAGE_SIZE at a time from
+# duplicates.db. grouped=True lists one item per kept record ("N copies of
+# X") whose removed records are read when it is expanded, otherwise the
+# removed records in id order. Restore puts the selected groups or records
+# back into cleaned.db; restored counts them for the caller
+class DuplicatesDialog(QDialog):
+    def __init__(self, grouped, parent=None):
+        super().__init__(parent)
+        self.grouped = grouped
+        self.restored = 0
+        # first id of every page visited, the last one is shown
+        self.page_starts = [0]
+        self.next_start = None
+        self.conn = connect_duplicates()
+
+        self.setWindowTitle("Duplicate Sequences" if grouped else "Removed Sequences")
+        layout = QVBoxLayout(self)
+
+        self.summary_label = QLabel()
+        self.tree = QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        self.tree.itemExpanded.connect(self.load_members)
+
+        self.previous_button = QPushButton("< Previous")
+        self.previous_button.clicked.connect(self.show_previous_page)
+        self.page_label = QLabel()
+        self.next_button = QPushButton("Next >")
+        self.next_button.clicked.connect(self.show_next_page)
+        page_row = QHBoxLayout()
+        page_row.addWidget(self.previous_button)
+        page_row.addStretch()
+        page_row.addWidget(self.page_label)
+        page_row.addStretch()
+        page_row.addWidget(self.next_button)
+
+        restore_btn = QPushButton("Restore")
+        restore_btn.setToolTip("Put the selected records, or every record of the selected groups, back into the cleaned set.")
+        restore_btn.clicked.connect(self.restore_selected)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        button_row = QHBoxLayout()
+        button_row.addWidget(restore_btn)
+        button_row.addStretch()
+        button_row.addWidget(close_btn)
+
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.tree)
+        layout.addLayout(page_row)
+        layout.addLayout(button_row)
+        self.setLayout(layout)
+        self.resize(700, 500)
+
+        self.show_page()
+
+    ###################### PAGES ##############################
+    def show_page(self):
+        groups, records = duplicate_counts(self.conn)
+        self.summary_label.setText(f"{records} removed records in {groups} groups")
+
+        self.tree.clear()
+        after = self.page_starts[-1]
+        if self.grouped:
+            rows = duplicate_groups(self.conn, after, PAGE_SIZE + 1)
+            for kept_id, header, seq_length, copies in rows[:PAGE_SIZE]:
+                item = QTreeWidgetItem([f"{copies} {'copy' if copies == 1 else 'copies'} of {header} [{seq_length}]"])
+                item.setData(0, ITEM_ROLE, ("group", kept_id))
+                item.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.ShowIndicator)
+                self.tree.addTopLevelItem(item)
+        else:
+            rows = removed_records(self.conn, after, PAGE_SIZE + 1)
+            for removed_id, *row in rows[:PAGE_SIZE]:
+                item = QTreeWidgetItem([removed_text(*row)])
+                item.setData(0, ITEM_ROLE, ("record", removed_id))
+                self.tree.addTopLevelItem(item)
+
+        self.next_start = rows[PAGE_SIZE - 1][0] if len(rows) > PAGE_SIZE else None
+        self.page_label.setText(f"Page {len(self.page_starts)}")
+        self.previous_button.setEnabled(len(self.page_starts) > 1)
+        self.next_button.setEnabled(self.next_start is not None)
+
+    def show_next_page(self):
+        self.page_starts.append(self.next_start)
+        self.show_page()
+
+    def show_previous_page(self):
+        self.page_starts.pop()
+        self.show_page()
+
+    def load_members(self, item):
+        kind, kept_id = item.data(0, ITEM_ROLE)
+        if kind != "group" or item.childCount():
+            return
+        for removed_id, *row in group_members(self.conn, kept_id):
+            child = QTreeWidgetItem([removed_text(*row)])
+            child.setData(0, ITEM_ROLE, ("record", removed_id))
+            item.addChild(child)
+
+    ###################### RESTORING ##############################
+    def restore_selected(self):
+        removed_ids = []
+        kept_ids = []
+        for item in self.tree.selectedItems():
+            kind, record_id = item.data(0, ITEM_ROLE)
+            (kept_ids if kind == "group" else removed_ids).append(record_id)
+        removed_ids += group_member_ids(self.conn, kept_ids)
+        if not removed_ids:
+            return
+
+        self.restored += restore_records(removed_ids)
+        # the page may have become empty
+        if len(self.page_starts) > 1 and not self.page_is_filled():
+            self.page_starts.pop()
+        self.show_page()
+
+    def page_is_filled(self):
+        if self.grouped:
+            return bool(duplicate_groups(self.conn, self.page_starts[-1], 1))
+        return bool(removed_records(self.conn, self.page_starts[-1], 1))
+
+    def done(self, result):
+        self.conn.close()
+        super().done(result)
@@ -0,0 +1,202 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from array import array
+import sqlite3
+import time
+import os
+import math
+from fasta_reader import map_file, find_record_start, read_fasta_rows, detect_compression
+from fasta_utils import insert_records, create_sequences_table, tune_for_ingest
+from header_metrics import with_header_metrics
+
+CHUNK_SIZE = 16 * 1024 * 1024
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+###################### SPLITTING FILES ##############################
+# Chunks always start at a ">" line, so every chunk can be parsed on its own.
+# Compressed files cannot be split and come back as one (0, None) chunk
+def plan_chunks(path, chunk_size=CHUNK_SIZE):
+    if detect_compression(path):
+        return [(0, None)]
+
+    mm = map_file(path)
+    if mm is None:
+        return [(0, 0)]
+
+    try:
+        bounds = [0]
+        pos = find_record_start(mm, chunk_size)
+        while pos != -1:
+            bounds.append(pos)
+            pos = find_record_start(mm, pos + chunk_size)
+        bounds.append(len(mm))
+    finally:
+        mm.close()
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+###################### WORKER PROCESS ##############################
+# Full database rows: the parsed record plus its header metrics
+def read_rows(path, start=0, end=None, threads=1, index=False, packed=False, progress=None, digests=None):
+    return with_header_metrics(read_fasta_rows(path, start, end, threads, index, packed, progress, digests))
+
+# Headers, accessions, sequence starts and text sequences never contain
+# newlines, so a parsed chunk travels back to the writer as joined strings
+# plus arrays of numbers instead of many small tuples. "" stands for a
+# sequence left on disk, NaN for a missing metric. Packed sequences are
+# BLOBs and travel as one bytes object cut by their sizes. With hashed=True
+# the digests of the chunk's blocks follow as one bytes object
+def parse_chunk(path, start, end, index=False, packed=False, hashed=False):
+    digests = [] if hashed else None
+    rows = list(read_rows(path, start, end, index=index, packed=packed, digests=digests))
+    numbers = array("q")
+    metrics = array("d")
+    for _, sequence, length, offset, line_bases, line_width, _, *values, _ in rows:
+        size = len(sequence) if packed and sequence is not None else -1
+        if offset is None:
+            numbers.extend((length, -1, 0, 0, size))
+        else:
+            numbers.extend((length, offset, line_bases, line_width, size))
+        metrics.extend(math.nan if value is None else value for value in values)
+    if packed:
+        sequences = b"".join(row[1] or b"" for row in rows)
+    else:
+        sequences = "\n".join(row[1] or "" for row in rows)
+    return (len(rows), "\n".join(row[0] for row in rows), sequences, numbers.tobytes(),
+            metrics.tobytes(), "\n".join(row[-1] for row in rows), "\n".join(row[6] for row in rows),
+            b"".join(digests or []))
+
+def unpack_digests(data):
+    return [data[pos:pos + 16] for pos in range(0, len(data), 16)]
+
+def unpack_chunk(chunk):
+    count, headers, sequences, numbers, metrics, accessions, starts, _ = chunk
+    if not count:
+        return
+    values = array("q")
+    values.frombytes(numbers)
+    metric_values = array("d")
+    metric_values.frombytes(metrics)
+    if isinstance(sequences, bytes):
+        pieces = []
+        pos = 0
+        for size in values[4::5]:
+            pieces.append(sequences[pos:pos + size] if size >= 0 else None)
+            pos += max(size, 0)
+    else:
+        pieces = sequences.split("\n")
+    for i, (header, sequence, accession, seq_start) in enumerate(zip(headers.split("\n"), pieces, accessions.split("\n"),
+                                                                    starts.split("\n"))):
+        length, offset, line_bases, line_width = values[i * 5:i * 5 + 4]
+        score, evalue, align_len, identities, positives = [
+            None if value != value else value for value in metric_values[i * 5:i * 5 + 5]]
+        parsed = (score, evalue,
+                  None if align_len is None else int(align_len),
+                  None if identities is None else int(identities),
+                  None if positives is None else int(positives),
+                  accession)
+        if offset < 0:
+            yield (header, sequence, length, None, None, None, seq_start) + parsed
+        else:
+            yield (header, None, length, offset, line_bases, line_width, seq_start) + parsed
+
+###################### LOADING FILES ##############################
+class LoadCancelled(Exception):
+    pass
+
+# Workers parse chunks ahead of the writer, the writer inserts them in file
+# order so rowids follow the order of the selected files. Compressed files
+# are streamed by the writer itself while the workers keep parsing ahead.
+# progress_callback(file_index, fraction of the file's bytes, records
+# inserted so far) is called block by block; when it returns False the load
+# stops and everything it wrote is rolled back. digests, a list per file,
+# gets the block digests of every file read (see fasta_reader.fingerprint),
+# so the files need no second read to be hashed. Returns (counts,
+# records/s, completed)
+def load_fasta_files(file_paths, db_path="sequences.db", workers=DEFAULT_WORKERS, progress_callback=None, tables=None, index=False, packed=False, digests=None):
+    start_time = time.time()
+    tables = tables or ["sequences"] * len(file_paths)
+
+    tasks = []
+    for file_index, path in enumerate(file_paths):
+        tasks.extend((file_index, path, start, end) for start, end in plan_chunks(path))
+    sizes = [os.path.getsize(path) for path in file_paths]
+
+    counts = [0] * len(file_paths)
+    inserted = 0
+
+    def counted(records):
+        nonlocal inserted
+        for record in records:
+            inserted += 1
+            yield record
+
+    def report(file_index, position):
+        if progress_callback and progress_callback(file_index, min(1.0, position / max(sizes[file_index], 1)), inserted) is False:
+            raise LoadCancelled()
+
+    def write(file_index, records, end):
+        counts[file_index] += insert_records(c, counted(records), table=tables[file_index])
+        report(file_index, sizes[file_index] if end is None else end)
+
+    def reader(file_index):
+        return lambda position: report(file_index, position)
+
+    completed = True
+    conn = sqlite3.connect(db_path)
+    try:
+        tune_for_ingest(conn)
+        c = conn.cursor()
+        for table in set(tables):
+            create_sequences_table(c, table=table)
+
+        try:
+            if workers <= 1 or len(tasks) <= 1:
+                for file_index, path, start, end in tasks:
+                    write(file_index, read_rows(path, start, end, workers, index, packed, reader(file_index),
+                                                digests and digests[file_index]), end)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    try:
+                        pending = deque()
+                        next_task = 0
+                        while pending or next_task < len(tasks):
+                            while next_task < len(tasks) and len(pending) < workers * 2:
+                                file_index, path, start, end = tasks[next_task]
+                                future = None if end is None else pool.submit(parse_chunk, path, start, end, index, packed,
+                                                                              digests is not None)
+                                pending.append((file_index, path, end, future))
+                                next_task += 1
+
+                            file_index, path, end, future = pending.popleft()
+                            if future is None:
+                                records = read_rows(path, threads=workers, packed=packed, progress=reader(file_index),
+                                                    digests=digests and digests[file_index])
+                            else:
+                                chunk = future.result()
+                                if digests is not None:
+                                    digests[file_index].extend(unpack_digests(chunk[-1]))
+                                records = unpack_chunk(chunk)
+                            write(file_index, records, end)
+                    except LoadCancelled:
+                        pool.shutdown(cancel_futures=True)
+                        raise
+            conn.commit()
+        except LoadCancelled:
+            conn.rollback()
+            completed = False
+            counts = [0] * len(file_paths)
+    finally:
+        conn.close()
+
+    elapsed = max(time.time() - start_time, 1e-9)
+    total = sum(counts)
+    if completed:
+        print(f"Loaded {total} records from {len(file_paths)} files in {elapsed:.2f} s ({total / elapsed:.0f} records/s)")
+    else:
+        print(f"Loading cancelled after {elapsed:.2f} s, nothing was saved")
+    return counts, total / elapsed, completed
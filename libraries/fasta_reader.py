@@ -0,0 +1,386 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import nullcontext
+import mmap
+import os
+import gzip
+import bz2
+import lzma
+import zlib
+import struct
+import hashlib
+from seq_codec import encode_sequence
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+WHITESPACE = b" \t\r\n\v\f"
+BLOCK_SIZE = 8 * 1024 * 1024
+# letters kept in the seq_start column, enough for a start codon
+SEQ_START_LENGTH = 3
+# files are fingerprinted as the digests of blocks of this size, so the
+# blocks can be hashed wherever they are read
+FINGERPRINT_BLOCK = 1024 * 1024
+
+COMPRESSION_MAGIC = [
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+]
+
+FASTA_FILE_FILTER = "FASTA Files (*.fasta *.fa *.faa *.fna *.txt *.gz *.bz2 *.xz *.zst);;All Files (*)"
+
+###################### MAPPING FILES ##############################
+def map_file(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+# First record header at or after pos (a ">" at the start of a line)
+def find_record_start(mm, pos=0):
+    if pos <= 0:
+        if mm[:1] == b">":
+            return 0
+        pos = 0
+    else:
+        pos -= 1
+    found = mm.find(b"\n>", pos)
+    return -1 if found == -1 else found + 1
+
+###################### FINGERPRINTS ##############################
+def block_digest(block):
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+# content hash of a file from the digests of all its blocks in order
+def fingerprint(digests):
+    return hashlib.blake2b(b"".join(digests), digest_size=16).hexdigest()
+
+# digests of the blocks of mm starting in [start, end)
+def block_digests(mm, start, end):
+    first = -(-start // FINGERPRINT_BLOCK) * FINGERPRINT_BLOCK
+    return [block_digest(mm[pos:pos + FINGERPRINT_BLOCK]) for pos in range(first, end, FINGERPRINT_BLOCK)]
+
+# Passes reads through to an open file and appends the digest of every
+# block read to digests; finish() hashes what the reader left unread
+class HashingReader:
+    def __init__(self, file, digests):
+        self.file = file
+        self.name = file.name
+        self.digests = digests
+        self.block = bytearray()
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.block += data
+        while len(self.block) >= FINGERPRINT_BLOCK:
+            self.digests.append(block_digest(self.block[:FINGERPRINT_BLOCK]))
+            del self.block[:FINGERPRINT_BLOCK]
+        return data
+
+    def finish(self):
+        while self.read(FINGERPRINT_BLOCK):
+            pass
+        if self.block:
+            self.digests.append(block_digest(self.block))
+            self.block = bytearray()
+
+###################### COMPRESSED FILES ##############################
+def detect_compression(path):
+    with open(path, "rb") as f:
+        magic = f.read(6)
+    for prefix, name in COMPRESSION_MAGIC:
+        if magic.startswith(prefix):
+            return name
+    return None
+
+# Block gzip (samtools/htslib): every block is a gzip member carrying its own
+# size in a "BC" extra field, so blocks can be inflated independently
+def is_bgzf(path):
+    with open(path, "rb") as f:
+        header = f.read(16)
+    return (len(header) == 16 and header[:4] == b"\x1f\x8b\x08\x04"
+            and header[12:14] == b"BC" and header[14:16] == b"\x02\x00")
+
+# reads from an open file, which stays open after close()
+class BgzfReader:
+    def __init__(self, file, threads):
+        self.file = file
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+        self.readahead = threads * 4
+        self.buffer = b""
+        self.eof = False
+
+    def _next_block(self):
+        header = self.file.read(12)
+        if len(header) < 12:
+            return None
+        xlen = struct.unpack("<H", header[10:12])[0]
+        extra = self.file.read(xlen)
+        bsize = None
+        pos = 0
+        while pos + 4 <= len(extra):
+            slen = struct.unpack("<H", extra[pos + 2:pos + 4])[0]
+            if extra[pos:pos + 2] == b"BC":
+                bsize = struct.unpack("<H", extra[pos + 4:pos + 6])[0]
+            pos += 4 + slen
+        if bsize is None:
+            raise ValueError("Not a BGZF block")
+        return self.file.read(bsize + 1 - 12 - xlen)[:-8]
+
+    def _fill(self):
+        while not self.eof and len(self.pending) < self.readahead:
+            data = self._next_block()
+            if data is None:
+                self.eof = True
+                break
+            self.pending.append(self.pool.submit(zlib.decompress, data, -15))
+
+    # zlib releases the GIL while inflating, so blocks decompress in parallel
+    def read(self, size=-1):
+        chunks = [self.buffer]
+        have = len(self.buffer)
+        while size < 0 or have < size:
+            self._fill()
+            if not self.pending:
+                break
+            data = self.pending.popleft().result()
+            chunks.append(data)
+            have += len(data)
+        data = b"".join(chunks)
+        if size < 0:
+            self.buffer = b""
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Decompressing reader over the open file raw, which the caller closes; its
+# position tells how much of the compressed file was consumed
+def open_compressed(raw, compression, threads=1):
+    if compression == "gzip":
+        if threads > 1 and is_bgzf(raw.name):
+            return BgzfReader(raw, threads)
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if compression == "bz2":
+        return bz2.BZ2File(raw, "rb")
+    if compression == "xz":
+        return lzma.LZMAFile(raw, "rb")
+    if compression == "zstd":
+        if zstandard is None:
+            raise ValueError(f"{os.path.basename(raw.name)} is zstd compressed, install the 'zstandard' package to read it")
+        return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=False)
+    raise ValueError(f"Unknown compression: {compression}")
+
+###################### READING RECORDS ##############################
+# block holds whole records, each without its leading ">"
+def split_records(block):
+    for record in block.split(b"\n>"):
+        header, _, body = record.partition(b"\n")
+        sequence = body.translate(None, WHITESPACE)
+        if sequence:
+            yield header.rstrip(), sequence
+
+# Yields raw (header, sequence) bytes for every record whose header starts
+# in [start, end). The map is cut into blocks that end on record
+# boundaries and each block is split into records by a single C-level
+# split, so no Python object is created per line. progress(position) is
+# called once the records of a block were consumed
+def iter_mapped_records(mm, start=0, end=None, block_size=BLOCK_SIZE, progress=None):
+    size = len(mm)
+    end = size if end is None else end
+    pos = find_record_start(mm, start)
+
+    while pos != -1 and pos < end:
+        next_pos = find_record_start(mm, min(pos + block_size, end))
+        yield from split_records(mm[pos + 1:size if next_pos == -1 else next_pos])
+        pos = next_pos
+        if progress:
+            progress(end if pos == -1 else min(pos, end))
+
+# Same cutting for decompressed streams: a block is flushed at the last
+# record start seen so far, the tail waits for the next read. progress()
+# is called once the records of a block were consumed
+def iter_stream_records(f, block_size=BLOCK_SIZE, progress=None):
+    pieces = [b"\n"]
+    while True:
+        data = f.read(block_size)
+        if not data:
+            break
+        cut = data.rfind(b"\n>")
+        if cut != -1:
+            cut += 1
+        elif data[:1] == b">" and pieces[-1][-1:] == b"\n":
+            cut = 0
+        else:
+            pieces.append(data)
+            continue
+        pieces.append(data[:cut])
+        yield from split_stream_block(b"".join(pieces))
+        pieces = [data[cut:]]
+        if progress:
+            progress()
+    yield from split_stream_block(b"".join(pieces))
+    if progress:
+        progress()
+
+def split_stream_block(block):
+    pos = 0 if block[:1] == b">" else block.find(b"\n>") + 1
+    if pos > 0 or block[:1] == b">":
+        yield from split_records(block[pos + 1:])
+
+###################### OFFSET INDEX ##############################
+# samtools faidx layout of a record body: (line_bases, line_width) when all
+# lines but the last hold line_bases residues, None when the record is not
+# evenly wrapped and has to be stored inline
+def line_layout(body, length):
+    first = body.find(b"\n")
+    if first == -1:
+        first = len(body)
+    line_bases = len(body[:first].rstrip(b"\r"))
+    line_width = first + 1
+    if line_bases == 0:
+        return None
+
+    term = line_width - line_bases
+    full, rem = divmod(length, line_bases)
+    data_len = len(body.rstrip(WHITESPACE))
+    if data_len != (full * line_width + rem if rem else full * line_width - term):
+        return None
+
+    # whitespace count matches, now it has to sit exactly at the line ends
+    ends = body[line_bases:data_len:line_width]
+    if ends.count(b"\r" if term == 2 else b"\n") != len(ends):
+        return None
+    if term == 2:
+        ends = body[line_bases + 1:data_len:line_width]
+        if ends.count(b"\n") != len(ends):
+            return None
+    return line_bases, line_width
+
+def read_indexed(mm, offset, length, line_bases, line_width):
+    full, rem = divmod(length, line_bases)
+    return mm[offset:offset + full * line_width + rem].translate(None, WHITESPACE)
+
+# Like iter_mapped_records, but yields (header, sequence, length, offset,
+# line_bases, line_width) with sequence None for every evenly wrapped record
+def iter_mapped_index(mm, start=0, end=None, block_size=BLOCK_SIZE, progress=None):
+    size = len(mm)
+    end = size if end is None else end
+    pos = find_record_start(mm, start)
+
+    while pos != -1 and pos < end:
+        next_pos = find_record_start(mm, min(pos + block_size, end))
+        record_start = pos + 1
+        for record in mm[pos + 1:size if next_pos == -1 else next_pos].split(b"\n>"):
+            header, _, body = record.partition(b"\n")
+            sequence = body.translate(None, WHITESPACE)
+            if sequence:
+                layout = line_layout(body, len(sequence))
+                if layout:
+                    yield header.rstrip(), None, len(sequence), record_start + len(header) + 1, *layout
+                else:
+                    yield header.rstrip(), sequence, len(sequence), None, None, None
+            record_start += len(record) + 2
+        pos = next_pos
+        if progress:
+            progress(end if pos == -1 else min(pos, end))
+
+# progress(position) reports how far into the file (compressed or not) the
+# reader got, block by block. A digests list gets the block digests (see
+# fingerprint) of the part of the file read, once every record was read
+def read_fasta_raw(path, start=0, end=None, threads=1, progress=None, digests=None):
+    compression = detect_compression(path)
+    if compression:
+        with open(path, "rb") as raw:
+            source = raw if digests is None else HashingReader(raw, digests)
+            with open_compressed(source, compression, threads) as f:
+                yield from iter_stream_records(f, progress=progress and (lambda: progress(raw.tell())))
+            if digests is not None:
+                source.finish()
+        return
+
+    mm = map_file(path)
+    if mm is None:
+        return
+    try:
+        yield from iter_mapped_records(mm, start, end, progress=progress)
+        if digests is not None:
+            digests.extend(block_digests(mm, start, len(mm) if end is None else end))
+    finally:
+        mm.close()
+
+def read_fasta(path, start=0, end=None, threads=1, progress=None, digests=None):
+    for header, sequence in read_fasta_raw(path, start, end, threads, progress, digests):
+        yield header.decode("utf-8", errors="replace"), sequence.decode("utf-8", errors="replace")
+
+# Database rows (header, sequence, seq_length, seq_offset, line_bases,
+# line_width, seq_start). With index=True evenly wrapped records of
+# uncompressed files keep only their location; everything else carries its
+# sequence, packed into a BLOB by seq_codec with packed=True. seq_start holds
+# the first letters in every mode, so the start codon filters never read
+# the sequence. digests works as in read_fasta_raw
+def read_fasta_rows(path, start=0, end=None, threads=1, index=False, packed=False, progress=None, digests=None):
+    if index and not detect_compression(path):
+        mm = map_file(path)
+        if mm is None:
+            return
+        try:
+            for header, sequence, length, offset, line_bases, line_width in iter_mapped_index(mm, start, end, progress=progress):
+                if sequence is not None:
+                    seq_start = sequence[:SEQ_START_LENGTH].decode("utf-8", errors="replace")
+                    sequence = encode_sequence(sequence) if packed else sequence.decode("utf-8", errors="replace")
+                else:
+                    seq_start = read_indexed(mm, offset, min(length, SEQ_START_LENGTH), line_bases,
+                                             line_width).decode("utf-8", errors="replace")
+                yield header.decode("utf-8", errors="replace"), sequence, length, offset, line_bases, line_width, seq_start
+            if digests is not None:
+                digests.extend(block_digests(mm, start, len(mm) if end is None else end))
+        finally:
+            mm.close()
+        return
+
+    if packed:
+        for header, sequence in read_fasta_raw(path, start, end, threads, progress, digests):
+            yield (header.decode("utf-8", errors="replace"), encode_sequence(sequence), len(sequence), None, None, None,
+                   sequence[:SEQ_START_LENGTH].decode("utf-8", errors="replace"))
+        return
+
+    for header, sequence in read_fasta(path, start, end, threads, progress, digests):
+        yield header, sequence, len(sequence), None, None, None, sequence[:SEQ_START_LENGTH]
+
+###################### MERGING FILES ##############################
+# The files are copied block by block as they are (decompressed), so the
+# merged file holds every record of them with its line wrapping; a file
+# without a final newline gets one so the next file starts on its own line
+def merge_fasta_files(paths, out_path, threads=1):
+    with open(out_path, "wb") as out:
+        for path in paths:
+            compression = detect_compression(path)
+            with open(path, "rb") as raw, (open_compressed(raw, compression, threads) if compression
+                                           else nullcontext(raw)) as f:
+                last = b"\n"
+                while True:
+                    block = f.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    out.write(block)
+                    last = block[-1:]
+                if last != b"\n":
+                    out.write(b"\n")
@@ -2,6 +2,14 @@
 # Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski 
 # Licensed under the GPL v3.0 License
 import sqlite3
+import time
+from itertools import islice
+from fasta_reader import read_fasta_rows
+from seq_store import SequenceStore, SEQUENCE_COLUMNS
+from header_metrics import HEADER_COLUMNS, METRIC_COLUMNS, with_header_metrics, create_metric_indexes
+from motif_match import HAMMING
+from motif_index import ids_condition
+from filter_engine import filter_candidates, filter_columns, string_filters, header_passes, sequence_passes
 
 def load_fasta_file(filepath):
     with open(filepath, "r") as f:
@@ -16,66 +24,116 @@ def make_key(header, sequence, check_name, check_sequence):
         return sequence
     return f"{header}\n{sequence}"
 
-###################### CREATING DATABASE ##############################    
-def save_fasta_to_db(fasta_path, db_path="sequences.db", append=False):
-    with sqlite3.connect(db_path) as conn, open(fasta_path, "r") as f:
+###################### CREATING DATABASE ##############################
+INGEST_BATCH_SIZE = 10000
+
+# sequence is NULL for records kept in their FASTA file; those are read back
+# from source_id at seq_offset using the faidx line layout. seq_start holds
+# the first letters of the sequence for the start codon filters. The BLAST
+# metrics of the header are parsed into their own columns (see header_metrics)
+SEQUENCES_TABLE = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        header TEXT,
+        sequence TEXT,
+        seq_length INTEGER,
+        source_id INTEGER,
+        seq_offset INTEGER,
+        line_bases INTEGER,
+        line_width INTEGER,
+        seq_start TEXT,
+        score REAL,
+        evalue REAL,
+        align_len INTEGER,
+        identities INTEGER,
+        positives INTEGER,
+        accession TEXT
+    )
+"""
+
+ROW_COLUMNS = "header, sequence, seq_length, seq_offset, line_bases, line_width, seq_start, " + HEADER_COLUMNS
+
+def create_sequences_table(c, drop=False, table="sequences"):
+    if drop:
+        c.execute(f"DROP TABLE IF EXISTS {table}")
+    c.execute(SEQUENCES_TABLE.format(table=table))
+
+# everything in sequences.db can be rebuilt from the FASTA files, so
+# durability is traded for speed while ingesting
+def tune_for_ingest(conn):
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+def insert_records(c, records, batch_size=INGEST_BATCH_SIZE, table="sequences"):
+    records = iter(records)
+    query = f"INSERT INTO {table} ({ROW_COLUMNS}) VALUES ({', '.join('?' * len(ROW_COLUMNS.split(', ')))})"
+    count = 0
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        c.executemany(query, batch)
+        count += len(batch)
+    return count
+
+def save_fasta_to_db(fasta_path, db_path="sequences.db", append=False, batch_size=INGEST_BATCH_SIZE):
+    start = time.time()
+    conn = sqlite3.connect(db_path)
+    try:
+        tune_for_ingest(conn)
         c = conn.cursor()
+        create_sequences_table(c, drop=not append)
 
-        if not append:
-            c.execute("DROP TABLE IF EXISTS sequences")
-            c.execute("""
-                CREATE TABLE sequences (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    header TEXT,
-                    sequence TEXT
-                )
-            """)
-        else:
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS sequences (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    header TEXT,
-                    sequence TEXT
-                )
-            """)
-
-        current_header = None
-        current_sequence = []
-
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith(">"):
-                if current_header and current_sequence:
-                    c.execute("INSERT INTO sequences (header, sequence) VALUES (?, ?)", 
-                              (current_header[1:], ''.join(current_sequence)))
-                current_header = line
-                current_sequence = []
-            else:
-                current_sequence.append(line)
-
-        
-        if current_header and current_sequence:
-            c.execute("INSERT INTO sequences (header, sequence) VALUES (?, ?)", 
-                      (current_header[1:], ''.join(current_sequence)))
+        count = insert_records(c, with_header_metrics(read_fasta_rows(fasta_path)), batch_size)
+        create_metric_indexes(c)
 
         conn.commit()
+    finally:
+        conn.close()
+
+    elapsed = max(time.time() - start, 1e-9)
+    rate = count / elapsed
+    print(f"Loaded {count} records from {fasta_path} in {elapsed:.2f} s ({rate:.0f} records/s)")
+    return count, rate
 
 ###################### GET SEQUENCES ############################## //NOT USED
 def fetch_all_sequences(db_path="sequences.db"):
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
-    c.execute("SELECT header, sequence FROM sequences")
-    rows = c.fetchall()
+    c.execute(f"SELECT header, {SEQUENCE_COLUMNS} FROM sequences")
+    with SequenceStore(conn) as store:
+        rows = [(header, store.sequence(*location)) for header, *location in c]
+    conn.close()
+    return rows
+
+###################### GET HEADERS ##############################
+# (header, seq_length, score, evalue, align_len, identities, positives)
+def fetch_all_headers(db_path="cleaned.db"):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(f"SELECT header, seq_length, {METRIC_COLUMNS} FROM sequences").fetchall()
     conn.close()
     return rows
 
+def fetch_sequence_by_id(header_id, db_path="cleaned.db"):
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute(f"SELECT header, {SEQUENCE_COLUMNS} FROM sequences WHERE accession = ? ORDER BY id LIMIT 1",
+                           (header_id,)).fetchone()
+        if row is None:
+            return None
+        with SequenceStore(conn) as store:
+            return row[0], store.sequence(*row[1:])
+    finally:
+        conn.close()
+
 ###################### FILTERING ##############################
 def fetch_advanced_filtered_sequences(                
     name_terms=None,
     seq_terms=None,
     similarity_threshold=100,
+    match_mode=HAMMING,
     check_length=False,
     min_len=0,
     max_len=1_000_000,
@@ -101,107 +159,42 @@ def fetch_advanced_filtered_sequences(
     progress_callback=None
 ):
     import sqlite3
-    import re
 
     result = []
 
-    parsed_name_terms = []
-    for line in name_terms or []:
-        terms = [t.strip().lower() for t in line.split(",") if t.strip()]
-        if terms:
-            parsed_name_terms.append(terms)
-
-    def header_matches(header):
-        header_l = header.lower()
-        for and_terms in parsed_name_terms:
-            if all(term in header_l for term in and_terms):
-                return True
-        return not parsed_name_terms  # jeśli brak zapytań, wszystko przepuszcza
-
- 
-    seq_term_data = [(term.lower(), len(term)) for term in seq_terms or []]
+    # the same keys as filter_args
+    args = dict(
+        name_terms=name_terms, seq_terms=seq_terms, similarity_threshold=similarity_threshold, match_mode=match_mode,
+        check_length=check_length, min_len=min_len, max_len=max_len,
+        check_atg=check_atg, check_m=check_m, check_atg_dna=check_atg_dna,
+        check_score=check_score, min_score=min_score, max_score=max_score,
+        check_eval=check_eval, min_eval=min_eval, max_eval=max_eval,
+        check_alength=check_alength, min_alength=min_alength, max_alength=max_alength,
+        check_identities=check_identities, min_identities=min_identities, max_identities=max_identities,
+        check_positives=check_positives, min_positives=min_positives, max_positives=max_positives,
+    )
+    groups, matchers = string_filters(args)
 
     with sqlite3.connect(db_path) as conn:
         c = conn.cursor()
-        c2 = conn.cursor()
-
-        c2.execute("SELECT COUNT(*) FROM sequences")
-        total = c2.fetchone()[0]
-        processed = 0
-
-        for header, sequence in c.execute("SELECT header, sequence FROM sequences"):
-            processed += 1
-
-            if check_length:
-                seq_len = len(sequence)
-                if seq_len < min_len or seq_len > max_len:
-                    continue
-
-            if not header_matches(header):
-                continue
-
-            if seq_term_data:
-                seq_lower = sequence.lower()
-                match_seq = False
-                for term, term_len in seq_term_data:
-                    if len(seq_lower) < term_len:
-                        continue
-                    max_mismatches = int((1 - similarity_threshold / 100) * term_len)
-                    for i in range(len(seq_lower) - term_len + 1):
-                        window = seq_lower[i:i+term_len]
-                        mismatches = sum(1 for a, b in zip(term, window) if a != b)
-                        if mismatches <= max_mismatches:
-                            match_seq = True
-                            break
-                    if match_seq:
-                        break
-                if not match_seq:
-                    continue
-
-            # ATG / M filtry
-            if check_atg:
-                if check_m and not sequence.startswith("M"):
-                    continue
-                if check_atg_dna and not sequence.startswith("ATG"):
-                    continue
-
-            # Score
-            if check_score:
-                match = re.search(r"Score: ([\d\.]+)", header)
-                if not match or not (min_score <= float(match.group(1)) <= max_score):
-                    continue
-
-            # E-value
-            if check_eval:
-                match = re.search(r"E-?value: ([\d\.eE+-]+)", header)
-                if not match or not (min_eval <= float(match.group(1)) <= max_eval):
-                    continue
-
-            # Alignment Length
-            if check_alength:
-                match = re.search(r"Alignment Length: (\d+)", header)
-                if not match or not (min_alength <= int(match.group(1)) <= max_alength):
-                    continue
-
-            # Identities
-            if check_identities:
-                match = re.search(r"Identities: (\d+)", header)
-                if not match or not (min_identities <= int(match.group(1)) <= max_identities):
-                    continue
-
-            # Positives
-            if check_positives:
-                match = re.search(r"Positives: (\d+)", header)
-                if not match or not (min_positives <= int(match.group(1)) <= max_positives):
-                    continue
-
-            result.append((header, sequence))
+        store = SequenceStore(conn)
+        ids = filter_candidates(conn, args, filter_columns(db_path)).tolist()
+        condition, param = ids_condition(ids, "id")
+        total = len(ids)
+
+        for processed, (header, *location) in enumerate(
+                c.execute(f"SELECT header, {SEQUENCE_COLUMNS} FROM sequences WHERE {condition} ORDER BY id", (param,)), 1):
+            if header_passes(groups, header):
+                sequence = store.sequence(*location)
+                if sequence_passes(matchers, sequence):
+                    result.append((header, sequence))
 
             if progress_callback and processed % max(1, total // 100) == 0:
                 progress_callback(int(processed / total * 100))
 
         if progress_callback:
             progress_callback(100)
+        store.close()
 
     return result
     
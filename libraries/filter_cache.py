@@ -0,0 +1,121 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+from collections import OrderedDict
+import threading
+import os
+import numpy as np
+from header_metrics import RANGE_FILTERS, START_FILTERS
+from header_index import name_groups
+from motif_match import max_errors, EDIT, HAMMING
+
+# Ids of the records that passed recent filters, kept per cleaned.db and
+# normalized filter. A filter is narrower than a cached one when every
+# record it keeps is kept by the cached one as well: its ranges lie inside
+# the cached ranges, it checks the same start codons and more, every line
+# of its name filter holds every term of some cached line, every motif it
+# searches for is found wherever a cached motif is. Such a filter is only
+# run over the cached ids; a filter met before only reads the records back.
+# The least recently used sets are dropped beyond FILTER_CACHE_BYTES. A
+# changed cleaned.db (size, modification time or the change counter SQLite
+# bumps on every commit, which also catches writes within the resolution of
+# the file times) never matches older sets
+FILTER_CACHE_BYTES = 64 << 20
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+###################### KEYS ##############################
+def database_stamp(db_path):
+    with open(db_path, "rb") as f:
+        f.seek(24)
+        change_counter = f.read(4)
+    stat = os.stat(db_path)
+    return (os.path.abspath(db_path), stat.st_size, stat.st_mtime_ns, change_counter)
+
+# (ranges, start codons, name groups, motifs) of the filters switched on in
+# filter_args, the parts the filters read and nothing else
+def normalize_filter(args):
+    ranges = tuple((column, args[low], args[high]) for column, check, low, high in RANGE_FILTERS if args.get(check))
+    starts = frozenset(codon for check, codon in START_FILTERS if args.get("check_atg") and args.get(check))
+
+    groups = name_groups(args.get("name_terms"))
+    names = frozenset(frozenset(terms) for terms in groups) if groups else None
+
+    terms = frozenset(term.lower() for term in args.get("seq_terms") or [] if term)
+    motifs = None
+    if terms:
+        motifs = (args.get("similarity_threshold", 100), args.get("match_mode", HAMMING), terms)
+    return ranges, starts, names, motifs
+
+###################### NARROWER FILTERS ##############################
+def ranges_within(ranges, wider):
+    bounds = {column: (low, high) for column, low, high in ranges}
+    for column, low, high in wider:
+        if column not in bounds or not low <= bounds[column][0] or not bounds[column][1] <= high:
+            return False
+    return True
+
+# a header holding every term of group holds every term of wider
+def group_within(group, wider):
+    return all(any(term in longer for longer in group) for term in wider)
+
+def names_within(names, wider):
+    if wider is None:
+        return True
+    if names is None:
+        return False
+    return all(any(group_within(group, other) for other in wider) for group in names)
+
+# a record matched by term is matched by wider_term as well
+def motif_within(term, threshold, mode, wider_term, wider_threshold, wider_mode):
+    if max_errors(len(term), threshold) == 0 and wider_term in term:
+        return True
+    return (term == wider_term and max_errors(len(term), threshold) <= max_errors(len(term), wider_threshold)
+            and (mode == wider_mode or wider_mode == EDIT))
+
+def motifs_within(motifs, wider):
+    if wider is None:
+        return True
+    if motifs is None:
+        return False
+    threshold, mode, terms = motifs
+    wider_threshold, wider_mode, wider_terms = wider
+    return all(any(motif_within(term, threshold, mode, other, wider_threshold, wider_mode) for other in wider_terms)
+               for term in terms)
+
+def filter_within(key, wider):
+    ranges, starts, names, motifs = key
+    wider_ranges, wider_starts, wider_names, wider_motifs = wider
+    return (ranges_within(ranges, wider_ranges) and wider_starts <= starts
+            and names_within(names, wider_names) and motifs_within(motifs, wider_motifs))
+
+###################### CACHE ##############################
+# (ids, exact) of the smallest cached set holding every record the filter
+# may keep, exact when it was cached for the same filter; None without one
+def cached_records(stamp, args):
+    key = normalize_filter(args)
+    with _lock:
+        if (stamp, key) in _cache:
+            _cache.move_to_end((stamp, key))
+            return _cache[(stamp, key)], True
+        best = None
+        for (cached_stamp, cached_key), ids in _cache.items():
+            if cached_stamp == stamp and filter_within(key, cached_key) and (best is None or len(ids) < len(best[1])):
+                best = ((cached_stamp, cached_key), ids)
+        if best is None:
+            return None
+        _cache.move_to_end(best[0])
+        return best[1], False
+
+def store_records(stamp, args, ids):
+    ids = np.asarray(ids, dtype=np.int64)
+    if ids.nbytes > FILTER_CACHE_BYTES:
+        return
+    key = (stamp, normalize_filter(args))
+    with _lock:
+        _cache[key] = ids
+        _cache.move_to_end(key)
+        while sum(cached.nbytes for cached in _cache.values()) > FILTER_CACHE_BYTES:
+            _cache.popitem(last=False)
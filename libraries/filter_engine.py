@@ -0,0 +1,104 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+import threading
+import sqlite3
+import numpy as np
+from header_metrics import RANGE_FILTERS, START_FILTERS
+from header_index import record_candidates, name_groups
+from motif_match import motif_matchers
+from filter_cache import database_stamp
+
+# The filters of the filtering threads and of fetch_advanced_filtered_sequences.
+# Length, metric and start codon filters are evaluated at once on columns of
+# cleaned.db read into arrays, the name and motif indexes narrow what is
+# left, and only the remaining records are read for the header and
+# sequence checks. The columns are read again after cleaned.db changed.
+# Filter semantics:
+#   ranges       min <= value <= max, records without the metric never match
+#   start codons the first letters of the record, case sensitive
+#   names        every line holds comma separated terms that must all be in
+#                the header (case insensitive), a header matching any line
+#                is kept; blank lines are ignored
+#   motifs       a record holding any of the terms (see motif_match) is
+#                kept; empty terms are ignored
+FILTER_COLUMNS = ", ".join(column for column, *_ in RANGE_FILTERS)
+
+_columns = {}
+_lock = threading.Lock()
+
+###################### COLUMNS ##############################
+# {"rowid": ids, column: values, codon: starts with it} of every record of
+# conn in rowid order; metrics the header does not carry are NaN
+def load_filter_columns(conn):
+    starts = ", ".join(f"seq_start GLOB '{codon}*'" for _, codon in START_FILTERS)
+    rows = np.array(conn.execute(f"SELECT rowid, {FILTER_COLUMNS}, {starts} FROM sequences ORDER BY rowid").fetchall(),
+                    dtype=np.float64).reshape(-1, 1 + len(RANGE_FILTERS) + len(START_FILTERS))
+    columns = {"rowid": rows[:, 0].astype(np.int64)}
+    for i, (column, *_) in enumerate(RANGE_FILTERS, 1):
+        columns[column] = rows[:, i]
+    for i, (_, codon) in enumerate(START_FILTERS, 1 + len(RANGE_FILTERS)):
+        columns[codon] = rows[:, i] == 1
+    return columns
+
+# the columns of db_path, kept while the file does not change
+def filter_columns(db_path="cleaned.db"):
+    stamp = database_stamp(db_path)
+    with _lock:
+        if stamp not in _columns:
+            conn = sqlite3.connect(db_path)
+            columns = load_filter_columns(conn)
+            conn.close()
+            _columns.clear()
+            _columns[stamp] = columns
+        return _columns[stamp]
+
+###################### NUMERIC FILTERS ##############################
+def column_mask(columns, args):
+    mask = np.ones(len(columns["rowid"]), dtype=bool)
+    for column, check, low, high in RANGE_FILTERS:
+        if args.get(check):
+            values = columns[column]
+            mask &= (values >= args[low]) & (values <= args[high])
+    if args.get("check_atg"):
+        for check, codon in START_FILTERS:
+            if args.get(check):
+                mask &= columns[codon]
+    return mask
+
+# ids of the records that pass the numeric filters of args and may pass
+# the name and motif filters (indexes), in id order; only those in subset
+# (cached results) when given
+def filter_candidates(conn, args, columns, subset=None):
+    ids = columns["rowid"][column_mask(columns, args)]
+    candidates = record_candidates(conn, args, name_groups(args.get("name_terms")))
+    if candidates is not None:
+        ids = np.intersect1d(ids, candidates, assume_unique=True)
+    if subset is not None:
+        ids = np.intersect1d(ids, subset, assume_unique=True)
+    return ids
+
+###################### STRING FILTERS ##############################
+# groups are the name_groups of the name filter
+def header_passes(groups, header):
+    if not groups:
+        return True
+    header_lower = header.lower()
+    return any(all(term in header_lower for term in terms) for terms in groups)
+
+# matchers are the motif_matchers of the motif filter
+def sequence_passes(matchers, sequence):
+    if not matchers:
+        return True
+    seq_lower = sequence.lower()
+    return any(matcher.matches(seq_lower) for matcher in matchers)
+
+# get_sequence is only called once the header passed, so records kept on
+# disk are read only when a motif filter needs them
+def passes_filters(header, get_sequence, groups, matchers):
+    return header_passes(groups, header) and (not matchers or sequence_passes(matchers, get_sequence()))
+
+# (groups, matchers) of filter args, built once per run
+def string_filters(args):
+    return name_groups(args.get("name_terms")), motif_matchers(args)
@@ -2,51 +2,144 @@
 # Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski 
 # Licensed under the GPL v3.0 License
 
-from PyQt6.QtCore import QThread
-from filter_worker import FilterWorker
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+from concurrent.futures import ProcessPoolExecutor
+from filter_worker import filter_rowid_range
+from filter_engine import filter_candidates, filter_columns
+from filter_cache import database_stamp, cached_records, store_records
+from fasta_loader import DEFAULT_WORKERS
+import threading
 import sqlite3
-###################### FILTERING USING 2 THREADS ##############################
-def start_parallel_filtering(parent, filter_args, on_done_callback):
+import os
+
+# records per chunk; rowids have gaps after cleaning and filtering, so
+# chunks are cut by record count rather than by rowid span
+FILTER_CHUNK_RECORDS = 20000
+# the first chunks are small so that the first results show at once, they
+# double up to FILTER_CHUNK_RECORDS
+FIRST_CHUNK_RECORDS = 1000
+# how often a run waiting for a chunk looks for an abort
+CANCEL_POLL_SECONDS = 0.05
+
+###################### CHUNKS ##############################
+# ((first id, last id), ids) of consecutive chunks of the filter_candidates
+# of args (only those in subset when given), starting at FIRST_CHUNK_RECORDS
+# and growing to chunk_records. Only records that passed the numeric
+# filters are handed out, so chunks take about as long as one another
+def plan_filter_chunks(conn, args, columns, subset=None, chunk_records=FILTER_CHUNK_RECORDS):
+    ids = filter_candidates(conn, args, columns, subset).tolist()
+    size = min(FIRST_CHUNK_RECORDS, chunk_records)
+    chunks = []
+    start = 0
+    while start < len(ids):
+        chunk = ids[start:start + size]
+        chunks.append(((chunk[0], chunk[-1]), chunk))
+        start += size
+        size = min(size * 2, chunk_records)
+    return chunks
+
+###################### FILTERING IN A PROCESS POOL ##############################
+# The chunks are handed to a pool of processes as the processes become
+# free, so a chunk of slow records does not hold up the others. Results are
+# emitted chunk by chunk in rowid order (chunk_ready) as soon as every
+# chunk before them is done, finished carries all of them. Setting
+# cancelled (from any thread) stops the run: chunks not started are
+# dropped, one running in the filtering thread stops at its next rows and
+# finished carries the results found so far. The ids of complete runs are
+# cached (filter_cache), a filter narrower than a cached one only reads
+# the cached records
+class FilterPoolWorker(QObject):
+    chunk_ready = pyqtSignal(list)
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(list)
+
+    def __init__(self, filter_args, workers=DEFAULT_WORKERS, db_path="cleaned.db"):
+        super().__init__()
+        self.args = filter_args
+        self.workers = workers
+        self.db_path = db_path
+        self.cancelled = threading.Event()
+
+    def run(self):
+        results = []
+
+        try:
+            db_path = os.path.abspath(self.db_path)
+            stamp = database_stamp(db_path)
+            args = self.args
+            subset = None
+            cached = cached_records(stamp, args)
+            if cached is not None:
+                subset, exact = cached
+                # the same filter as before, its records are only read back
+                if exact:
+                    args = {}
+            columns = filter_columns(db_path)
+            conn = sqlite3.connect(db_path)
+            chunks = plan_filter_chunks(conn, args, columns, subset)
+            conn.close()
+
+            if self.workers <= 1 or len(chunks) <= 1:
+                for done, (chunk, ids) in enumerate(chunks, 1):
+                    if self.cancelled.is_set():
+                        break
+                    self.add_chunk(results, filter_rowid_range(chunk, args, db_path, ids, self.cancelled.is_set),
+                                   done, len(chunks))
+            else:
+                pool = ProcessPoolExecutor(max_workers=self.workers)
+                try:
+                    futures = [pool.submit(filter_rowid_range, chunk, args, db_path, ids) for chunk, ids in chunks]
+                    for done, future in enumerate(futures, 1):
+                        while not future.done() and not self.cancelled.wait(CANCEL_POLL_SECONDS):
+                            continue
+                        if self.cancelled.is_set():
+                            break
+                        self.add_chunk(results, future.result(), done, len(chunks))
+                finally:
+                    # chunks already running finish in the background
+                    pool.shutdown(wait=not self.cancelled.is_set(), cancel_futures=True)
+
+            if not self.cancelled.is_set():
+                store_records(stamp, self.args, [row[-1] for row in results])
+
+        except Exception as e:
+            print("FilterPoolWorker error:", e)
+
+        self.finished.emit(results)
+
+    def add_chunk(self, results, chunk_results, done, total):
+        results.extend(chunk_results)
+        if chunk_results:
+            self.chunk_ready.emit(chunk_results)
+        self.progress.emit(done * 100 // total)
+
+###################### FILTERING ##############################
+# on_chunk(results) receives the results as they come, in rowid order,
+# on_done_callback(results) all of them. Returns the worker, whose
+# cancelled event aborts the run
+def start_parallel_filtering(parent, filter_args, on_done_callback, on_chunk=None, on_progress=None, workers=DEFAULT_WORKERS):
     try:
-        conn = sqlite3.connect("cleaned.db")
-        c = conn.cursor()
-        c.execute("SELECT MIN(rowid), MAX(rowid) FROM sequences")
-        min_id, max_id = c.fetchone()
-        conn.close()
-
-        if min_id is None or max_id is None:
-            on_done_callback([])
-            return
-
-        mid_id = (min_id + max_id) // 2
-        id_ranges = [(min_id, mid_id), (mid_id + 1, max_id)]
-
-        parent.threads = []
-        parent.workers = []
-        parent.partial_results = []
-        parent.finished_threads = 0
-
-        def handle_result(result):
-            parent.partial_results.extend(result)
-            parent.finished_threads += 1
-            if parent.finished_threads == 2:
-                on_done_callback(parent.partial_results)
-
-        for id_start, id_end in id_ranges:
-            thread = QThread()
-            worker = FilterWorker((id_start, id_end), filter_args)
-            worker.moveToThread(thread)
-
-            worker.finished.connect(handle_result)
-            thread.started.connect(worker.run)
-            worker.finished.connect(thread.quit)
-            worker.finished.connect(worker.deleteLater)
-            thread.finished.connect(thread.deleteLater)
-
-            parent.threads.append(thread)
-            parent.workers.append(worker)
-            thread.start()
+        thread = QThread()
+        worker = FilterPoolWorker(filter_args, workers)
+        worker.moveToThread(thread)
+
+        if on_chunk:
+            worker.chunk_ready.connect(on_chunk)
+        if on_progress:
+            worker.progress.connect(on_progress)
+        worker.finished.connect(on_done_callback)
+        thread.started.connect(worker.run)
+        worker.finished.connect(thread.quit)
+
+        # an aborted run may still be finishing its chunk, it is kept
+        # until its thread ends
+        runs = [(t, w) for t, w in zip(getattr(parent, "threads", []), getattr(parent, "workers", [])) if t.isRunning()]
+        parent.threads = [t for t, _ in runs] + [thread]
+        parent.workers = [w for _, w in runs] + [worker]
+        thread.start()
+        return worker
 
     except Exception as e:
         print("Error in start_parallel_filtering:", e)
-        on_done_callback([])
\ No newline at end of file
+        on_done_callback([])
+        return None
\ No newline at end of file
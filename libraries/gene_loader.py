@@ -4,7 +4,7 @@
 
 from PyQt6.QtCore import QThread, pyqtSignal
 import sqlite3
-import re
+from header_metrics import METRIC_COLUMNS
 
 class GeneLoaderWorker(QThread):
     finished = pyqtSignal(list, list, list, dict)  # headers, lengths, al_lengths, stats
@@ -25,43 +25,22 @@ class GeneLoaderWorker(QThread):
         try:
             with sqlite3.connect("cleaned.db") as conn:
                 c = conn.cursor()
-                c.execute("SELECT header, sequence FROM sequences")
+                c.execute(f"SELECT header, seq_length, {METRIC_COLUMNS} FROM sequences")
 
-                for header, sequence in c:
-                    seq_len = len(sequence)
+                for header, seq_len, score, e_val, aln_len, idt, pos in c:
                     lengths.append(seq_len)
                     headers.append(f"{header} [{seq_len}]")
                     stats["min_len"] = min(stats["min_len"], seq_len)
                     stats["max_len"] = max(stats["max_len"], seq_len)
 
-                    header_lower = header.lower()
-
-                    def extract(pattern, target, cast_func):
-                        m = re.search(pattern, target)
-                        if m:
-                            try:
-                                return cast_func(m.group(1))
-                            except:
-                                return None
-                        return None
-
-                    score = extract(r"score[:=]?\s*([\d.]+)", header_lower, int)
                     if score is not None:
-                        stats["scores"].append(score)
-
-                    e_val = extract(r"e[- ]?value[:=]?\s*([\d.eE+-]+)", header_lower, float)
+                        stats["scores"].append(int(score))
                     if e_val is not None:
                         stats["e_values"].append(e_val)
-
-                    aln_len = extract(r"alignment length[:=]?\s*(\d+)", header_lower, int)
                     if aln_len is not None:
                         al_lengths.append(aln_len)
-
-                    idt = extract(r"identities[:=]?\s*(\d+)", header_lower, int)
                     if idt is not None:
                         stats["identities"].append(idt)
-
-                    pos = extract(r"positives[:=]?\s*(\d+)", header_lower, int)
                     if pos is not None:
                         stats["positives"].append(pos)
 
@@ -4,10 +4,11 @@
 
 import matplotlib.patches
 import sys
+import os
 from PyQt6.QtWidgets import (
     QListWidgetItem,
     QApplication, QMainWindow, QWidget, QTabWidget, QLabel, QVBoxLayout, QHBoxLayout,
-    QPushButton, QCheckBox, QListWidget, QTextEdit, QLineEdit, QFileDialog, QSpinBox, QDoubleSpinBox,
+    QPushButton, QCheckBox, QListWidget, QTextEdit, QLineEdit, QFileDialog, QSpinBox, QDoubleSpinBox, QComboBox,
     QStatusBar, QFrame, QSpacerItem, QSizePolicy, QDialog, QVBoxLayout, QLabel, QPlainTextEdit, QPushButton
 )
 from PyQt6.QtWidgets import QProgressDialog
@@ -40,15 +41,20 @@ class ChartWidget(QWidget):
         max_eval = 0
 
 ############## LIBRARIES #######################
-from thread_utils import DeleteDuplicatesWorker
-from fasta_utils import load_fasta_file, save_fasta_to_db, fetch_all_sequences, fetch_advanced_filtered_sequences
+from thread_utils import DeleteDuplicatesWorker, LoadFastaWorker, DEDUP_MEMORY_MB
+from fasta_utils import fetch_all_headers
 from draw_utils import draw_length_histogram, draw_bitscore_histogram, draw_evalue_histogram, draw_alength_histogram, draw_identities_histogram, draw_positives_histogram
 from move_utils import move_checked_items
 from blast_utils import load_prev_database, choose_database, choose_database_n, run_blast,run_blastn,run_blastx, save_sequences_from_blast, run_tblastn, run_tblastx, open_sequence_from_xml, show_blast_file, save_blast_output_as
 from blast_view import parse_blast_xml, BlastAlignmentViewer
-from filter_worker import FilterWorker
 from filter_thread import start_parallel_filtering
 from gene_loader import GeneLoaderWorker
+from fasta_loader import DEFAULT_WORKERS
+from fasta_reader import FASTA_FILE_FILTER
+from seq_store import SequenceStore, SEQUENCE_COLUMNS
+from containment import MIN_LENGTH as CONTAINED_MIN_LENGTH
+from duplicates_view import DuplicatesDialog
+from motif_match import MATCH_MODES
 
 class MainWindow(QMainWindow):
 
@@ -58,6 +64,8 @@ class MainWindow(QMainWindow):
         self.threads = []
         self.workers = []
         self.all_results = []
+        # metric values of the records shown in genes_list, for the histograms
+        self.shown_metrics = {"scores": [], "e_values": [], "identities": [], "positives": []}
         min_seq_len = 0
         max_seq_len = 0
         min_score = 0
@@ -145,6 +153,42 @@ class MainWindow(QMainWindow):
         self.show_files_button.clicked.connect(self.show_loaded_files)
         self.show_files_button.setEnabled(False)
         #------------------
+        self.add_files_button = QPushButton("Add FASTA Files")
+        self.add_files_button.setFixedSize(150, 30)
+        self.add_files_button.setToolTip("Append files to the loaded ones. Cleaning again only checks the new records.")
+        self.add_files_button.clicked.connect(lambda: self.load_file(append=True))
+        self.add_files_button.setEnabled(False)
+        #------------------
+        self.workers_box = QSpinBox()
+        self.workers_box.setFixedWidth(70)
+        self.workers_box.setRange(1, max(1, os.cpu_count() or 1))
+        self.workers_box.setValue(DEFAULT_WORKERS)
+        self.memory_box = QSpinBox()
+        self.memory_box.setFixedWidth(90)
+        self.memory_box.setRange(16, 1024 * 1024)
+        self.memory_box.setSingleStep(256)
+        self.memory_box.setValue(DEDUP_MEMORY_MB)
+        self.memory_box.setToolTip("Memory for the keys of the records while cleaning. Larger sets are sorted "
+                                   "in buckets on disk, which is slower but needs no more memory.")
+        workers_row = QHBoxLayout()
+        workers_row.addStretch()
+        workers_row.addWidget(QLabel("Workers:"))
+        workers_row.addWidget(self.workers_box)
+        workers_row.addWidget(QLabel("Memory (MB):"))
+        workers_row.addWidget(self.memory_box)
+        workers_row.addStretch()
+        #------------------
+        self.storage_box = QComboBox()
+        self.storage_box.addItems(["In database", "In database (packed)", "In FASTA files (index)"])
+        self.storage_box.setToolTip("Packed mode stores nucleotides in 2 bits and proteins in 5 bits per residue. "
+                                    "Index mode keeps only the location of each sequence and reads it from the FASTA file when needed. "
+                                    "The files must stay in place and unchanged.")
+        storage_row = QHBoxLayout()
+        storage_row.addStretch()
+        storage_row.addWidget(QLabel("Sequences:"))
+        storage_row.addWidget(self.storage_box)
+        storage_row.addStretch()
+        #------------------
         self.label_checkdup = QLabel("Check duplicates in")
         font_bold2 = self.label_analyse.font()
         font_bold2.setBold(True)
@@ -157,6 +201,39 @@ class MainWindow(QMainWindow):
         #------------------
         self.sequence_box = QCheckBox("Sequences")
         self.sequence_box.setChecked(True)
+        #------------------
+        self.verify_box = QCheckBox("Verify")
+        self.verify_box.setChecked(False)
+        self.verify_box.setToolTip("Duplicates are found by 128-bit digests. "
+                                   "Verify compares every duplicate with the record it matched (slower).")
+        #------------------
+        self.near_box = QCheckBox("Near duplicates, Jaccard ≥")
+        self.near_box.setChecked(False)
+        self.near_box.setToolTip("Also keep one representative (the longest record) of every group of similar sequences. "
+                                 "Similarity is estimated from k-mer MinHash sketches.")
+        self.near_threshold_box = QDoubleSpinBox()
+        self.near_threshold_box.setRange(0.5, 1.0)
+        self.near_threshold_box.setSingleStep(0.01)
+        self.near_threshold_box.setValue(0.9)
+        self.near_threshold_box.setFixedWidth(70)
+        self.near_threshold_box.setEnabled(False)
+        self.near_box.toggled.connect(self.near_threshold_box.setEnabled)
+        self.contained_box = QCheckBox("Fragments")
+        self.contained_box.setChecked(False)
+        self.contained_box.setToolTip("Also remove sequences that are an exact part of a longer sequence. "
+                                      f"Sequences shorter than {CONTAINED_MIN_LENGTH} letters are not checked.")
+        self.motif_index_box = QCheckBox("Motif index")
+        self.motif_index_box.setChecked(False)
+        self.motif_index_box.setToolTip("Index the short words of the cleaned sequences so that searches for sequence "
+                                        "motifs only read the sequences that can hold them. Takes time and disk space "
+                                        "when cleaning, pays off when searching the same set many times.")
+        near_row = QHBoxLayout()
+        near_row.addStretch()
+        near_row.addWidget(self.contained_box)
+        near_row.addWidget(self.near_box)
+        near_row.addWidget(self.near_threshold_box)
+        near_row.addWidget(self.motif_index_box)
+        near_row.addStretch()
         #------------------        
         self.show_removed_button = QPushButton("Show Removed")
         #------------------    
@@ -171,7 +248,9 @@ class MainWindow(QMainWindow):
         #------------------
         checkbox_row.addWidget(self.name_box)
         checkbox_row.addWidget(self.sequence_box)
+        checkbox_row.addWidget(self.verify_box)
         checkbox_row.addWidget(self.show_removed_button)
+        checkbox_row.addWidget(self.show_duplicates_button)
         #------------------
         self.clean_button = QPushButton("Clean/Analyse")
         self.clean_button.setFixedSize(150, 40)
@@ -351,10 +430,14 @@ class MainWindow(QMainWindow):
         left_layout.addWidget(self.label_analyse, alignment=Qt.AlignmentFlag.AlignHCenter)
         left_layout.addWidget(self.load_button, alignment=Qt.AlignmentFlag.AlignHCenter)
         left_layout.addWidget(self.show_files_button, alignment=Qt.AlignmentFlag.AlignHCenter)
+        left_layout.addWidget(self.add_files_button, alignment=Qt.AlignmentFlag.AlignHCenter)
+        left_layout.addLayout(workers_row)
+        left_layout.addLayout(storage_row)
         #left_layout.addWidget(self.label_file_name, alignment=Qt.AlignmentFlag.AlignHCenter)
         left_layout.addWidget(self.make_hor_separator())
         left_layout.addWidget(self.label_checkdup, alignment=Qt.AlignmentFlag.AlignHCenter)
         left_layout.addLayout(checkbox_row)
+        left_layout.addLayout(near_row)
         left_layout.addWidget(self.clean_button, alignment=Qt.AlignmentFlag.AlignHCenter)
         left_layout.addWidget(self.label_status_text, alignment=Qt.AlignmentFlag.AlignHCenter)
         left_layout.addWidget(self.label_removed, alignment=Qt.AlignmentFlag.AlignHCenter)
@@ -437,8 +520,15 @@ class MainWindow(QMainWindow):
         self.accuracy_box.setMaximum(100)
         self.accuracy_box.setValue(100)
         #------------------
+        # same order as MATCH_MODES
+        self.match_mode_box = QComboBox()
+        self.match_mode_box.addItems(["Mismatches", "Mismatches and indels"])
+        self.match_mode_box.setToolTip("Which differences from the motif count against the identity: "
+                                       "substitutions only, or also inserted and missing residues.")
+        #------------------
         self.identity_layout.addWidget(self.label_similarity)
         self.identity_layout.addWidget(self.accuracy_box)
+        self.identity_layout.addWidget(self.match_mode_box)
         #------------------
         self.filter_textbox = QTextEdit()
         self.filter_textbox.setPlaceholderText("Paste one or more names (Names separate by [ENTER], parts of single name separate by [ , ])")
@@ -517,23 +607,23 @@ class MainWindow(QMainWindow):
         #------------------SCORE HISTOGRAM BUTTONS------------------------
         self.Score_histogram_button = QPushButton("Score")
         self.Score_histogram_button.setFixedSize(100, 30)
-        self.Score_histogram_button.clicked.connect(lambda: draw_bitscore_histogram(self.chart3, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Score_histogram_button.clicked.connect(lambda: draw_bitscore_histogram(self.chart3, self.shown_metrics["scores"]))
         self.Score_histogram_button2 = QPushButton("Score")
         self.Score_histogram_button2.setFixedSize(100, 30)
-        self.Score_histogram_button2.clicked.connect(lambda: draw_bitscore_histogram(self.chart2, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Score_histogram_button2.clicked.connect(lambda: draw_bitscore_histogram(self.chart2, self.shown_metrics["scores"]))
         self.Score_histogram_button3 = QPushButton("Score")
         self.Score_histogram_button3.setFixedSize(100, 30)
-        self.Score_histogram_button3.clicked.connect(lambda: draw_bitscore_histogram(self.chart1, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Score_histogram_button3.clicked.connect(lambda: draw_bitscore_histogram(self.chart1, self.shown_metrics["scores"]))
         #------------------EVALUE HISTOGRAM BUTTONS------------------------
         self.Eval_histogram_button = QPushButton("E-value")
         self.Eval_histogram_button.setFixedSize(100, 30)
-        self.Eval_histogram_button.clicked.connect(lambda: draw_evalue_histogram(self.chart3, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Eval_histogram_button.clicked.connect(lambda: draw_evalue_histogram(self.chart3, self.shown_metrics["e_values"]))
         self.Eval_histogram_button2 = QPushButton("E-value")
         self.Eval_histogram_button2.setFixedSize(100, 30)
-        self.Eval_histogram_button2.clicked.connect(lambda: draw_evalue_histogram(self.chart2, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Eval_histogram_button2.clicked.connect(lambda: draw_evalue_histogram(self.chart2, self.shown_metrics["e_values"]))
         self.Eval_histogram_button3 = QPushButton("E-value")
         self.Eval_histogram_button3.setFixedSize(100, 30)
-        self.Eval_histogram_button3.clicked.connect(lambda: draw_evalue_histogram(self.chart1, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Eval_histogram_button3.clicked.connect(lambda: draw_evalue_histogram(self.chart1, self.shown_metrics["e_values"]))
         #------------------ALIGNMENT HISTOGRAM BUTTONS------------------------
         self.ALength_histogram_button = QPushButton("Al. Length")
         self.ALength_histogram_button.setFixedSize(100, 30)
@@ -547,23 +637,23 @@ class MainWindow(QMainWindow):
         #------------------IDENTITY HISTOGRAM BUTTONS------------------------
         self.Identities_histogram_button = QPushButton("Identity")
         self.Identities_histogram_button.setFixedSize(100, 30)
-        self.Identities_histogram_button.clicked.connect(lambda: draw_identities_histogram(self.chart3, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Identities_histogram_button.clicked.connect(lambda: draw_identities_histogram(self.chart3, self.shown_metrics["identities"]))
         self.Identities_histogram_button2 = QPushButton("Identity")
         self.Identities_histogram_button2.setFixedSize(100, 30)
-        self.Identities_histogram_button2.clicked.connect(lambda: draw_identities_histogram(self.chart2, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Identities_histogram_button2.clicked.connect(lambda: draw_identities_histogram(self.chart2, self.shown_metrics["identities"]))
         self.Identities_histogram_button3 = QPushButton("Identity")
         self.Identities_histogram_button3.setFixedSize(100, 30)
-        self.Identities_histogram_button3.clicked.connect(lambda: draw_identities_histogram(self.chart1, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Identities_histogram_button3.clicked.connect(lambda: draw_identities_histogram(self.chart1, self.shown_metrics["identities"]))
         #------------------SIMILARITY HISTOGRAM BUTTONS------------------------
         self.Positives_histogram_button = QPushButton("Similarity")
         self.Positives_histogram_button.setFixedSize(100, 30)
-        self.Positives_histogram_button.clicked.connect(lambda: draw_positives_histogram(self.chart3, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Positives_histogram_button.clicked.connect(lambda: draw_positives_histogram(self.chart3, self.shown_metrics["positives"]))
         self.Positives_histogram_button2 = QPushButton("Similarity")
         self.Positives_histogram_button2.setFixedSize(100, 30)
-        self.Positives_histogram_button2.clicked.connect(lambda: draw_positives_histogram(self.chart2, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Positives_histogram_button2.clicked.connect(lambda: draw_positives_histogram(self.chart2, self.shown_metrics["positives"]))
         self.Positives_histogram_button3 = QPushButton("Similarity")
         self.Positives_histogram_button3.setFixedSize(100, 30)
-        self.Positives_histogram_button3.clicked.connect(lambda: draw_positives_histogram(self.chart1, [self.genes_list.item(i).text() for i in range(self.genes_list.count())]))
+        self.Positives_histogram_button3.clicked.connect(lambda: draw_positives_histogram(self.chart1, self.shown_metrics["positives"]))
         #------------------
         self.Length_histogram_button.setEnabled(False)
         self.Score_histogram_button.setEnabled(False)
@@ -628,67 +718,77 @@ class MainWindow(QMainWindow):
     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<< FUNCTIONS >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>
         
     ######################### LOAD FASTA FILE ########################################
-    def load_file(self):
-        from fasta_utils import load_fasta_file, save_fasta_to_db
-        from PyQt6.QtWidgets import QFileDialog, QMessageBox
-        import sqlite3
-        import os
+    # append=True keeps the loaded files in front of the new ones
+    def load_file(self, append=False):
+        from PyQt6.QtWidgets import QFileDialog
         import time
 
         file_names, _ = QFileDialog.getOpenFileNames(
-            self, "Open FASTA Files", "", "FASTA Files (*.fasta *.fa *.txt);;All Files (*)"
+            self, "Open FASTA Files", "", FASTA_FILE_FILTER
         )
 
         if not file_names:
             return
-        
-        start = time.time()
-        
-        self.loaded_files = file_names
-        self.label_status_text.setText("Files selected")
-        self.clean_button.setEnabled(True)
-        self.save_fasta_button.setEnabled(True)
-        self.analyze_button.setEnabled(False)
-        self.show_files_button.setEnabled(True)
+        if append:
+            file_names = self.loaded_files + file_names
 
-        try:
-            with sqlite3.connect("sequences.db") as conn:
-                c = conn.cursor()
-                c.execute("DROP TABLE IF EXISTS sequences")
-                c.execute("CREATE TABLE sequences (id INTEGER PRIMARY KEY AUTOINCREMENT, header TEXT, sequence TEXT)")
-                conn.commit()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to reset database: {e}")
-            return
+        self.load_start = time.time()
 
-        total_files = len(file_names)
-        self.progress_dialog = QProgressDialog("Loading sequences...", "Cancel", 0, total_files, self)
+        self.progress_dialog = QProgressDialog("Loading sequences...", "Cancel", 0, 100, self)
         self.progress_dialog.setWindowTitle("Loading FASTA")
         self.progress_dialog.setWindowModality(Qt.WindowModality.ApplicationModal)
         self.progress_dialog.setMinimumDuration(0)
+        self.progress_dialog.setAutoClose(False)
+        self.progress_dialog.setAutoReset(False)
         self.progress_dialog.setValue(0)
         self.progress_dialog.show()
-        QApplication.processEvents()
-               
-        for i, file_path in enumerate(file_names):
-            save_fasta_to_db(file_path, db_path="sequences.db", append=True)
-            self.progress_dialog.setValue(i + 1)
-            QApplication.processEvents()
-
-            if self.progress_dialog.wasCanceled():
-                break
 
+        self.load_worker = LoadFastaWorker(file_names, self.workers_box.value(),
+                                           index=self.storage_box.currentIndex() == 2,
+                                           packed=self.storage_box.currentIndex() == 1)
+        self.load_worker.progress_percent.connect(self.progress_dialog.setValue)
+        self.load_worker.progress_text.connect(self.update_progress_text)
+        self.load_worker.finished.connect(lambda counts, rate, completed:
+            self.on_loading_finished(file_names, counts, rate, completed))
+        self.load_worker.failed.connect(self.on_loading_failed)
+        self.progress_dialog.canceled.connect(self.load_worker.cancel)
+        self.load_worker.start()
+
+    def on_loading_finished(self, file_names, counts, rate, completed):
+        from PyQt6.QtWidgets import QMessageBox
+        import time
         self.progress_dialog.close()
+
+        # a cancelled load was rolled back, the previous files stay loaded
+        if not completed:
+            QMessageBox.information(self, "Cancelled", "Loading cancelled.")
+            return
+
+        self.loaded_files = file_names
+        self.label_status_text.setText("Files selected")
+        self.clean_button.setEnabled(True)
+        self.save_fasta_button.setEnabled(True)
+        self.analyze_button.setEnabled(False)
+        self.show_files_button.setEnabled(True)
+        self.add_files_button.setEnabled(True)
+        # duplicates.db points into the previous sequences.db
+        self.show_removed_button.setEnabled(False)
+        self.show_duplicates_button.setEnabled(False)
+
         QMessageBox.information(self, "Done", "All FASTA files loaded.")
 
         self.genes_list.clear()
         self.selected_names_listbox.clear()
         self.min_seq_len = float("inf")
         self.max_seq_len = 0
-        
+
         end = time.time()
-        print(f"Load finished in {end - start:.2f} seconds")
-        
+        print(f"Load finished in {end - self.load_start:.2f} seconds ({sum(counts)} records, {rate:.0f} records/s)")
+
+    def on_loading_failed(self, message):
+        from PyQt6.QtWidgets import QMessageBox
+        self.progress_dialog.close()
+        QMessageBox.critical(self, "Error", f"Failed to load FASTA files: {message}")
         
     def show_loaded_files(self):
         from PyQt6.QtWidgets import QMessageBox
@@ -724,7 +824,12 @@ class MainWindow(QMainWindow):
         self.progress_dialog.setMinimumDuration(0)
         self.progress_dialog.show()
 
-        self.worker = DeleteDuplicatesWorker(check_name, check_sequence)
+        near_threshold = self.near_threshold_box.value() if self.near_box.isChecked() else None
+        self.worker = DeleteDuplicatesWorker(check_name, check_sequence, verify=self.verify_box.isChecked(),
+                                             memory_mb=self.memory_box.value(), workers=self.workers_box.value(),
+                                             near_threshold=near_threshold,
+                                             contained=self.contained_box.isChecked(), incremental=True,
+                                             motif_index=self.motif_index_box.isChecked())
         self.worker.progress_percent.connect(self.update_progress_value)
         self.worker.progress_text.connect(self.update_progress_text)
         self.worker.finished.connect(self.on_cleaning_finished)
@@ -747,6 +852,7 @@ class MainWindow(QMainWindow):
 
         self.hist_lengths = lengths
         self.al_lengths = al_lengths
+        self.shown_metrics = {key: stats[key] for key in ("scores", "e_values", "identities", "positives")}
         self.min_seq_len = stats["min_len"]
         self.max_seq_len = stats["max_len"]
 
@@ -835,65 +941,37 @@ class MainWindow(QMainWindow):
 
     
     def show_removed_sequences(self):
-        from PyQt6.QtWidgets import QDialog, QVBoxLayout, QListWidget, QPushButton
-        import sqlite3
-
-        conn = sqlite3.connect("duplicates.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT header, sequence FROM sequences")
-        records = cursor.fetchall()
-        conn.close()
-
-        #if not records:
-            #return
-
-        dialog = QDialog(self)
-        dialog.setWindowTitle("Removed Sequences")
-        layout = QVBoxLayout(dialog)
-
-        list_widget = QListWidget()
-        for header, seq in records:
-            list_widget.addItem(f"{header} [{len(seq)}]")
-
-        close_btn = QPushButton("Close")
-        close_btn.clicked.connect(dialog.close)
-
-        layout.addWidget(list_widget)
-        layout.addWidget(close_btn)
-
-        dialog.setLayout(layout)
-        dialog.resize(700, 500)
-        dialog.exec()                                                                                  
+        self.show_duplicates_dialog(grouped=False)
 
     def show_duplicate_sequences(self):
-        from PyQt6.QtWidgets import QDialog, QVBoxLayout, QListWidget, QPushButton
-        import sqlite3
+        self.show_duplicates_dialog(grouped=True)
 
-        conn = sqlite3.connect("duplicates.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT header, sequence FROM sequences")
-        records = cursor.fetchall()
-        conn.close()
-
-        dialog = QDialog(self)
-        dialog.setWindowTitle("Duplicate Sequences")
-        layout = QVBoxLayout(dialog)
-
-        list_widget = QListWidget()
-        for header, seq in records:
-            list_widget.addItem(f"{header} [{len(seq)}]")
+    # removed records are read from duplicates.db a page at a time; restored
+    # ones are back in cleaned.db, so the gene list is loaded again
+    def show_duplicates_dialog(self, grouped):
+        from PyQt6.QtWidgets import QProgressDialog
+        from PyQt6.QtCore import Qt
+        import sqlite3
+        import time
 
-        close_btn = QPushButton("Close")
-        close_btn.clicked.connect(dialog.close)
+        dialog = DuplicatesDialog(grouped, self)
+        dialog.exec()
+        if not dialog.restored:
+            return
 
-        layout.addWidget(list_widget)
-        layout.addWidget(close_btn)
+        with sqlite3.connect("sequences.db") as conn:
+            total_before = conn.execute("SELECT COUNT(*) FROM sequences").fetchone()[0]
+        with sqlite3.connect("cleaned.db") as conn:
+            total_after = conn.execute("SELECT COUNT(*) FROM sequences").fetchone()[0]
 
-        dialog.setLayout(layout)
-        dialog.resize(700, 500)
-        dialog.exec()       
+        self.progress_dialog = QProgressDialog("Loading genes...", None, 0, 0, self)
+        self.progress_dialog.setWindowTitle("Restoring Sequences")
+        self.progress_dialog.setWindowModality(Qt.WindowModality.ApplicationModal)
+        self.progress_dialog.setMinimumDuration(0)
+        self.progress_dialog.show()
+        self.start_time = time.time()
+        self.start_loading_genes(total_before, total_after)
 
-        
     ############# ADD GENES TO LIST ############################
     def add_selected_genes(self):
         for i in range(self.genes_list.count()):
@@ -934,7 +1012,7 @@ class MainWindow(QMainWindow):
     ################## RIGHT CLICK ON HEADER ############################
     def show_sequence_context_menu(self, position):
         from PyQt6.QtWidgets import QMenu, QMessageBox
-        from fasta_utils import fetch_all_sequences
+        from fasta_utils import fetch_sequence_by_id
 
         item = self.genes_list.itemAt(position)
         if item is None:
@@ -949,11 +1027,9 @@ class MainWindow(QMainWindow):
             full_text = item.text().split(" [")[0].strip()
             header_text = full_text.split()[0]  
 
-            for header, seq in fetch_all_sequences("cleaned.db"):
-                header_main = header.strip().split()[0] 
-                if header_main == header_text:
-                    self.show_sequence_dialog(header, seq)
-                    break
+            found = fetch_sequence_by_id(header_text, "cleaned.db")
+            if found:
+                self.show_sequence_dialog(*found)
             else:
                 QMessageBox.warning(self, "Not found", "Sequence not found in database.")
 
@@ -999,6 +1075,7 @@ class MainWindow(QMainWindow):
             "name_terms": name_terms,
             "seq_terms": seq_terms,
             "similarity_threshold": self.accuracy_box.value(),
+            "match_mode": MATCH_MODES[self.match_mode_box.currentIndex()],
 
             "check_length": self.length_checkbox_obj.isChecked(),
             "min_len": self.len_box_low.value(),
@@ -1032,20 +1109,32 @@ class MainWindow(QMainWindow):
         
         self.genes_list.clear()
         self.amount_label.setText("Filtering...")
-        self.progress_dialog = QProgressDialog("Filtering...", "Abort", 0, 0, self)
+        self.progress_dialog = QProgressDialog("Filtering...", "Abort", 0, 100, self)
         self.progress_dialog.setWindowModality(Qt.WindowModality.ApplicationModal)
         self.progress_dialog.show()
 
+        # results arrive chunk by chunk in rowid order
+        def on_chunk(results):
+            self.genes_list.addItems([f"{header} [{seq_length}]" for header, seq_length, *_ in results])
+            self.amount_label.setText(f"Filtering... found {self.genes_list.count()} records")
+
         def on_done(results):
+            aborted = worker is not None and worker.cancelled.is_set()
             self.progress_dialog.close()
-            self.genes_list.clear()
-            for header, sequence in results:
-                self.genes_list.addItem(f"{header} [{len(sequence)}]")
-            self.amount_label.setText(f"Found: {len(results)} records")
+            self.set_shown_metrics(results)
+            if aborted:
+                self.amount_label.setText(f"Aborted: found {len(results)} records")
+            else:
+                self.amount_label.setText(f"Found: {len(results)} records")
             end = time.time()
             print(f"Filtered in {end - start:.2f} seconds")
 
-        start_parallel_filtering(self, filter_args, on_done)
+        worker = None
+        worker = start_parallel_filtering(self, filter_args, on_done, on_chunk, self.progress_dialog.setValue,
+                                          workers=self.workers_box.value())
+        if worker is not None:
+            # set from the GUI thread, the worker looks at it between rows
+            self.progress_dialog.canceled.connect(worker.cancelled.set)
     
     
         
@@ -1082,10 +1171,11 @@ class MainWindow(QMainWindow):
                     self.s_progress.setMaximum(total_records)
 
                     matched_count = 0
-                    c.execute("SELECT header, sequence FROM sequences")
+                    c.execute(f"SELECT header, {SEQUENCE_COLUMNS} FROM sequences")
+                    store = SequenceStore(conn)
 
                     with open(file_name, "w", encoding="utf-8") as f:
-                        for i, (header, sequence) in enumerate(c):
+                        for i, (header, *location) in enumerate(c):
                             
                             if self.s_progress.wasCanceled():
                                 break
@@ -1094,6 +1184,7 @@ class MainWindow(QMainWindow):
                             header_id = header_stripped.split()[0]
 
                             if header_id in selected_ids:
+                                sequence = store.sequence(*location)
                                 f.write(f">{header_stripped}\n")
                                 for j in range(0, len(sequence), 60):
                                     f.write(sequence[j:j+60] + "\n")
@@ -1102,6 +1193,7 @@ class MainWindow(QMainWindow):
                             if i % 50 == 0 or i == total_records - 1:
                                 self.s_progress.setValue(i + 1)
                                 QApplication.processEvents()
+                    store.close()
 
                 self.s_progress.close()
 
@@ -1140,6 +1232,7 @@ class MainWindow(QMainWindow):
         self.filter_textbox.clear()
         self.sequence_textbox.clear()
         self.accuracy_box.setValue(100)
+        self.match_mode_box.setCurrentIndex(0)
         self.len_box_low.setValue(0)
         self.len_box_hi.setValue(900000)
         self.length_checkbox_obj.setChecked(False)
@@ -1152,13 +1245,23 @@ class MainWindow(QMainWindow):
         self.genes_list.clear()
         self.len_box_low.setValue(self.min_seq_len)
         self.len_box_hi.setValue(self.max_seq_len)
-        sequences = fetch_all_sequences("cleaned.db")
-        for header, sequence in sequences:
-            item = QListWidgetItem(f"{header} [{len(sequence)}]")
+        rows = fetch_all_headers("cleaned.db")
+        for header, seq_length, *_ in rows:
+            item = QListWidgetItem(f"{header} [{seq_length}]")
             item.setFlags(item.flags() | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsEnabled)
             self.genes_list.addItem(item)
+        self.set_shown_metrics(rows)
 
         self.amount_label.setText(f"Records: {self.genes_list.count()}")
+
+    # rows are (header, seq_length, score, evalue, align_len, identities, positives)
+    def set_shown_metrics(self, rows):
+        self.shown_metrics = {
+            "scores": [row[2] for row in rows if row[2] is not None],
+            "e_values": [row[3] for row in rows if row[3] is not None],
+            "identities": [row[5] for row in rows if row[5] is not None],
+            "positives": [row[6] for row in rows if row[6] is not None],
+        }
         
         
     ############## HISTOGRAM CLICK ############################
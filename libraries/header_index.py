@@ -0,0 +1,83 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+import numpy as np
+from seq_store import has_table
+from motif_index import motif_candidates
+
+# Name filters look the headers of cleaned.db up in an FTS5 table with the
+# trigram tokenizer, which finds any substring of three or more letters
+# regardless of case. The table reads the headers from the sequences table
+# (external content) and triggers keep it in step with every insert and
+# delete. Every line of a name filter is a group of comma separated terms
+# that must all be in the header, a header matching any line is kept.
+# Terms shorter than three letters or outside ASCII cannot be looked up and
+# are left to the header check, which still runs on every hit
+TRIGRAM = 3
+HEADER_TRIGGERS = ("headers_fts_insert", "headers_fts_delete", "headers_fts_update")
+
+###################### TABLES ##############################
+def drop_header_index(c):
+    for trigger in HEADER_TRIGGERS:
+        c.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    c.execute("DROP TABLE IF EXISTS headers_fts")
+
+# indexes the records already in the table, later ones through the triggers
+def create_header_index(c):
+    drop_header_index(c)
+    c.execute("CREATE VIRTUAL TABLE headers_fts USING fts5(header, content='sequences', content_rowid='id', tokenize='trigram')")
+    c.execute("INSERT INTO headers_fts (headers_fts) VALUES ('rebuild')")
+    c.execute("""
+        CREATE TRIGGER headers_fts_insert AFTER INSERT ON sequences BEGIN
+            INSERT INTO headers_fts (rowid, header) VALUES (new.id, new.header);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER headers_fts_delete AFTER DELETE ON sequences BEGIN
+            INSERT INTO headers_fts (headers_fts, rowid, header) VALUES ('delete', old.id, old.header);
+        END
+    """)
+    c.execute("""
+        CREATE TRIGGER headers_fts_update AFTER UPDATE OF header ON sequences BEGIN
+            INSERT INTO headers_fts (headers_fts, rowid, header) VALUES ('delete', old.id, old.header);
+            INSERT INTO headers_fts (rowid, header) VALUES (new.id, new.header);
+        END
+    """)
+
+###################### SEARCHING ##############################
+# the lowercased terms of every non-blank line of name_terms, as the
+# filters read them
+def name_groups(name_terms):
+    groups = [[t.strip().lower() for t in line.split(",") if t.strip()] for line in name_terms or []]
+    return [terms for terms in groups if terms]
+
+# FTS query of the groups, None when a group has no term to look up
+def header_match_query(groups):
+    clauses = []
+    for terms in groups:
+        usable = ['"' + term.replace('"', '""') + '"' for term in terms if len(term) >= TRIGRAM and term.isascii()]
+        if not usable:
+            return None
+        clauses.append("(" + " AND ".join(usable) + ")")
+    return " OR ".join(clauses) or None
+
+# ids of the records whose headers may match the groups in id order, None
+# without an index or a query
+def name_candidates(conn, groups):
+    query = header_match_query(groups)
+    if query is None or not has_table(conn, "headers_fts"):
+        return None
+    return [row[0] for row in conn.execute("SELECT rowid FROM headers_fts WHERE headers_fts MATCH ? ORDER BY rowid", (query,))]
+
+# ids of the records that may pass the name and motif filters of args, in
+# id order, None when every record may; groups are the name_groups of the
+# name filter
+def record_candidates(conn, args, groups):
+    motifs = motif_candidates(conn, args)
+    names = name_candidates(conn, groups)
+    if names is None:
+        return motifs
+    if motifs is None:
+        return names
+    return np.intersect1d(motifs, names).astype(np.int64).tolist()
@@ -0,0 +1,61 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+import re
+
+# BLAST metrics written into headers by blast_parser.parse_blast_output
+# ("[Length: .., Score: .., E-Value: .., ...]"). They are parsed once at
+# ingest into typed columns, everything after that reads the columns
+METRIC_COLUMNS = "score, evalue, align_len, identities, positives"
+HEADER_COLUMNS = METRIC_COLUMNS + ", accession"
+
+METRIC_PATTERNS = [
+    (re.compile(r"score[:=]?\s*([\d.]+)"), float),
+    (re.compile(r"e[- ]?value[:=]?\s*([\d.eE+-]+)"), float),
+    (re.compile(r"alignment length[:=]?\s*(\d+)"), int),
+    (re.compile(r"identities[:=]?\s*(\d+)"), int),
+    (re.compile(r"positives[:=]?\s*(\d+)"), int),
+]
+
+# filter_args keys of every indexed column: (column, check, min, max)
+RANGE_FILTERS = [
+    ("seq_length", "check_length", "min_len", "max_len"),
+    ("score", "check_score", "min_score", "max_score"),
+    ("evalue", "check_eval", "min_eval", "max_eval"),
+    ("align_len", "check_alength", "min_alength", "max_alength"),
+    ("identities", "check_identities", "min_identities", "max_identities"),
+    ("positives", "check_positives", "min_positives", "max_positives"),
+]
+
+# filter_args keys of the start codon checks: (check, first letters)
+START_FILTERS = [
+    ("check_m", "M"),
+    ("check_atg_dna", "ATG"),
+]
+
+###################### PARSING ##############################
+# (score, evalue, align_len, identities, positives, accession), None for
+# metrics the header does not carry. The accession is the first word of the
+# header, the id used to pick records in the GUI
+def parse_header_metrics(header):
+    header_lower = header.lower()
+    values = []
+    for pattern, cast in METRIC_PATTERNS:
+        m = pattern.search(header_lower)
+        try:
+            values.append(cast(m.group(1)) if m else None)
+        except ValueError:
+            values.append(None)
+    fields = header.split(None, 1)
+    values.append(fields[0] if fields else "")
+    return tuple(values)
+
+def with_header_metrics(rows):
+    for row in rows:
+        yield row + parse_header_metrics(row[0])
+
+###################### INDEXES ##############################
+def create_metric_indexes(c, table="sequences"):
+    for column in ["seq_length", *METRIC_COLUMNS.split(", "), "accession"]:
+        c.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
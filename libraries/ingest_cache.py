@@ -0,0 +1,235 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+import sqlite3
+import time
+import os
+from fasta_loader import load_fasta_files, DEFAULT_WORKERS
+from fasta_reader import block_digest, fingerprint, FINGERPRINT_BLOCK
+from fasta_utils import create_sequences_table, tune_for_ingest, ROW_COLUMNS
+from seq_store import create_sources_table, has_table
+from header_metrics import create_metric_indexes
+
+# bump whenever the layout of sequences.db changes, older caches are dropped
+CACHE_VERSION = 5
+
+###################### FINGERPRINTS ##############################
+# the same hash the loader computes from the blocks it parses
+def file_hash(path):
+    digests = []
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(FINGERPRINT_BLOCK)
+            if not block:
+                break
+            digests.append(block_digest(block))
+    return fingerprint(digests)
+
+def file_table(file_id):
+    return f"file_{file_id}"
+
+def create_manifest(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_manifest (
+            file_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            path TEXT UNIQUE,
+            size INTEGER,
+            mtime REAL,
+            hash TEXT,
+            records INTEGER,
+            indexed INTEGER,
+            packed INTEGER,
+            version INTEGER
+        )
+    """)
+    c.execute("CREATE TABLE IF NOT EXISTS ingest_session (position INTEGER PRIMARY KEY, file_id INTEGER)")
+
+# Returns the cached file_id for path, or None when it has to be parsed.
+# size + mtime decide without reading the file; a touched file with the
+# same size is still reused when its content hash did not change
+def lookup_cached(c, path, size, mtime, index, packed):
+    row = c.execute("SELECT file_id, size, mtime, hash, indexed, packed, version FROM ingest_manifest WHERE path = ?",
+                    (path,)).fetchone()
+    if row is None:
+        return None
+
+    file_id, cached_size, cached_mtime, cached_hash, indexed, cached_packed, version = row
+    if version != CACHE_VERSION or cached_size != size or bool(indexed) != index or bool(cached_packed) != packed:
+        return None
+    if cached_mtime == mtime:
+        return file_id
+
+    if file_hash(path) != cached_hash:
+        return None
+    c.execute("UPDATE ingest_manifest SET mtime = ? WHERE file_id = ?", (mtime, file_id))
+    return file_id
+
+# files that disappeared from disk can never be reused
+def prune_missing(c):
+    rows = c.execute("SELECT file_id, path FROM ingest_manifest").fetchall()
+    for file_id, path in rows:
+        if not os.path.exists(path):
+            c.execute(f"DROP TABLE IF EXISTS {file_table(file_id)}")
+            c.execute("DELETE FROM ingest_manifest WHERE file_id = ?", (file_id,))
+
+def open_cache(db_path):
+    existed = os.path.exists(db_path) and os.path.getsize(db_path) > 0
+    conn = sqlite3.connect(db_path)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == CACHE_VERSION:
+            create_manifest(conn.cursor())
+            conn.execute("SELECT COUNT(*) FROM ingest_manifest").fetchone()
+            return conn
+        if existed:
+            print(f"Discarding {db_path} written by an older version")
+    except sqlite3.DatabaseError as e:
+        # the cache is written without a durable journal; start over if a
+        # crash left it unreadable
+        print(f"Discarding unreadable {db_path}: {e}")
+
+    conn.close()
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+    create_manifest(conn.cursor())
+    return conn
+
+# (file_id, hash, indexed, packed) of the files of the loaded session in
+# order, None when db_path was not loaded through the cache
+def session_files(conn):
+    if not has_table(conn, "ingest_session"):
+        return None
+    return conn.execute("""
+        SELECT m.file_id, m.hash, m.indexed, m.packed FROM ingest_session s
+        JOIN ingest_manifest m ON m.file_id = s.file_id
+        ORDER BY s.position
+    """).fetchall()
+
+###################### LOADING WITH CACHE ##############################
+# Loads file_paths into the sequences table of db_path. Every file lives in
+# its own file_<id> table described by ingest_manifest; only new or changed
+# files are parsed, the rest is copied from their tables. Reloading the same
+# unchanged file list keeps the sequences table as it is, files added to
+# the end of it are appended. With index=True
+# sequences stay in the FASTA files, with packed=True they are stored as
+# seq_codec BLOBs (see fasta_reader.read_fasta_rows). Progress and
+# cancelling work as in fasta_loader.load_fasta_files; files taken from the
+# cache are reported as done right away
+def load_fasta_files_cached(file_paths, db_path="sequences.db", workers=DEFAULT_WORKERS, progress_callback=None, index=False, packed=False):
+    start_time = time.time()
+    paths = [os.path.abspath(p) for p in file_paths]
+
+    conn = open_cache(db_path)
+    try:
+        tune_for_ingest(conn)
+        c = conn.cursor()
+        prune_missing(c)
+
+        file_ids = []
+        to_parse = []
+        parsed_ids = {}
+        for file_index, path in enumerate(paths):
+            if path in parsed_ids:
+                file_ids.append(parsed_ids[path])
+                continue
+            st = os.stat(path)
+            file_id = lookup_cached(c, path, st.st_size, st.st_mtime, index, packed)
+            if file_id is None:
+                c.execute("""
+                    INSERT INTO ingest_manifest (path, size, mtime, hash, records, version)
+                    VALUES (?, ?, ?, NULL, NULL, NULL)
+                    ON CONFLICT(path) DO UPDATE SET version = NULL
+                """, (path, st.st_size, st.st_mtime))
+                file_id = c.execute("SELECT file_id FROM ingest_manifest WHERE path = ?", (path,)).fetchone()[0]
+                create_sequences_table(c, drop=True, table=file_table(file_id))
+                to_parse.append((file_index, file_id, st, []))
+                parsed_ids[path] = file_id
+            file_ids.append(file_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+    counts = [None] * len(paths)
+    rate = 0.0
+    reused = len(paths) - len(to_parse)
+    if progress_callback:
+        parsing = {file_index for file_index, _, _, _ in to_parse}
+        for file_index in range(len(paths)):
+            if file_index not in parsing:
+                progress_callback(file_index, 1.0, 0)
+
+    if to_parse:
+        def on_progress(parse_index, fraction, records):
+            if progress_callback:
+                return progress_callback(to_parse[parse_index][0], fraction, records)
+
+        parsed_counts, rate, completed = load_fasta_files(
+            [paths[i] for i, _, _, _ in to_parse], db_path, workers, on_progress,
+            tables=[file_table(file_id) for _, file_id, _, _ in to_parse], index=index, packed=packed,
+            digests=[digests for _, _, _, digests in to_parse])
+
+        # a cancelled load was rolled back: the parsed files stay unversioned
+        # in the manifest and the previous sequences table is left as it was
+        if not completed:
+            return [0] * len(paths), rate, False
+
+        for (file_index, _, _, _), count in zip(to_parse, parsed_counts):
+            counts[file_index] = count
+
+    conn = sqlite3.connect(db_path)
+    try:
+        tune_for_ingest(conn)
+        c = conn.cursor()
+
+        # the hashes were taken while parsing, the files are not read again
+        for file_index, file_id, st, digests in to_parse:
+            c.execute("UPDATE ingest_manifest SET size = ?, mtime = ?, hash = ?, records = ?, indexed = ?, packed = ?, version = ? WHERE file_id = ?",
+                      (st.st_size, st.st_mtime, fingerprint(digests),
+                       counts[file_index], int(index), int(packed), CACHE_VERSION, file_id))
+
+        for file_index, file_id in enumerate(file_ids):
+            if counts[file_index] is None:
+                counts[file_index] = c.execute("SELECT records FROM ingest_manifest WHERE file_id = ?",
+                                               (file_id,)).fetchone()[0] or 0
+
+        session = file_ids
+        previous = [row[0] for row in c.execute("SELECT file_id FROM ingest_session ORDER BY position")]
+        has_sequences = c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sequences'").fetchone()
+
+        if session != previous or to_parse or not has_sequences:
+            # files added after an unchanged session are only appended, the
+            # records loaded before keep their ids
+            first = 0
+            if (has_sequences and session[:len(previous)] == previous
+                    and not {file_id for _, file_id, _, _ in to_parse} & set(previous)):
+                first = len(previous)
+            else:
+                create_sequences_table(c, drop=True)
+                create_sources_table(c, drop=True)
+
+            added = session[first:]
+            for file_id in added:
+                c.execute(f"""
+                    INSERT INTO sequences ({ROW_COLUMNS}, source_id)
+                    SELECT {ROW_COLUMNS}, ? FROM {file_table(file_id)} ORDER BY id
+                """, (file_id,))
+            create_metric_indexes(c)
+            c.execute(f"""
+                INSERT OR IGNORE INTO sources (source_id, path)
+                SELECT file_id, path FROM ingest_manifest
+                WHERE file_id IN ({",".join("?" * len(added))})
+            """, added)
+            c.execute("DELETE FROM ingest_session WHERE position >= ?", (first,))
+            c.executemany("INSERT INTO ingest_session (position, file_id) VALUES (?, ?)",
+                          list(enumerate(session))[first:])
+
+        conn.commit()
+    finally:
+        conn.close()
+
+    elapsed = time.time() - start_time
+    print(f"Loaded {len(paths)} files ({reused} from cache) in {elapsed:.2f} s")
+    return counts, rate, True
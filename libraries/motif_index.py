@@ -0,0 +1,170 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+import json
+import numpy as np
+from near_duplicates import kmer_hashes, NUCLEOTIDE_LETTERS
+from seq_store import SequenceStore, SEQUENCE_COLUMNS, has_table
+from motif_match import motif_matchers
+
+# Optional inverted index of the k-mers of cleaned.db, built by the Cleaner
+# after the duplicates are gone. Each k-mer lists the ids of the records
+# holding it (uint32, id order), in one row per batch of records. Proteins
+# and nucleotides are indexed with their own k, the set may hold both. A motif
+# with k errors leaves at least one of its k + 1 pieces intact (see
+# motif_match), so only records holding every k-mer of some piece are
+# candidates, and only those are read and matched. k-mers are keyed by the
+# upper 32 bits of their hash; a collision only adds candidates.
+# The index is dropped whenever records are written to cleaned.db and is
+# not used when its record count does not match, searches then read every
+# record as without it
+PROTEIN_KMER = 3
+NUCLEOTIDE_KMER = 8
+# letters of the records indexed at once
+INDEX_BATCH_LETTERS = 1 << 23
+
+###################### TABLES ##############################
+def drop_motif_index(c):
+    c.execute("DROP TABLE IF EXISTS motif_kmers")
+    c.execute("DROP TABLE IF EXISTS motif_index_state")
+
+def create_motif_index(c):
+    drop_motif_index(c)
+    c.execute("""
+        CREATE TABLE motif_kmers (
+            kmer_size INTEGER, kmer INTEGER, batch INTEGER, ids BLOB,
+            PRIMARY KEY (kmer_size, kmer, batch)
+        ) WITHOUT ROWID
+    """)
+    # the records indexed with every k
+    c.execute("CREATE TABLE motif_index_state (kmer_size INTEGER PRIMARY KEY, records INTEGER, ids BLOB)")
+
+# {k: records} of a usable index of conn, None without one
+def motif_index_kmers(conn):
+    if not has_table(conn, "motif_index_state"):
+        return None
+    state = dict(conn.execute("SELECT kmer_size, records FROM motif_index_state WHERE records > 0").fetchall())
+    if sum(state.values()) != conn.execute("SELECT COUNT(*) FROM sequences").fetchone()[0]:
+        return None
+    return state
+
+###################### BUILDING ##############################
+# upper case sequence
+def index_kmer_size(sequence):
+    if len(sequence.translate(None, NUCLEOTIDE_LETTERS)) * 10 <= len(sequence):
+        return NUCLEOTIDE_KMER
+    return PROTEIN_KMER
+
+# (kmer_size, kmer, batch, ids) rows of one batch of records
+def posting_rows(ids, sequences, k, batch):
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(sequence) for sequence in sequences])
+    joined = b"".join(sequences)
+    if len(joined) < k:
+        return []
+
+    hashes = kmer_hashes(joined, k) >> np.uint64(32)
+    positions = np.arange(len(hashes))
+    record = np.searchsorted(offsets, positions, side="right") - 1
+    # k-mers running from one sequence into the next
+    inside = positions + k <= offsets[record + 1]
+    pairs = (hashes[inside] << np.uint64(32)) | record[inside].astype(np.uint64)
+    pairs.sort()
+    pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+
+    kmers = (pairs >> np.uint64(32)).astype(np.int64)
+    record_ids = np.asarray(ids, dtype=np.uint32)[(pairs & np.uint64(0xFFFFFFFF)).astype(np.int64)]
+    starts = np.flatnonzero(np.concatenate(([True], kmers[1:] != kmers[:-1])))
+    ends = np.append(starts[1:], len(kmers))
+    return [(k, int(kmers[start]), batch, record_ids[start:end].tobytes())
+            for start, end in zip(starts.tolist(), ends.tolist())]
+
+# Indexes every record of conn's sequences table; progress(fraction) is
+# called batch by batch
+def build_motif_index(conn, progress=None):
+    c = conn.cursor()
+    create_motif_index(c)
+    total = conn.execute("SELECT COUNT(*) FROM sequences").fetchone()[0]
+    store = SequenceStore(conn)
+    rows = conn.cursor().execute(f"SELECT id, {SEQUENCE_COLUMNS} FROM sequences ORDER BY id")
+
+    kinds = {PROTEIN_KMER: ([], []), NUCLEOTIDE_KMER: ([], [])}
+    records = {k: [] for k in kinds}
+    batch = 0
+    done = 0
+    letters = 0
+
+    def flush():
+        for k, (ids, sequences) in kinds.items():
+            c.executemany("INSERT INTO motif_kmers (kmer_size, kmer, batch, ids) VALUES (?, ?, ?, ?)",
+                          posting_rows(ids, sequences, k, batch))
+            ids.clear()
+            sequences.clear()
+        if progress:
+            progress(done / max(total, 1))
+
+    for record_id, *location in rows:
+        sequence = store.sequence(*location).encode("utf-8", errors="replace").upper()
+        k = index_kmer_size(sequence)
+        kinds[k][0].append(record_id)
+        kinds[k][1].append(sequence)
+        records[k].append(record_id)
+        letters += len(sequence)
+        done += 1
+        if letters >= INDEX_BATCH_LETTERS:
+            flush()
+            batch += 1
+            letters = 0
+    flush()
+    store.close()
+
+    c.executemany("INSERT INTO motif_index_state (kmer_size, records, ids) VALUES (?, ?, ?)",
+                  [(k, len(ids), np.asarray(ids, dtype=np.uint32).tobytes()) for k, ids in records.items()])
+    conn.commit()
+
+###################### SEARCHING ##############################
+# ids of the records indexed with k holding every k-mer of piece
+def piece_candidates(conn, piece, k):
+    kmers = np.unique(kmer_hashes(piece.upper().encode("utf-8", errors="replace"), k) >> np.uint64(32))
+    postings = []
+    for kmer in kmers.tolist():
+        blobs = conn.execute("SELECT ids FROM motif_kmers WHERE kmer_size = ? AND kmer = ? ORDER BY batch",
+                             (k, kmer)).fetchall()
+        postings.append(np.frombuffer(b"".join(blob for blob, in blobs), dtype=np.uint32))
+        if not len(postings[-1]):
+            return postings[-1]
+    postings.sort(key=len)
+    found = postings[0]
+    for posting in postings[1:]:
+        found = np.intersect1d(found, posting, assume_unique=True)
+        if not len(found):
+            break
+    return found
+
+# Ids of the records that may hold one of the seq_terms of filter args, in
+# id order. Records indexed with a k longer than the pieces of a term are
+# all candidates. None when the index cannot narrow the search: there is
+# no usable index or every record would be a candidate
+def motif_candidates(conn, args):
+    matchers = motif_matchers(args)
+    kmers = motif_index_kmers(conn)
+    if not matchers or kmers is None or any(matcher.errors >= matcher.length for matcher in matchers):
+        return None
+    shortest = min(len(piece) for matcher in matchers for piece in matcher.pieces)
+    if all(k > shortest for k in kmers):
+        return None
+
+    found = [np.zeros(0, dtype=np.uint32)]
+    for k in kmers:
+        if k > shortest:
+            found.append(np.frombuffer(conn.execute("SELECT ids FROM motif_index_state WHERE kmer_size = ?",
+                                                    (k,)).fetchone()[0], dtype=np.uint32))
+            continue
+        found += [piece_candidates(conn, piece, k) for matcher in matchers for piece in matcher.pieces]
+    return np.unique(np.concatenate(found)).astype(np.int64).tolist()
+
+# condition and parameter limiting a query to ids, for candidates too many
+# to pass one by one
+def ids_condition(ids, column="rowid"):
+    return f"{column} IN (SELECT value FROM json_each(?))", json.dumps(ids)
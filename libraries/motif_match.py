@@ -0,0 +1,112 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+# Motif terms are matched with up to k errors, k being the share of the term
+# allowed to differ by the similarity threshold. HAMMING counts mismatches
+# of a window as long as the term (shift-add, Baeza-Yates and Gonnet),
+# EDIT counts mismatches, insertions and deletions (Myers' bit-vector
+# algorithm). Both keep one bit field per term position in a Python int and
+# update all of them with a few operations per letter. A term with k errors
+# split into k + 1 pieces leaves at least one piece untouched, so
+# sequences holding none of the pieces are skipped with plain substring
+# searches
+HAMMING = "hamming"
+EDIT = "edit"
+MATCH_MODES = (HAMMING, EDIT)
+
+def max_errors(term_length, similarity_threshold):
+    return int((1 - similarity_threshold / 100) * term_length)
+
+###################### MATCHING ##############################
+# Terms are lowercased, sequences are matched as given and are expected
+# to be lowercase as well
+class MotifMatcher:
+    def __init__(self, term, similarity_threshold=100, mode=HAMMING):
+        if mode not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode: {mode}")
+        self.term = term.lower()
+        self.mode = mode
+        self.length = len(self.term)
+        self.errors = max_errors(self.length, similarity_threshold)
+
+        pieces = min(self.errors + 1, self.length)
+        bounds = [self.length * i // pieces for i in range(pieces + 1)]
+        self.pieces = [self.term[start:end] for start, end in zip(bounds, bounds[1:])]
+
+        if mode == HAMMING:
+            # one field per term position wide enough to count to length
+            self.field = max(1, self.length.bit_length())
+            self.mask = (1 << self.field * self.length) - 1
+            self.top = self.field * (self.length - 1)
+            self.unmatched = sum(1 << self.field * i for i in range(self.length))
+            self.table = {}
+            for char in set(self.term):
+                self.table[char] = sum(1 << self.field * i for i, t in enumerate(self.term) if t != char)
+        else:
+            self.mask = (1 << self.length) - 1
+            self.high = 1 << max(self.length - 1, 0)
+            self.peq = {}
+            for i, char in enumerate(self.term):
+                self.peq[char] = self.peq.get(char, 0) | (1 << i)
+
+    def matches(self, sequence):
+        if self.errors == 0:
+            return self.term in sequence
+        if self.errors >= self.length:
+            return self.mode == EDIT or len(sequence) >= self.length
+        if not any(piece in sequence for piece in self.pieces):
+            return False
+        if self.mode == HAMMING:
+            return self.hamming_match(sequence)
+        return self.edit_match(sequence)
+
+    # field i holds the mismatches of term[:i + 1] against the letters
+    # ending at the current one; field length - 1 is complete once length
+    # letters have been read
+    def hamming_match(self, sequence):
+        if len(sequence) < self.length:
+            return False
+        field, mask, table, unmatched = self.field, self.mask, self.table, self.unmatched
+        state = 0
+        for char in sequence[:self.length - 1]:
+            state = ((state << field) + table.get(char, unmatched)) & mask
+        top, errors = self.top, self.errors
+        for char in sequence[self.length - 1:]:
+            state = ((state << field) + table.get(char, unmatched)) & mask
+            if state >> top <= errors:
+                return True
+        return False
+
+    # vertical deltas of the last column of the edit distance matrix as
+    # positive (pv) and negative (mv) bit vectors; score is the distance of
+    # the whole term ending at the current letter, the term may start
+    # anywhere in the sequence
+    def edit_match(self, sequence):
+        mask, high, peq, errors = self.mask, self.high, self.peq, self.errors
+        pv = mask
+        mv = 0
+        score = self.length
+        for char in sequence:
+            eq = peq.get(char, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | (~(xh | pv) & mask)
+            mh = pv & xh
+            if ph & high:
+                score += 1
+            elif mh & high:
+                score -= 1
+            ph = (ph << 1) & mask
+            mh = (mh << 1) & mask
+            pv = mh | (~(xv | ph) & mask)
+            mv = ph & xv
+            if score <= errors:
+                return True
+        return False
+
+# matchers of the non-empty seq_terms of filter args
+def motif_matchers(args):
+    threshold = args.get("similarity_threshold", 100)
+    mode = args.get("match_mode", HAMMING)
+    return [MotifMatcher(term, threshold, mode) for term in args.get("seq_terms") or [] if term]
@@ -0,0 +1,155 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Near duplicates are found with MinHash sketches of the k-mer sets of the
+# sequences: two sketches agree at one position with the probability of the
+# Jaccard similarity of the two sets. Sketches are bucketed by bands (LSH),
+# only records sharing a bucket are compared, so the work grows with the
+# number of records and not with the number of pairs.
+# The sketches use one permutation hashing: every k-mer is hashed once and
+# the hash picks one of NUM_HASHES bins, which keeps its minimum. Bins left
+# empty by short sequences borrow the next filled bin (densification)
+NUM_HASHES = 64
+BIN_BITS = 6
+PROTEIN_KMER = 5
+NUCLEOTIDE_KMER = 11
+NUCLEOTIDE_LETTERS = b"ACGTUN"
+# short sequences are hashed together until this many letters
+KMER_BLOCK = 1 << 16
+# near duplicates missed by the banding at exactly the threshold
+MIN_RECALL = 0.99
+EMPTY = np.iinfo(np.uint32).max
+
+KMER_BASE = np.uint64(0x9E3779B97F4A7C15)
+MIX_MULTIPLIER = np.uint64(0xFF51AFD7ED558CCD)
+
+###################### SKETCHES ##############################
+def kmer_size(sequence):
+    if len(sequence.translate(None, NUCLEOTIDE_LETTERS)) * 10 <= len(sequence):
+        return NUCLEOTIDE_KMER
+    return PROTEIN_KMER
+
+# 64-bit hashes of every k-mer of sequence (upper case bytes)
+def kmer_hashes(sequence, k):
+    letters = np.frombuffer(sequence, dtype=np.uint8).astype(np.uint64)
+    windows = sliding_window_view(letters, k)
+    hashes = np.zeros(len(windows), dtype=np.uint64)
+    for j in range(k):
+        hashes = hashes * KMER_BASE + windows[:, j]
+    hashes ^= hashes >> np.uint64(33)
+    hashes *= MIX_MULTIPLIER
+    hashes ^= hashes >> np.uint64(33)
+    return hashes
+
+# NUM_HASHES uint32 values per sequence, None for sequences shorter than
+# one k-mer
+def minhash_sketches(sequences):
+    sketches = [None] * len(sequences)
+    batches = {}
+    for i, sequence in enumerate(sequences):
+        if isinstance(sequence, str):
+            sequence = sequence.encode("utf-8", errors="replace")
+        sequence = sequence.upper()
+        k = kmer_size(sequence)
+        if len(sequence) < k:
+            continue
+
+        batch = batches.setdefault(k, ([], [], [0]))
+        batch[0].append(i)
+        batch[1].append(sequence)
+        batch[2].append(batch[2][-1] + len(sequence))
+        if batch[2][-1] >= KMER_BLOCK:
+            sketch_batch(sketches, k, *batches.pop(k))
+    for k, batch in batches.items():
+        sketch_batch(sketches, k, *batch)
+    return sketches
+
+# k-mers of the joined sequences that cross from one sequence into the next
+# are dropped; the rest are reduced to one sketch per sequence
+def sketch_batch(sketches, k, indexes, sequences, offsets):
+    hashes = kmer_hashes(b"".join(sequences), k)
+    offsets = np.array(offsets, dtype=np.int64)
+    kmer_counts = np.diff(offsets) - k + 1
+    firsts = np.cumsum(kmer_counts) - kmer_counts
+    owner = np.repeat(np.arange(len(indexes)), kmer_counts)
+    hashes = hashes[np.repeat(offsets[:-1] - firsts, kmer_counts) + np.arange(len(owner))]
+
+    bins = (hashes >> np.uint64(64 - BIN_BITS)).astype(np.int64)
+    values = ((hashes >> np.uint64(64 - BIN_BITS - 32)) & np.uint64(EMPTY)).astype(np.uint32)
+    minima = np.full(len(indexes) * NUM_HASHES, EMPTY, dtype=np.uint32)
+    np.minimum.at(minima, owner * NUM_HASHES + bins, values)
+    minima = minima.reshape(-1, NUM_HASHES)
+
+    empty = minima == EMPTY
+    while empty.any():
+        minima = np.where(empty, np.roll(minima, -1, axis=1), minima)
+        empty = minima == EMPTY
+    for i, sketch in zip(indexes, minima):
+        sketches[i] = sketch
+
+###################### LSH ##############################
+# (bands, rows) with as many rows per band as possible (fewest candidates)
+# while a pair at the threshold still shares a bucket with MIN_RECALL
+def lsh_bands(threshold):
+    best = (NUM_HASHES, 1)
+    for rows in range(1, NUM_HASHES + 1):
+        if NUM_HASHES % rows:
+            continue
+        bands = NUM_HASHES // rows
+        if 1 - (1 - threshold ** rows) ** bands >= MIN_RECALL:
+            best = (bands, rows)
+    return best
+
+# per band: bucket of every record, records sorted by bucket and where
+# every bucket starts in that order
+def band_buckets(sketches, bands, rows):
+    buckets = []
+    for band in range(bands):
+        keys = np.ascontiguousarray(sketches[:, band * rows:(band + 1) * rows])
+        _, bucket, sizes = np.unique(keys.view(np.dtype((np.void, keys.dtype.itemsize * rows))).ravel(),
+                                     return_inverse=True, return_counts=True)
+        members = np.argsort(bucket, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(sizes)))
+        buckets.append((bucket, members, starts, sizes))
+    return buckets
+
+###################### CLUSTERING ##############################
+# Greedy clustering: the longest unassigned record (first id on ties)
+# becomes a representative and takes every unassigned record of its buckets
+# whose estimated similarity reaches threshold. Every removed record is
+# therefore similar to its own representative, not just to a chain of them.
+# Returns (removed_id, kept_id, similarity) sorted by removed_id
+def near_duplicate_pairs(ids, lengths, sketches, threshold):
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) < 2:
+        return []
+    sketches = np.asarray(sketches, dtype=np.uint32)
+    bands, rows = lsh_bands(threshold)
+    buckets = band_buckets(sketches, bands, rows)
+
+    has_mate = np.zeros(len(ids), dtype=bool)
+    for bucket, _, _, sizes in buckets:
+        has_mate |= sizes[bucket] > 1
+
+    assigned = np.zeros(len(ids), dtype=bool)
+    pairs = []
+    for i in np.lexsort((ids, -np.asarray(lengths, dtype=np.int64))).tolist():
+        if assigned[i] or not has_mate[i]:
+            continue
+        assigned[i] = True
+        candidates = np.unique(np.concatenate([
+            members[starts[bucket[i]]:starts[bucket[i] + 1]] for bucket, members, starts, _ in buckets]))
+        candidates = candidates[~assigned[candidates]]
+        if not len(candidates):
+            continue
+        similarity = (sketches[candidates] == sketches[i]).mean(axis=1)
+        close = similarity >= threshold
+        assigned[candidates[close]] = True
+        pairs.extend(zip(ids[candidates[close]].tolist(), [int(ids[i])] * int(close.sum()),
+                         similarity[close].tolist()))
+    pairs.sort()
+    return pairs
@@ -0,0 +1,152 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+import struct
+import numpy as np
+
+# Packed sequences are stored as BLOBs:
+#   kind, length, exception runs, lowercase runs   (HEADER)
+#   exception runs: starts (uint32), lengths (uint32), characters (uint8)
+#   lowercase runs: starts (uint32), lengths (uint32)
+#   residues: 2 bits per base (KIND_NUCLEOTIDE) or 5 bits per residue
+#   (KIND_PROTEIN)
+# Sequences that would not shrink are stored as KIND_RAW and their bytes.
+# Letters outside the alphabet (N, ambiguity codes, ...) are packed as code 0
+# and restored from the exception runs, soft-masked (lowercase) stretches
+# from the lowercase runs. The same sequence always packs to the same bytes,
+# so packed values can be compared directly
+KIND_RAW = 0
+KIND_NUCLEOTIDE = 1
+KIND_PROTEIN = 2
+
+HEADER = struct.Struct("<BIII")
+RAW_HEADER = bytes([KIND_RAW])
+
+NUCLEOTIDES = b"ACGT"
+AMINO_ACIDS = b"ACDEFGHIKLMNPQRSTVWYBZXUO*-."
+
+# below this length the header costs more than packing saves
+MIN_PACKED_LENGTH = 32
+
+def make_code_table(alphabet):
+    table = bytearray([255]) * 256
+    for code, letter in enumerate(alphabet):
+        table[letter] = code
+    return bytes(table)
+
+NUCLEOTIDE_CODES = make_code_table(NUCLEOTIDES)
+AMINO_ACID_CODES = make_code_table(AMINO_ACIDS)
+
+# every packed nucleotide byte decodes to its four letters in one lookup
+NUCLEOTIDE_BYTES = np.frombuffer(NUCLEOTIDES, dtype=np.uint8)[
+    (np.arange(256)[:, None] >> np.array([6, 4, 2, 0])) & 3].astype(np.uint8)
+AMINO_ACID_BYTES = np.zeros(32, dtype=np.uint8)
+AMINO_ACID_BYTES[:len(AMINO_ACIDS)] = np.frombuffer(AMINO_ACIDS, dtype=np.uint8)
+
+###################### RUNS ##############################
+# (starts, lengths) of the stretches where mask is set and values do not change
+def find_runs(mask, values=None):
+    positions = np.flatnonzero(mask)
+    if not len(positions):
+        return positions.astype(np.uint32), positions.astype(np.uint32)
+    breaks = np.diff(positions) != 1
+    if values is not None:
+        picked = values[positions]
+        breaks |= picked[1:] != picked[:-1]
+    first = np.concatenate(([0], np.flatnonzero(breaks) + 1))
+    lengths = np.diff(np.append(first, len(positions)))
+    return positions[first].astype(np.uint32), lengths.astype(np.uint32)
+
+def run_positions(starts, lengths):
+    lengths = lengths.astype(np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(int(lengths.sum())) + np.repeat(starts.astype(np.int64) - offsets, lengths)
+
+###################### ENCODING ##############################
+def pack_nucleotides(codes):
+    padded = np.zeros((len(codes) + 3) // 4 * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    quads = padded.reshape(-1, 4)
+    return ((quads[:, 0] << 6) | (quads[:, 1] << 4) | (quads[:, 2] << 2) | quads[:, 3]).tobytes()
+
+def pack_protein(codes):
+    bits = np.unpackbits(codes.reshape(-1, 1), axis=1)[:, 3:]
+    return np.packbits(bits.reshape(-1)).tobytes()
+
+# bytes.upper/translate do the per-residue work in C; numpy is only used for
+# packing and for the runs that are actually there
+def encode_sequence(sequence):
+    if isinstance(sequence, str):
+        sequence = sequence.encode("utf-8")
+    length = len(sequence)
+    if length < MIN_PACKED_LENGTH:
+        return RAW_HEADER + sequence
+
+    upper = sequence.upper()
+    # nucleotides first, proteins only when too many letters fall outside ACGT
+    kind, alphabet, table, packed_size = KIND_NUCLEOTIDE, NUCLEOTIDES, NUCLEOTIDE_CODES, (length + 3) // 4
+    exception_count = len(upper.translate(None, alphabet))
+    if exception_count * 8 > length:
+        kind, alphabet, table, packed_size = KIND_PROTEIN, AMINO_ACIDS, AMINO_ACID_CODES, (length * 5 + 7) // 8
+        exception_count = len(upper.translate(None, alphabet))
+    if HEADER.size + packed_size + exception_count * 9 > length:
+        return RAW_HEADER + sequence
+
+    codes = np.frombuffer(upper.translate(table), dtype=np.uint8).copy()
+    exception_starts = exception_lengths = exception_chars = lower_starts = lower_lengths = b""
+    if exception_count:
+        exceptions = codes == 255
+        letters = np.frombuffer(upper, dtype=np.uint8)
+        starts, lengths = find_runs(exceptions, letters)
+        exception_starts, exception_lengths, exception_chars = starts.tobytes(), lengths.tobytes(), letters[starts].tobytes()
+        codes[exceptions] = 0
+    if upper != sequence:
+        starts, lengths = find_runs(np.frombuffer(upper, dtype=np.uint8) != np.frombuffer(sequence, dtype=np.uint8))
+        lower_starts, lower_lengths = starts.tobytes(), lengths.tobytes()
+
+    size = HEADER.size + packed_size + len(exception_starts) // 4 * 9 + len(lower_starts) // 4 * 8
+    if size > length:
+        return RAW_HEADER + sequence
+
+    residues = pack_nucleotides(codes) if kind == KIND_NUCLEOTIDE else pack_protein(codes)
+    return b"".join((
+        HEADER.pack(kind, length, len(exception_starts) // 4, len(lower_starts) // 4),
+        exception_starts, exception_lengths, exception_chars,
+        lower_starts, lower_lengths,
+        residues,
+    ))
+
+###################### DECODING ##############################
+def decode_sequence_bytes(blob):
+    if blob[0] == KIND_RAW:
+        return bytes(blob[1:])
+    kind, length, exception_count, lower_count = HEADER.unpack_from(blob)
+    pos = HEADER.size
+
+    data = np.frombuffer(blob, dtype=np.uint8)
+    exception_starts = np.frombuffer(blob, dtype=np.uint32, count=exception_count, offset=pos)
+    pos += exception_count * 4
+    exception_lengths = np.frombuffer(blob, dtype=np.uint32, count=exception_count, offset=pos)
+    pos += exception_count * 4
+    exception_chars = data[pos:pos + exception_count]
+    pos += exception_count
+    lower_starts = np.frombuffer(blob, dtype=np.uint32, count=lower_count, offset=pos)
+    pos += lower_count * 4
+    lower_lengths = np.frombuffer(blob, dtype=np.uint32, count=lower_count, offset=pos)
+    pos += lower_count * 4
+
+    if kind == KIND_NUCLEOTIDE:
+        out = NUCLEOTIDE_BYTES[data[pos:]].reshape(-1)[:length]
+    else:
+        bits = np.unpackbits(data[pos:])[:length * 5].reshape(-1, 5)
+        out = AMINO_ACID_BYTES[np.packbits(bits, axis=1)[:, 0] >> 3]
+
+    if exception_count:
+        out[run_positions(exception_starts, exception_lengths)] = np.repeat(exception_chars, exception_lengths)
+    if lower_count:
+        out[run_positions(lower_starts, lower_lengths)] += 32
+    return out.tobytes()
+
+def decode_sequence(blob):
+    return decode_sequence_bytes(blob).decode("utf-8", errors="replace")
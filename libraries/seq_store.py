@@ -0,0 +1,69 @@
+# This file is part of BLASTnBRUSH
+# Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski
+# Licensed under the GPL v3.0 License
+
+from fasta_reader import map_file, read_indexed
+from seq_codec import decode_sequence
+from header_metrics import HEADER_COLUMNS
+
+# select these after the header and pass them to SequenceStore.sequence
+SEQUENCE_COLUMNS = "sequence, source_id, seq_offset, seq_length, line_bases, line_width"
+# a whole stored record, used to copy rows between sequences.db, cleaned.db
+# and duplicates.db without reading sequences kept on disk
+RECORD_COLUMNS = "header, " + SEQUENCE_COLUMNS + ", seq_start, " + HEADER_COLUMNS
+
+###################### SOURCES ##############################
+def create_sources_table(c, drop=False):
+    if drop:
+        c.execute("DROP TABLE IF EXISTS sources")
+    c.execute("CREATE TABLE IF NOT EXISTS sources (source_id INTEGER PRIMARY KEY, path TEXT)")
+
+def copy_sources(src_conn, dst_c):
+    create_sources_table(dst_c, drop=True)
+    if has_table(src_conn, "sources"):
+        dst_c.executemany("INSERT INTO sources (source_id, path) VALUES (?, ?)",
+                          src_conn.execute("SELECT source_id, path FROM sources").fetchall())
+
+def has_table(conn, name, schema="main"):
+    return conn.execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+###################### READING SEQUENCES ##############################
+# Resolves rows that keep only an offset into their FASTA file and decodes
+# packed BLOBs. The files are mapped once and stay mapped until close();
+# they must not change between loading and reading
+class SequenceStore:
+    def __init__(self, conn):
+        self.paths = {}
+        if has_table(conn, "sources"):
+            self.paths = dict(conn.execute("SELECT source_id, path FROM sources"))
+        self.maps = {}
+
+    def sequence(self, sequence, source_id, seq_offset, seq_length, line_bases, line_width):
+        if isinstance(sequence, bytes):
+            return decode_sequence(sequence)
+        if sequence is not None:
+            return sequence
+        mm = self.maps.get(source_id)
+        if mm is None:
+            mm = self.maps[source_id] = map_file(self.paths[source_id])
+        return read_indexed(mm, seq_offset, seq_length, line_bases, line_width).decode("utf-8", errors="replace")
+
+    # Comparable stand-in for the sequence. All rows of one load share a
+    # storage mode and packing is deterministic, so stored values are
+    # compared as they are and only rows kept on disk are read
+    def key(self, sequence, *location):
+        if sequence is not None:
+            return sequence
+        return self.sequence(sequence, *location)
+
+    def close(self):
+        for mm in self.maps.values():
+            if mm is not None:
+                mm.close()
+        self.maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
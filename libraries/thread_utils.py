@@ -3,28 +3,78 @@
 # Licensed under the GPL v3.0 License
 
 from PyQt6.QtCore import QThread, pyqtSignal
+from fasta_utils import create_sequences_table
+from seq_store import SequenceStore, RECORD_COLUMNS, SEQUENCE_COLUMNS, copy_sources, has_table
+from dedup_utils import (SeenKeys, KeySpill, record_material, material_fetcher, key_digest, sql_key_columns,
+                         sql_keys_possible, sql_keys_short, seen_keys_fit, bucket_count, hash_id_range, duplicates_of_partition,
+                         add_exact_duplicates, create_key_index, add_key_rows, save_key_index, append_records,
+                         SPILL_BYTES_PER_KEY, SPILL_DTYPE, DUPLICATES_BUFFER_SIZE, EXACT, CONTAINED, NEAR)
+from near_duplicates import minhash_sketches, near_duplicate_pairs
+from containment import ContainmentIndex
+from duplicate_groups import create_duplicates_table
+from fasta_loader import DEFAULT_WORKERS
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from header_metrics import create_metric_indexes
+from ingest_cache import load_fasta_files_cached
+from motif_index import build_motif_index, drop_motif_index, motif_index_kmers
+from header_index import create_header_index, drop_header_index
 import sqlite3
+import tempfile
+import time
+import gc
+import os
+
+# The SQL engine was faster at every size measured with
+# benchmarks/bench_dedup.py (1.1-1.7x from 1k to 230k records) as long as
+# the sequences are short (see dedup_utils.sql_keys_short). Small sets stay
+# in Python, which finishes instantly and reports progress per record
+SQL_DEDUP_MIN_RECORDS = 1000
+# memory for the seen keys before the spill engine takes over
+DEDUP_MEMORY_MB = 1024
+# Starting the processes and moving the digests between them costs more
+# than it saves below this many records
+PARALLEL_DEDUP_MIN_RECORDS = 100000
+# fewest records hashed by one task of the parallel engine
+PARALLEL_RANGE_MIN = 10000
+# records read at once when looking for near duplicates or contained records
+NEAR_BATCH_SIZE = 10000
 
 class DeleteDuplicatesWorker(QThread):
     progress_text = pyqtSignal(str)
     progress_percent = pyqtSignal(int)
     finished = pyqtSignal(list, int, int)
 
-    def __init__(self, check_name, check_sequence, db_path="sequences.db"):
+    # engine is "python", "sql", "spill", "parallel" or "auto"; all write the
+    # same cleaned.db and duplicates.db, the first occurrence of a record is
+    # the one kept. cleaned.db keeps the ids of sequences.db, duplicates.db
+    # only links removed ids to kept ones (see duplicate_groups). memory_mb
+    # bounds the keys held in memory, workers is the number of processes of
+    # the parallel engine. contained=True also removes records that are part
+    # of a longer one. With near_threshold set the records left are also
+    # clustered by estimated k-mer Jaccard similarity and only one
+    # representative per cluster is kept (see near_duplicates).
+    # incremental=True keeps a key index in duplicates.db; when files were
+    # only appended to the session cleaned last time, just their records are
+    # checked against it and merged into cleaned.db. motif_index=True builds
+    # the k-mer index of cleaned.db used by motif searches (see motif_index)
+    def __init__(self, check_name, check_sequence, db_path="sequences.db", verify=False, engine="auto",
+                 memory_mb=DEDUP_MEMORY_MB, workers=DEFAULT_WORKERS, near_threshold=None, contained=False,
+                 incremental=False, motif_index=False):
         super().__init__()
         self.check_name = check_name
         self.check_sequence = check_sequence
         self.db_path = db_path
+        self.verify = verify
+        self.engine = engine
+        self.memory_mb = memory_mb
+        self.workers = workers
+        self.near_threshold = near_threshold
+        self.contained = contained
+        self.incremental = incremental
+        self.motif_index = motif_index
 
     def run(self):
-        import time
-        import sqlite3
-        import gc
-
-        seen = set()
-        buffer_duplicates = []
-        buffer_size = 1000
-
         start_time = time.time()
         self.progress_text.emit("Connecting to database...")
 
@@ -36,69 +86,467 @@ class DeleteDuplicatesWorker(QThread):
             total = c.fetchone()[0]
             self.progress_text.emit(f"Filtering {total} sequences...")
 
-            rows = c.execute("SELECT header, sequence FROM sequences")
+            kept = self.append_records(conn) if self.incremental else None
+            if kept is None:
+                kept = self.clean_all(conn, total)
+            conn.close()
+            self.index_headers()
+            if self.motif_index:
+                self.index_motifs()
 
-            clean_conn = sqlite3.connect("cleaned.db")
-            clean_c = clean_conn.cursor()
-            clean_c.execute("DROP TABLE IF EXISTS sequences")
-            clean_c.execute("CREATE TABLE sequences (id INTEGER PRIMARY KEY AUTOINCREMENT, header TEXT, sequence TEXT)")
-
-            dup_conn = sqlite3.connect("duplicates.db")
-            dup_c = dup_conn.cursor()
-            dup_c.execute("DROP TABLE IF EXISTS sequences")
-            dup_c.execute("CREATE TABLE sequences (header TEXT, sequence TEXT)")
-
-            for i, (header, sequence) in enumerate(rows):
-                cleaned_header = header
-                if self.check_name:
-                    if "[Length" in header:
-                        cleaned_header = header.split("[Length")[0].strip()
-
-                if self.check_name and self.check_sequence:
-                    key = cleaned_header + sequence
-                elif self.check_name:
-                    key = cleaned_header
-                elif self.check_sequence:
-                    key = sequence
-                else:
-                    key = cleaned_header + sequence
-
-                if key not in seen:
-                    seen.add(key)
-                    clean_c.execute("INSERT INTO sequences (header, sequence) VALUES (?, ?)", (header, sequence))
-                else:
-                    buffer_duplicates.append((header, sequence))
-
-                    if len(buffer_duplicates) >= buffer_size:
-                        dup_c.executemany(
-                            "INSERT INTO sequences (header, sequence) VALUES (?, ?)",
-                            buffer_duplicates
-                        )
-                        buffer_duplicates.clear()
+            gc.collect()
+
+            elapsed = time.time() - start_time
+            print(f"Cleaning finished in {elapsed:.2f} seconds")
+
+            self.finished.emit([], total, kept)
+
+        except Exception as e:
+            print("Error in run():", e)
+            self.progress_text.emit(f"Error: {e}")
+            self.finished.emit([], 0, 0)
+
+    # cleaned.db and duplicates.db from scratch
+    def clean_all(self, conn, total):
+        out_conn = sqlite3.connect("cleaned.db")
+        out_c = out_conn.cursor()
+        create_sequences_table(out_c, drop=True)
+        drop_motif_index(out_c)
+        drop_header_index(out_c)
+        copy_sources(conn, out_c)
+        out_conn.commit()
+        out_conn.close()
+
+        # new records may contain older ones or be close to them, so these
+        # stages always clean the whole session. The engines that hash the
+        # records write the key index on the way
+        engine = self.choose_engine(conn, total)
+        save_keys = self.incremental and not self.contained and self.near_threshold is None
+        self.index_keys = save_keys and engine != "sql"
+        self.collisions = 0
+
+        # duplicates.db of older versions held copies of the records
+        if os.path.exists("duplicates.db"):
+            os.remove("duplicates.db")
+        out_conn = sqlite3.connect("duplicates.db")
+        create_duplicates_table(out_conn.cursor())
+        if self.index_keys:
+            create_key_index(out_conn.cursor())
+        out_conn.commit()
+        out_conn.close()
+
+        if engine == "sql":
+            kept = self.remove_duplicates_sql()
+        elif engine == "spill":
+            kept = self.remove_duplicates_spill(conn, total)
+        elif engine == "parallel":
+            kept = self.remove_duplicates_parallel(conn, total)
+        else:
+            kept = self.remove_duplicates_python(conn, total)
+
+        if self.contained:
+            kept -= self.remove_contained(kept)
+        if self.near_threshold is not None:
+            kept -= self.remove_near_duplicates(kept)
+        if save_keys:
+            save_key_index(conn, self.check_name, self.check_sequence, self.verify, self.collisions)
+        return kept
+
+    # "parallel" for large sets when there is more than one worker, "sql" when
+    # the keys can be compared in SQLite and are short, otherwise "spill" when
+    # the seen keys would not fit into memory_mb. The SQL engine compares
+    # stored values exactly, so it is also used when verification is asked for
+    def choose_engine(self, conn, total):
+        if self.engine in ("python", "spill", "parallel"):
+            return self.engine
+        if (self.engine == "auto" and self.workers > 1 and total >= PARALLEL_DEDUP_MIN_RECORDS
+                and total * SPILL_BYTES_PER_KEY <= self.memory_mb * 1024 * 1024):
+            return "parallel"
+        if sql_keys_possible(conn, self.check_name, self.check_sequence):
+            if self.engine == "sql" or (total >= SQL_DEDUP_MIN_RECORDS
+                                        and sql_keys_short(conn, self.check_name, self.check_sequence)):
+                return "sql"
+        elif self.engine == "sql":
+            print("Sequences are kept in the FASTA files, removing duplicates in Python")
+        return "python" if seen_keys_fit(total, self.memory_mb) else "spill"
+
+    ###################### PYTHON ENGINE ##############################
+    def record_material(self, store, header, location):
+        return record_material(store, header, location, self.check_name, self.check_sequence)
+
+    def material_fetcher(self, conn, store):
+        return material_fetcher(conn, store, self.check_name, self.check_sequence)
+
+    def remove_duplicates_python(self, conn, total):
+        store = SequenceStore(conn)
+        seen = SeenKeys(self.verify, self.material_fetcher(conn, store))
+        clean_conn = self.connect_outputs()
+        clean_c = clean_conn.cursor()
+        try:
+            removed_ids, kept_ids = [], []
+            rows = conn.execute(f"SELECT id, header, {SEQUENCE_COLUMNS} FROM sequences ORDER BY id")
+            for i, (record_id, header, *location) in enumerate(rows):
+                first_id = seen.add(self.record_material(store, header, location), record_id)
+                if first_id is not None:
+                    removed_ids.append(record_id)
+                    kept_ids.append(first_id)
+                    if len(removed_ids) >= DUPLICATES_BUFFER_SIZE:
+                        add_exact_duplicates(clean_c, removed_ids, kept_ids)
+                        removed_ids, kept_ids = [], []
 
                 if i % max(1, total // 100) == 0:
-                    self.progress_percent.emit(int((i + 1) / total * 100))
+                    self.progress_percent.emit(int((i + 1) / total * 60))
+            add_exact_duplicates(clean_c, removed_ids, kept_ids)
+            self.collisions = seen.collisions
+            if self.index_keys and not seen.collisions:
+                clean_c.executemany("INSERT INTO dup.dedup_keys (digest, id) VALUES (?, ?)", sorted(seen.digests.items()))
+
+            self.copy_kept_records(clean_c, 60)
+            clean_conn.commit()
+            self.progress_percent.emit(100)
+        finally:
+            store.close()
+            clean_conn.close()
+        if seen.collisions:
+            print(f"{seen.collisions} key digest collisions resolved by verification")
+        return len(seen)
+
+    ###################### SPILL ENGINE ##############################
+    # For key sets larger than memory_mb: the digests are spilled into
+    # bucket files next to cleaned.db (see dedup_utils.KeySpill), the
+    # duplicates of every bucket go to the duplicates table and the kept
+    # records are copied in a last pass
+    def remove_duplicates_spill(self, conn, total):
+        store = SequenceStore(conn)
+        buckets = bucket_count(total, self.memory_mb)
+        removed = 0
+
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath("cleaned.db")), prefix="dedup_") as directory:
+            spill = KeySpill(directory, buckets)
+            try:
+                self.progress_text.emit(f"Hashing {total} sequences into {buckets} buckets...")
+                rows = conn.execute(f"SELECT id, header, {SEQUENCE_COLUMNS} FROM sequences ORDER BY id")
+                for i, (record_id, header, *location) in enumerate(rows):
+                    spill.add(key_digest(self.record_material(store, header, location)), record_id)
+                    if i % max(1, total // 100) == 0:
+                        self.progress_percent.emit(int((i + 1) / total * 40))
+            finally:
+                spill.close()
+
+            self.progress_text.emit("Finding duplicates...")
+            clean_conn = self.connect_outputs()
+            clean_c = clean_conn.cursor()
+            try:
+                for removed_ids, kept_ids in spill.duplicates(
+                        self.material_fetcher(conn, store) if self.verify else None,
+                        lambda fraction: self.progress_percent.emit(40 + int(fraction * 20)),
+                        (lambda entries: add_key_rows(clean_c, entries)) if self.index_keys else None):
+                    order = np.argsort(removed_ids)
+                    add_exact_duplicates(clean_c, removed_ids[order].tolist(), kept_ids[order].tolist())
+                    removed += len(removed_ids)
+
+                self.copy_kept_records(clean_c, 60)
+                clean_conn.commit()
+                self.progress_percent.emit(100)
+            finally:
+                store.close()
+                clean_conn.close()
+
+        self.collisions = spill.collisions
+        if spill.collisions:
+            print(f"{spill.collisions} key digest collisions resolved by verification")
+        return total - removed
 
-            if buffer_duplicates:
-                dup_c.executemany(
-                    "INSERT INTO sequences (header, sequence) VALUES (?, ?)",
-                    buffer_duplicates
-                )
+    ###################### SQL ENGINE ##############################
+    # The keys go into a temporary table with a UNIQUE index in rowid order,
+    # INSERT OR IGNORE keeps the first record of every key. Every record is
+    # then looked up in that index to link it to its first record, and the
+    # records are copied with INSERT ... SELECT without passing through Python
+    def remove_duplicates_sql(self):
+        keys = sql_key_columns(self.check_name, self.check_sequence)
+        names = ", ".join(f"k{i}" for i in range(len(keys)))
 
+        clean_conn = self.connect_outputs()
+        clean_c = clean_conn.cursor()
+        try:
+            self.progress_text.emit("Finding duplicates...")
+            clean_c.execute(f"CREATE TEMP TABLE dedup_keys (id INTEGER, {names}, UNIQUE ({names}))")
+            clean_c.execute(f"""
+                INSERT OR IGNORE INTO dedup_keys (id, {names})
+                SELECT id, {", ".join(keys)} FROM src.sequences ORDER BY id
+            """)
+            kept = clean_c.execute("SELECT COUNT(*) FROM dedup_keys").fetchone()[0]
+            self.progress_percent.emit(40)
+
+            # CROSS JOIN keeps src.sequences as the outer loop
+            matches = " AND ".join(f"k.k{i} = {key}" for i, key in enumerate(keys))
+            clean_c.execute(f"""
+                INSERT INTO dup.duplicates (removed_id, kept_id, reason)
+                SELECT s.id, k.id, '{EXACT}' FROM src.sequences s CROSS JOIN dedup_keys k ON {matches}
+                WHERE k.id <> s.id ORDER BY s.id
+            """)
+            clean_c.execute("DROP TABLE dedup_keys")
+            self.progress_percent.emit(50)
+
+            self.copy_kept_records(clean_c, 50)
             clean_conn.commit()
-            dup_conn.commit()
+            self.progress_percent.emit(100)
+        finally:
             clean_conn.close()
-            dup_conn.close()
-            conn.close()
+        return kept
 
-            gc.collect()
+    # cleaned.db with sequences.db attached as src and duplicates.db as dup
+    def connect_outputs(self):
+        clean_conn = sqlite3.connect("cleaned.db")
+        clean_conn.execute("ATTACH DATABASE ? AS src", (self.db_path,))
+        clean_conn.execute("ATTACH DATABASE ? AS dup", ("duplicates.db",))
+        return clean_conn
 
-            elapsed = time.time() - start_time
-            print(f"Cleaning finished in {elapsed:.2f} seconds")
+    # records missing from the duplicates table go to cleaned.db in id order,
+    # under their ids
+    def copy_kept_records(self, clean_c, first_percent):
+        self.progress_text.emit("Writing cleaned records...")
+        clean_c.execute(f"""
+            INSERT INTO main.sequences (id, {RECORD_COLUMNS})
+            SELECT id, {RECORD_COLUMNS} FROM src.sequences
+            WHERE id NOT IN (SELECT removed_id FROM dup.duplicates) ORDER BY id
+        """)
+        self.progress_percent.emit(first_percent + (100 - first_percent) * 9 // 10)
+        create_metric_indexes(clean_c)
+
+    ###################### PARALLEL ENGINE ##############################
+    # Hashing is spread over a process pool in id ranges, the digests are
+    # partitioned by value and every partition is searched for duplicates in
+    # its own process (see dedup_utils). The duplicates are written in id
+    # order and the records copied as in the SQL engine
+    def remove_duplicates_parallel(self, conn, total):
+        first_id, last_id = conn.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), -1) FROM sequences").fetchone()
+        db_path = os.path.abspath(self.db_path)
+        partitions = self.workers
+        range_size = max(PARALLEL_RANGE_MIN, -(-(last_id - first_id + 1) // (self.workers * 4)))
+        ranges = [(start, min(start + range_size - 1, last_id)) for start in range(first_id, last_id + 1, range_size)]
+
+        parts = [[] for _ in range(partitions)]
+        removed_ids, kept_ids, keys = [], [], []
+        collisions = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            self.progress_text.emit(f"Hashing {total} sequences in {self.workers} processes...")
+            futures = [pool.submit(hash_id_range, db_path, start, end, self.check_name, self.check_sequence, partitions)
+                       for start, end in ranges]
+            for done, future in enumerate(as_completed(futures), 1):
+                for partition, data in enumerate(future.result()):
+                    parts[partition].append(data)
+                self.progress_percent.emit(done * 50 // len(futures))
+
+            self.progress_text.emit("Finding duplicates...")
+            futures = [pool.submit(duplicates_of_partition, partition_parts, db_path,
+                                   self.check_name, self.check_sequence, self.verify, self.index_keys)
+                       for partition_parts in parts]
+            parts = None
+            for done, future in enumerate(as_completed(futures), 1):
+                removed_data, kept_data, partition_collisions, key_data = future.result()
+                removed_ids.append(removed_data)
+                kept_ids.append(kept_data)
+                if key_data:
+                    keys.append(key_data)
+                collisions += partition_collisions
+                self.progress_percent.emit(50 + done * 20 // len(futures))
 
-            self.finished.emit([], total, len(seen))
+        self.collisions = collisions
+        if collisions:
+            print(f"{collisions} key digest collisions resolved by verification")
+        removed_ids = np.frombuffer(b"".join(removed_ids), dtype=np.int64)
+        kept_ids = np.frombuffer(b"".join(kept_ids), dtype=np.int64)
+        order = np.argsort(removed_ids)
+
+        clean_conn = self.connect_outputs()
+        clean_c = clean_conn.cursor()
+        try:
+            add_exact_duplicates(clean_c, removed_ids[order].tolist(), kept_ids[order].tolist())
+            for key_data in keys:
+                add_key_rows(clean_c, np.frombuffer(key_data, dtype=SPILL_DTYPE))
+            self.copy_kept_records(clean_c, 70)
+            clean_conn.commit()
+            self.progress_percent.emit(100)
+        finally:
+            clean_conn.close()
+        return total - len(removed_ids)
+
+    ###################### INCREMENTAL ##############################
+    # records appended to the session cleaned last time are merged into
+    # cleaned.db (see dedup_utils.append_records); None when everything has
+    # to be cleaned again
+    def append_records(self, conn):
+        if self.contained or self.near_threshold is not None:
+            return None
+        if not (os.path.exists("cleaned.db") and os.path.exists("duplicates.db")):
+            return None
+        clean_conn = self.connect_outputs()
+        try:
+            return append_records(conn, clean_conn, self.check_name, self.check_sequence, self.verify,
+                                  self.progress_text.emit,
+                                  lambda fraction: self.progress_percent.emit(int(fraction * 100)))
+        finally:
+            clean_conn.close()
+
+    ###################### INDEXES ##############################
+    # the header index is kept up to date by its triggers once built. SQLite
+    # builds without FTS5 or its trigram tokenizer (before 3.34) go without
+    # it, name filters then read every header
+    def index_headers(self):
+        clean_conn = sqlite3.connect("cleaned.db")
+        try:
+            if not has_table(clean_conn, "headers_fts"):
+                self.progress_text.emit("Indexing headers...")
+                create_header_index(clean_conn.cursor())
+                clean_conn.commit()
+        except sqlite3.OperationalError as e:
+            print("No header index:", e)
+            clean_conn.rollback()
+        finally:
+            clean_conn.close()
+
+    # kept from the last run when cleaned.db did not change since
+    def index_motifs(self):
+        clean_conn = sqlite3.connect("cleaned.db")
+        try:
+            if motif_index_kmers(clean_conn) is None:
+                self.progress_text.emit("Indexing motifs...")
+                build_motif_index(clean_conn, lambda fraction: self.progress_percent.emit(int(fraction * 100)))
+        finally:
+            clean_conn.close()
+
+    ###################### NEAR DUPLICATES ##############################
+    # Runs on cleaned.db after the exact duplicates are gone. The records of
+    # a cluster other than its representative are removed and linked to it
+    # with their estimated similarity
+    def remove_near_duplicates(self, total):
+        clean_conn = self.connect_outputs()
+        clean_c = clean_conn.cursor()
+        store = SequenceStore(clean_conn)
+        try:
+            self.progress_text.emit(f"Sketching {total} sequences...")
+            ids, lengths, sketches = [], [], []
+            rows = clean_c.execute(f"SELECT id, {SEQUENCE_COLUMNS} FROM main.sequences ORDER BY id")
+            done = 0
+            while True:
+                batch = rows.fetchmany(NEAR_BATCH_SIZE)
+                if not batch:
+                    break
+                for (record_id, *location), sketch in zip(batch, minhash_sketches([store.sequence(*row[1:]) for row in batch])):
+                    if sketch is not None:
+                        ids.append(record_id)
+                        lengths.append(location[3])
+                        sketches.append(sketch)
+                done += len(batch)
+                self.progress_percent.emit(done * 80 // max(total, 1))
+
+            self.progress_text.emit("Clustering near duplicates...")
+            pairs = near_duplicate_pairs(ids, lengths, sketches, self.near_threshold)
+            ids = lengths = sketches = None
+            self.progress_percent.emit(90)
+
+            self.progress_text.emit(f"Removing {len(pairs)} near duplicates...")
+            self.remove_from_cleaned(clean_c, [(removed_id, kept_id, NEAR, similarity, None)
+                                               for removed_id, kept_id, similarity in pairs])
+            clean_conn.commit()
+            self.progress_percent.emit(100)
+        finally:
+            store.close()
+            clean_conn.close()
+        print(f"Removed {len(pairs)} near duplicates (Jaccard >= {self.near_threshold})")
+        return len(pairs)
+
+    # rows are (removed_id, kept_id, reason, similarity, offset) of the
+    # duplicates table, their records are deleted from cleaned.db
+    def remove_from_cleaned(self, clean_c, rows):
+        clean_c.executemany("INSERT INTO dup.duplicates (removed_id, kept_id, reason, similarity, offset) VALUES (?, ?, ?, ?, ?)",
+                            rows)
+        clean_c.executemany("DELETE FROM main.sequences WHERE id = ?", ((row[0],) for row in rows))
+
+    ###################### CONTAINED RECORDS ##############################
+    # Runs on cleaned.db after the exact duplicates are gone. Records that are
+    # exact substrings of a longer one are removed and linked to the
+    # container with their offset in it (see containment)
+    def remove_contained(self, total):
+        clean_conn = self.connect_outputs()
+        clean_c = clean_conn.cursor()
+        store = SequenceStore(clean_conn)
+
+        def fetch(record_id):
+            row = clean_conn.execute(f"SELECT {SEQUENCE_COLUMNS} FROM main.sequences WHERE id = ?", (record_id,)).fetchone()
+            return store.sequence(*row).encode("utf-8")
+
+        try:
+            self.progress_text.emit(f"Indexing {total} sequences...")
+            index = ContainmentIndex()
+            rows = clean_c.execute(f"SELECT id, {SEQUENCE_COLUMNS} FROM main.sequences ORDER BY id")
+            done = 0
+            while True:
+                batch = rows.fetchmany(NEAR_BATCH_SIZE)
+                if not batch:
+                    break
+                index.add([row[0] for row in batch], [store.sequence(*row[1:]).encode("utf-8") for row in batch])
+                done += len(batch)
+                self.progress_percent.emit(done * 60 // max(total, 1))
+
+            self.progress_text.emit("Finding contained sequences...")
+            links = index.contained(fetch, lambda fraction: self.progress_percent.emit(60 + int(fraction * 30)))
+            index = None
+
+            self.progress_text.emit(f"Removing {len(links)} contained sequences...")
+            self.remove_from_cleaned(clean_c, [(removed_id, kept_id, CONTAINED, None, offset)
+                                               for removed_id, kept_id, offset in links])
+            clean_conn.commit()
+            self.progress_percent.emit(100)
+        finally:
+            store.close()
+            clean_conn.close()
+        print(f"Removed {len(links)} sequences contained in longer ones")
+        return len(links)
+
+class LoadFastaWorker(QThread):
+    progress_text = pyqtSignal(str)
+    progress_percent = pyqtSignal(int)
+    finished = pyqtSignal(list, float, bool)  # counts, records/s, completed
+    failed = pyqtSignal(str)
+
+    def __init__(self, file_paths, workers, index=False, packed=False, db_path="sequences.db"):
+        super().__init__()
+        self.file_paths = file_paths
+        self.workers = workers
+        self.index = index
+        self.packed = packed
+        self.db_path = db_path
+        self.cancelled = False
+
+    # takes effect at the next block of the file being read, the load is
+    # then rolled back
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            sizes = [os.path.getsize(path) for path in self.file_paths]
+            total_size = max(sum(sizes), 1)
+            done = [0] * len(sizes)
+            start_time = time.time()
+
+            def on_progress(file_index, fraction, records):
+                done[file_index] = fraction * sizes[file_index]
+                elapsed = max(time.time() - start_time, 1e-9)
+                self.progress_percent.emit(min(99, int(sum(done) / total_size * 100)))
+                self.progress_text.emit(
+                    f"File {file_index + 1}/{len(sizes)}: {os.path.basename(self.file_paths[file_index])}\n"
+                    f"{sum(done) / 1e6:.0f} / {total_size / 1e6:.0f} MB, {records / elapsed:.0f} records/s")
+                return not self.cancelled
+
+            self.progress_text.emit(f"Loading {len(sizes)} files...")
+            counts, rate, completed = load_fasta_files_cached(
+                self.file_paths, db_path=self.db_path, workers=self.workers,
+                progress_callback=on_progress, index=self.index, packed=self.packed)
+            self.finished.emit(counts, rate, completed)
 
         except Exception as e:
-            print("Error in run():", e)
-            self.progress_text.emit(f"Error: {e}")
-            self.finished.emit([], 0, 0)
\ No newline at end of file
+            print("Error in LoadFastaWorker:", e)
+            self.failed.emit(str(e))
@@ -2,12 +2,14 @@
 # Copyright (c) 2025 Aleksandra Liszka, Aleksandra Marcisz, Artur Stołowski 
 # Licensed under the GPL v3.0 License
 import sys
+import multiprocessing
 sys.path.append('./libraries') 
 sys.path.append('./resources')
 from PyQt6.QtWidgets import QApplication
 from gui import MainWindow
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = MainWindow()
     window.showMaximized()